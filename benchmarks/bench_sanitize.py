@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for modules/sanitizer.py: the single-pass sanitizer against
+the previous implementation (a findall + sub per pattern, compiled at call
+time), on synthetic drafts of increasing size. Both must produce the same text.
+
+    python benchmarks/bench_sanitize.py
+    python benchmarks/bench_sanitize.py --sizes 100000,5000000 --repeat 5
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.sanitizer import DEFAULT_REPLACEMENTS, Sanitizer
+
+_WORDS = ("electric vehicle battery charging market share sales growth policy subsidy range "
+          "adoption infrastructure grid lithium cost supply chain demand forecast region").split()
+
+def legacy_sanitize(text, patterns):
+    """The per-pattern loop sanitize_content used before (without the logging)."""
+    sanitized = text
+    replacements_made = []
+    for pattern, replacement in patterns:
+        matches = re.findall(pattern, sanitized, flags=re.IGNORECASE)
+        if matches:
+            replacements_made.extend(matches)
+            sanitized = re.sub(pattern, replacement, sanitized, flags=re.IGNORECASE)
+    return sanitized
+
+def make_draft(chars, flagged_ratio, seed=0):
+    """Markdown-ish filler with a share of flagged words in mixed case."""
+    rng = random.Random(seed)
+    flagged = list(DEFAULT_REPLACEMENTS)
+    words, size = [], 0
+    while size < chars:
+        if rng.random() < flagged_ratio:
+            word = rng.choice(flagged)
+            word = word.capitalize() if rng.random() < 0.3 else word
+        else:
+            word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+        if len(words) % 80 == 0:
+            words.append("\n\n##")
+    return " ".join(words)
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sanitizer micro-benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="draft sizes in characters")
+    parser.add_argument("--flagged", type=float, default=0.002, help="share of words that need replacing")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    sanitizer = Sanitizer(DEFAULT_REPLACEMENTS)
+    patterns = [(rf"\b{word}\b", replacement) for word, replacement in DEFAULT_REPLACEMENTS.items()]
+
+    print(f"{'chars':>10} {'legacy':>10} {'single-pass':>12} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        draft = make_draft(size, args.flagged)
+        expected = legacy_sanitize(draft, patterns)
+        actual, _ = sanitizer.sanitize(draft)
+        if actual != expected:
+            print(f"❌ Outputs differ for a {size}-char draft")
+            return 1
+        legacy = _time(lambda: legacy_sanitize(draft, patterns), args.repeat)
+        single = _time(lambda: sanitizer.sanitize(draft), args.repeat)
+        print(f"{size:>10} {legacy * 1000:>8.2f}ms {single * 1000:>10.2f}ms {legacy / single:>7.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
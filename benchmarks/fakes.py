@@ -0,0 +1,119 @@
+"""
+Deterministic local stand-ins for the Azure models and the web search, used by
+the offline benchmarks. Latencies and output sizes are drawn from configurable
+distributions with an RNG seeded by the request itself, so a given prompt gets
+the same latency and text in every run, whatever the scheduling order.
+"""
+import math
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from modules.cache import hash_key
+
+_WORDS = ("electric vehicle battery charging market share sales growth policy subsidy range "
+          "adoption infrastructure grid lithium cost supply chain demand forecast region "
+          "manufacturer platform segment registrations incentive emissions").split()
+
+@dataclass
+class Distribution:
+    """A non-negative random quantity: "fixed", "uniform" (mean ± spread) or "lognormal" (mean, sigma=spread)."""
+    mean: float
+    spread: float = 0.0
+    kind: str = "lognormal"
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.kind == "fixed" or self.spread <= 0:
+            return self.mean
+        if self.kind == "uniform":
+            return max(0.0, rng.uniform(self.mean - self.spread, self.mean + self.spread))
+        # lognormal with the requested mean
+        mu = math.log(self.mean) - self.spread ** 2 / 2
+        return rng.lognormvariate(mu, self.spread)
+
+    @classmethod
+    def parse(cls, spec: str, kind: str = "lognormal"):
+        """"0.5" or "0.5:0.3" (mean:spread), optionally prefixed by "fixed:"/"uniform:"/"lognormal:"."""
+        parts = spec.split(":")
+        if parts[0] in ("fixed", "uniform", "lognormal"):
+            kind = parts.pop(0)
+        mean = float(parts[0])
+        spread = float(parts[1]) if len(parts) > 1 else 0.0
+        return cls(mean, spread, kind)
+
+def _rng(seed, *parts):
+    return random.Random(int(hash_key(seed, *parts)[:16], 16))
+
+def _text(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(max(1, int(words))))
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that sleeps for a sampled latency and returns filler text of a
+    sampled length, with token usage so cost instrumentation has data.
+    Outline requests (the planner prompt) get `chapters` numbered lines.
+    """
+
+    model_type: str = "gpt-5-mini"
+    latency: Distribution = Distribution(0.05, 0.5)
+    words: Distribution = Distribution(400, 0.3)
+    chapters: int = 10
+    seed: str = "bench"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model_type, "seed": self.seed}
+
+    def _plan(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        rng = _rng(self.seed, self.model_type, prompt)
+        latency = self.latency.sample(rng)
+        if "outline" in prompt.lower() and "Return ONLY the list of chapters" in prompt:
+            content = "\n".join(f"{i + 1}. Chapter {i + 1}: {_text(rng, 3)}" for i in range(self.chapters))
+        else:
+            content = _text(rng, self.words.sample(rng))
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=content, usage_metadata=usage, response_metadata={"model_name": self.model_type})
+        return latency, ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, result = self._plan(messages)
+        time.sleep(latency)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, result = self._plan(messages)
+        await asyncio.sleep(latency)
+        return result
+
+class FakeSearch:
+    """Drop-in for the DDGS client in modules.tools (only .text() is used)."""
+
+    def __init__(self, latency: Distribution = None, words: Distribution = None, seed: str = "bench"):
+        self.latency = latency or Distribution(0.2, 0.5)
+        self.words = words or Distribution(60, 0.3)
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def text(self, query, max_results=5):
+        with self._lock:
+            self.calls += 1
+        rng = _rng(self.seed, "search", query, max_results)
+        time.sleep(self.latency.sample(rng))
+        # No hrefs, so research_tool has nothing to scrape (no network)
+        return [{"title": _text(rng, 6), "body": _text(rng, self.words.sample(rng)), "href": ""}
+                for _ in range(max_results)]
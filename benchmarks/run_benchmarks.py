@@ -0,0 +1,208 @@
+"""
+Offline benchmarks for the report pipeline (workflow.py + modules/agents.py).
+
+The Azure models and the web search are replaced by deterministic stand-ins
+(benchmarks/fakes.py), so runs need no keys or network and are comparable
+across commits. Each scenario runs a full report and records end-to-end time,
+per-node throughput, peak Python memory and call counts.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --chapters 5,20 --concurrency 1,4,16 --output new.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+# Everything that could touch the network or a shared cache is switched off
+# before the app modules are imported (they read these at import time)
+os.environ["EV_CACHE_DIR"] = os.getenv("BENCH_CACHE_DIR") or tempfile.mkdtemp(prefix="ev-bench-")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["SEARCH_CACHE_ENABLED"] = "0"
+os.environ["CHAPTER_STORE_ENABLED"] = "0"
+os.environ["RESEARCH_SCRAPE_PAGES"] = "0"
+os.environ.setdefault("AZURE_OPENAI_KEY", "offline-benchmark")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://offline-benchmark.invalid/")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import Distribution, FakeChatModel, FakeSearch
+from modules import tools
+from modules.llm_factory import set_llm_factory
+from modules.instrumentation import RunMetrics
+from workflow import stream_report
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "latest.json")
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the report pipeline")
+    parser.add_argument("--chapters", type=_ints, default=[3, 10, 20], help="outline sizes, e.g. 3,10,20")
+    parser.add_argument("--concurrency", type=_ints, default=[1, 4, 8], help="max_concurrency values for parallel mode")
+    parser.add_argument("--modes", default="serial,parallel", help="serial, parallel or both")
+    parser.add_argument("--llm-latency", type=Distribution.parse, default=Distribution(0.05, 0.5),
+                        help="seconds per LLM call as mean[:spread], optionally prefixed fixed:/uniform:/lognormal:")
+    parser.add_argument("--llm-words", type=Distribution.parse, default=Distribution(400, 0.3), help="words per LLM response")
+    parser.add_argument("--search-latency", type=Distribution.parse, default=Distribution(0.1, 0.5), help="seconds per search")
+    parser.add_argument("--search-words", type=Distribution.parse, default=Distribution(60, 0.3), help="words per search result")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario (the median is reported)")
+    parser.add_argument("--seed", default="bench")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows CPU-bound code)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="previous results file; exits 1 if a scenario got slower than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown (0.15 = 15%%)")
+    return parser.parse_args(argv)
+
+def _initial_state(topic):
+    return {
+        "topic": topic,
+        "uploaded_context": "",
+        "outline": [],
+        "current_chapter_index": 0,
+        "current_chapter_content": "",
+        "research_notes": "",
+        "research_by_chapter": {},
+        "chapter_reuse_by_index": {},
+        "reviews": "",
+        "final_document": "",
+        "chapter_sections": []
+    }
+
+def run_once(args, chapters, parallel, concurrency, measure_memory):
+    search = FakeSearch(latency=args.search_latency, words=args.search_words, seed=args.seed)
+    tools.search_tool = search
+    set_llm_factory(lambda model_type: FakeChatModel(model_type=model_type, latency=args.llm_latency,
+                                                     words=args.llm_words, chapters=chapters, seed=args.seed))
+    metrics = RunMetrics(f"bench-{'parallel' if parallel else 'serial'}-{chapters}-{concurrency}-{time.time_ns()}")
+    config = {"recursion_limit": 200}
+    if parallel:
+        config["max_concurrency"] = concurrency
+
+    if measure_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    document = ""
+    for output in stream_report(_initial_state("Global EV market benchmark"), config=metrics.attach(config), parallel=parallel):
+        for update in output.values():
+            document = update.get("final_document", document) if isinstance(update, dict) else document
+    seconds = time.perf_counter() - started
+    peak = 0
+    if measure_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    summary = metrics.summary()
+    if os.path.exists(metrics.path):
+        os.remove(metrics.path)
+    return {
+        "seconds": seconds,
+        "peak_mb": peak / 1024 / 1024,
+        "document_chars": len(document),
+        "llm_calls": int(summary["totals"].get("llm_calls", 0)),
+        "search_calls": search.calls,
+        "nodes": {name: {"runs": int(stats.get("runs", 0)), "seconds": stats.get("seconds", 0.0)}
+                  for name, stats in summary["by_node"].items()},
+    }
+
+def run_scenario(args, chapters, parallel, concurrency):
+    runs = [run_once(args, chapters, parallel, concurrency, measure_memory=not args.no_memory) for _ in range(args.repeat)]
+    seconds = statistics.median(r["seconds"] for r in runs)
+    nodes = {}
+    for name in runs[0]["nodes"]:
+        total_runs = sum(r["nodes"].get(name, {}).get("runs", 0) for r in runs)
+        total_seconds = sum(r["nodes"].get(name, {}).get("seconds", 0.0) for r in runs)
+        nodes[name] = {
+            "runs": total_runs // len(runs),
+            "mean_seconds": total_seconds / total_runs if total_runs else 0.0,
+            # node executions completed per second of report wall time
+            "throughput_per_s": (total_runs / len(runs)) / seconds if seconds else 0.0,
+        }
+    return {
+        "mode": "parallel" if parallel else "serial",
+        "chapters": chapters,
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "seconds_min": min(r["seconds"] for r in runs),
+        "seconds_max": max(r["seconds"] for r in runs),
+        "chapters_per_s": chapters / seconds if seconds else 0.0,
+        "peak_mb": max(r["peak_mb"] for r in runs),
+        "document_chars": runs[0]["document_chars"],
+        "llm_calls": runs[0]["llm_calls"],
+        "search_calls": runs[0]["search_calls"],
+        "nodes": nodes,
+    }
+
+def compare(results, baseline, tolerance):
+    """Prints per-scenario changes against a baseline; returns the regressed scenario keys."""
+    regressions = []
+    print(f"\n{'scenario':<24} {'baseline':>10} {'now':>10} {'change':>8}   peak MB")
+    for key, scenario in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(key)
+        if before is None:
+            print(f"{key:<24} {'-':>10} {scenario['seconds']:>9.3f}s {'new':>8}")
+            continue
+        change = scenario["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  ← slower"
+            regressions.append(key)
+        print(f"{key:<24} {before['seconds']:>9.3f}s {scenario['seconds']:>9.3f}s {change:>+7.1%}   "
+              f"{before['peak_mb']:.1f} → {scenario['peak_mb']:.1f}{flag}")
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    scenarios = {}
+    for chapters in args.chapters:
+        for mode in modes:
+            for concurrency in (args.concurrency if mode == "parallel" else [1]):
+                key = f"{mode}-n{chapters}-c{concurrency}"
+                print(f"[BENCH] {key} ...", file=sys.stderr)
+                scenarios[key] = run_scenario(args, chapters, mode == "parallel", concurrency)
+                s = scenarios[key]
+                print(f"{key:<24} {s['seconds']:>8.3f}s  {s['chapters_per_s']:>6.2f} ch/s  "
+                      f"peak {s['peak_mb']:>6.1f} MB  {s['llm_calls']} LLM / {s['search_calls']} search calls")
+
+    results = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {
+                "llm_latency": vars(args.llm_latency), "llm_words": vars(args.llm_words),
+                "search_latency": vars(args.search_latency), "search_words": vars(args.search_words),
+                "repeat": args.repeat, "seed": args.seed, "memory": not args.no_memory,
+            },
+        },
+        "scenarios": scenarios,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("settings") != results["meta"]["settings"]:
+            print("⚠ Baseline was recorded with different settings; timings may not be comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} scenario(s) slower than the baseline by more than {args.tolerance:.0%}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
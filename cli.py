@@ -0,0 +1,190 @@
+"""
+Headless batch mode: generates one report per topic in a file, several at a
+time, in a single process (so the model clients, HTTP pools and the LLM/search
+caches are shared by all of them), and writes Markdown/DOCX files plus a
+timing summary.
+
+    python cli.py topics.jsonl --output-dir reports --concurrency 3
+    python cli.py topics.txt --formats md --serial
+
+Input is JSONL, one report per line: {"topic": "..."} with optional "id",
+"parallel" and "context" (paths of PDF/TXT files used like uploads); lines
+with "title"/"body" (like requests.jsonl) work too. Any other file is read as
+one topic per line.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from datetime import datetime
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass  # dotenv not required when the environment is set
+
+from modules.aio import run_sync
+from modules.export import markdown_to_docx
+from modules.instrumentation import RunMetrics
+from modules.tools import extract_uploaded_files, join_extracted_pages
+from workflow import arun_report, CHAPTER_CONCURRENCY
+
+class _LocalFile:
+    """A file on disk with the interface extract_uploaded_files expects from a Streamlit upload."""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self.path = path
+
+    def getvalue(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+def _slug(text, limit=60):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:limit].strip("-") or "report"
+
+def read_topics(path):
+    """Returns [{"id", "topic", "parallel", "context"}] from a JSONL or plain-text topics file."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    for n, line in enumerate(lines, 1):
+        if line.startswith("{"):
+            record = json.loads(line)
+            topic = record.get("topic") or "\n\n".join(p for p in (record.get("title"), record.get("body")) if p)
+            item_id = str(record.get("id") or record.get("request_id") or f"{n:03d}-{_slug(topic, 40)}")
+            context = record.get("context") or []
+            items.append({"id": item_id, "topic": topic, "parallel": record.get("parallel"),
+                          "context": [context] if isinstance(context, str) else list(context)})
+        else:
+            items.append({"id": f"{n:03d}-{_slug(line, 40)}", "topic": line, "parallel": None, "context": []})
+    if not items:
+        raise ValueError(f"No topics found in {path}")
+    return items
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate EV reports for a batch of topics")
+    parser.add_argument("topics", help="JSONL file (one {\"topic\": ...} per line) or text file (one topic per line)")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "2")),
+                        help="reports generated at the same time")
+    parser.add_argument("--chapter-concurrency", type=int, default=CHAPTER_CONCURRENCY,
+                        help="chapters in parallel within each report")
+    parser.add_argument("--serial", action="store_true", help="write chapters one after another (serial graph)")
+    parser.add_argument("--formats", default="md,docx", help="md, docx or both")
+    parser.add_argument("--force", action="store_true", help="regenerate reports whose outputs already exist")
+    parser.add_argument("--writer-model", default=None, help="model type tried first for writing, e.g. claude-sonnet")
+    return parser.parse_args(argv)
+
+def _initial_state(topic, context_text, writer_model=None):
+    return {
+        "topic": topic,
+        "uploaded_context": context_text,
+        "outline": [],
+        "current_chapter_index": 0,
+        "current_chapter_content": "",
+        "research_notes": "",
+        "research_by_chapter": {},
+        "chapter_reuse_by_index": {},
+        "reviews": "",
+        "final_document": "",
+        "chapter_sections": [],
+        "writer_model": writer_model
+    }
+
+async def generate_report(item, args, formats, semaphore):
+    """Runs one report under the batch semaphore and writes its outputs; returns its summary row."""
+    base = os.path.join(args.output_dir, _slug(item["id"], 80))
+    outputs = {fmt: f"{base}.{fmt}" for fmt in formats}
+    row = {"id": item["id"], "topic": item["topic"][:120], "outputs": list(outputs.values())}
+    if not args.force and all(os.path.exists(p) for p in outputs.values()):
+        print(f"[BATCH] {item['id']}: outputs exist, skipping (use --force to regenerate)", file=sys.stderr)
+        return dict(row, status="skipped", seconds=0.0)
+
+    async with semaphore:
+        started = time.perf_counter()
+        run_id = uuid.uuid4().hex
+        parallel = (not args.serial) if item["parallel"] is None else bool(item["parallel"])
+        config = {"recursion_limit": 200}
+        if parallel:
+            config["max_concurrency"] = args.chapter_concurrency
+        metrics = RunMetrics(run_id)
+        print(f"[BATCH] {item['id']}: started (run {run_id})", file=sys.stderr)
+        try:
+            context_text = ""
+            if item["context"]:
+                records = await asyncio.to_thread(extract_uploaded_files, [_LocalFile(p) for p in item["context"]])
+                context_text = join_extracted_pages(records)
+            # Checkpointed under run_id, so a failed report can be resumed from the UI
+            state = await arun_report(_initial_state(item["topic"], context_text, args.writer_model), config=metrics.attach(config),
+                                      parallel=parallel, run_id=run_id)
+            document = state.get("final_document", "")
+            if "md" in outputs:
+                with open(outputs["md"], "w", encoding="utf-8") as f:
+                    f.write(document)
+            if "docx" in outputs:
+                metadata = [f"Generated: {datetime.now().strftime('%B %d, %Y at %H:%M')}", f"Topic: {item['topic']}"]
+                data = await asyncio.to_thread(markdown_to_docx, document, "EV Report 2025", metadata)
+                with open(outputs["docx"], "wb") as f:
+                    f.write(data)
+            row.update(status="completed", chapters=len(state.get("outline", []) or []), chars=len(document))
+        except Exception as e:
+            print(f"[BATCH ERROR] {item['id']}: {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            row.update(status="failed", error=f"{type(e).__name__}: {e}")
+        totals = metrics.finish()["totals"]
+        row.update(run_id=run_id, seconds=time.perf_counter() - started,
+                   llm_calls=int(totals.get("llm_calls", 0)), cost_usd=totals.get("cost_usd", 0.0))
+        print(f"[BATCH] {item['id']}: {row['status']} in {row['seconds']:.1f}s", file=sys.stderr)
+        return row
+
+async def run_batch(items, args):
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip() in ("md", "docx")]
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    return await asyncio.gather(*(generate_report(item, args, formats, semaphore) for item in items))
+
+def main(argv=None):
+    args = parse_args(argv)
+    items = read_topics(args.topics)
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"[BATCH] {len(items)} reports, {args.concurrency} at a time → {args.output_dir}", file=sys.stderr)
+
+    started = time.perf_counter()
+    # All reports share the process-wide event loop (modules/aio.py), and with it
+    # the model registry, HTTP connection pools and caches
+    rows = run_sync(run_batch(items, args))
+    wall = time.perf_counter() - started
+
+    generated = [r for r in rows if r["status"] != "skipped"]
+    report_seconds = sum(r["seconds"] for r in generated)
+    summary = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "topics_file": args.topics,
+        "concurrency": args.concurrency,
+        "wall_seconds": wall,
+        "report_seconds": report_seconds,
+        # > 1 when reports overlapped
+        "speedup": report_seconds / wall if wall else 0.0,
+        "reports_per_hour": len(generated) / wall * 3600 if wall and generated else 0.0,
+        "cost_usd": sum(r.get("cost_usd", 0.0) for r in rows),
+        "reports": rows,
+    }
+    with open(os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'report':<40} {'status':<10} {'seconds':>8} {'chapters':>8} {'LLM calls':>9}")
+    for r in rows:
+        print(f"{r['id'][:40]:<40} {r['status']:<10} {r['seconds']:>8.1f} {r.get('chapters', 0):>8} {r.get('llm_calls', 0):>9}")
+    print(f"\n{len(generated)} reports in {wall:.1f}s wall ({report_seconds:.1f}s of report time, "
+          f"{summary['speedup']:.1f}x overlap), ~${summary['cost_usd']:.4f}")
+    print(f"Summary written to {os.path.join(args.output_dir, 'summary.json')}")
+    return 1 if any(r["status"] == "failed" for r in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
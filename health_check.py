@@ -42,16 +42,23 @@ try:
     print("✓ python-docx imported")
     
     print("\n[8/10] Testing pypdf...")
-    from langchain_community.document_loaders import PyPDFLoader
-    print("✓ PyPDFLoader imported")
+    from pypdf import PdfReader
+    print("✓ pypdf imported")
     
     print("\n[9/10] Testing modules.state...")
     from modules.state import AgentState
     print("✓ modules.state imported")
     
     print("\n[10/10] Testing modules.agents...")
+    import os
+    import time
+    started = time.perf_counter()
     from modules.agents import planner_agent
-    print("✓ modules.agents imported")
+    elapsed = time.perf_counter() - started
+    budget = float(os.getenv("STARTUP_BUDGET_SECONDS", "3"))
+    print(f"✓ modules.agents imported in {elapsed:.2f}s (budget {budget:g}s)")
+    if elapsed > budget:
+        print("⚠ modules.agents import is over the startup budget")
     
     print("\n" + "=" * 50)
     print("✅ ALL CHECKS PASSED!")
@@ -1,3 +1,6 @@
+import time
+_startup_started = time.perf_counter()
+
 import streamlit as st
 import os
 import sys
@@ -46,17 +49,22 @@ if not os.getenv('AZURE_OPENAI_KEY') or not os.getenv('AZURE_OPENAI_ENDPOINT'):
     st.stop()
 print("[MAIN] ✓ Required secrets present", file=sys.stderr)
 
-from docx import Document
-from docx.shared import Pt, Inches
 from datetime import datetime
-import io
 
 # Import workflow after environment is configured
 print("[MAIN] Importing modules...", file=sys.stderr)
 try:
-    from modules.tools import process_uploaded_files
+    from modules.tools import extract_uploaded_files, join_extracted_pages
     print("[MAIN] ✓ modules.tools imported", file=sys.stderr)
-    from workflow import app_graph
+    from modules.llm_cache import get_llm_cache
+    from modules.chapter_store import get_chapter_store
+    from modules.routing import get_router
+    from modules.retrieval import get_context_index
+    from modules.checkpoints import list_runs
+    from modules.incremental import build_incremental_state
+    from modules.export import get_docx_bytes, document_key, DOCX_MIME
+    from modules.jobs import get_job_queue
+    from workflow import get_report_state, CHAPTER_CONCURRENCY
     print("[MAIN] ✓ workflow imported", file=sys.stderr)
 except Exception as import_error:
     print(f"[MAIN] ❌ Import failed: {import_error}", file=sys.stderr)
@@ -67,51 +75,80 @@ except Exception as import_error:
     st.code(traceback.format_exc())
     st.stop()
 
-print("[MAIN] ✓ All imports successful", file=sys.stderr)
+# Models are built lazily on first use, so startup should stay well under budget
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3"))
+startup_seconds = time.perf_counter() - _startup_started
+print(f"[MAIN] ✓ All imports successful in {startup_seconds:.2f}s (budget {STARTUP_BUDGET_SECONDS:g}s)", file=sys.stderr)
+if startup_seconds > STARTUP_BUDGET_SECONDS:
+    print(f"[MAIN] ⚠ Startup exceeded budget by {startup_seconds - STARTUP_BUDGET_SECONDS:.2f}s", file=sys.stderr)
 
 # Initialize session state for document persistence
 if 'generated_document' not in st.session_state:
     st.session_state.generated_document = None
 if 'generation_timestamp' not in st.session_state:
     st.session_state.generation_timestamp = None
+if 'last_report' not in st.session_state:
+    st.session_state.last_report = None  # topic, uploaded_context and outline of the last completed run
+if 'active_job' not in st.session_state:
+    st.session_state.active_job = None  # background job this session is following
+
+# Reports run as background jobs (modules/jobs.py); poll the one this session
+# follows and, once it has finished, make its document the current one
+job_queue = get_job_queue()
+finished_job = None
+if st.session_state.active_job:
+    finished_job = job_queue.get(st.session_state.active_job)
+    if finished_job is None or finished_job["status"] in ("queued", "running"):
+        finished_job = None
+    else:
+        st.session_state.active_job = None
+        if finished_job["document"]:
+            st.session_state.generated_document = finished_job["document"]
+            st.session_state.generation_timestamp = datetime.fromtimestamp(finished_job["finished_at"])
+            if finished_job["status"] == "completed":
+                final_state = get_report_state(finished_job["job_id"], parallel=finished_job["parallel"])
+                st.session_state.last_report = {key: final_state.get(key) for key in ("topic", "uploaded_context", "outline")}
 
 st.title("🚙 EV Report Generator 2025 (Multi-Agent System)")
 st.markdown("### Powered by GPT-5-Mini, Claude Sonnet 4.5, Grok-4 & Local Models")
 
+def request_docx(doc_key):
+    st.session_state.docx_ready = doc_key
+
+def docx_download_button(document, generated_at, topic, label, key):
+    """
+    DOCX download for a finished document. Rendering only happens once the user
+    asks for it, and the bytes are cached per document (modules/export.py), so
+    other widget interactions don't re-render it.
+    """
+    metadata = [f"Generated: {generated_at.strftime('%B %d, %Y at %H:%M')}"]
+    if topic:
+        metadata.append(f"Topic: {topic}")
+    # Shared by both download sections: preparing it after a run (which reruns
+    # the script) makes the "previous document" section offer it right away
+    doc_key = document_key(document, "EV Report 2025", metadata)
+    if st.session_state.get("docx_ready") != doc_key:
+        st.button("📝 Prepare DOCX", key=f"{key}_prepare", on_click=request_docx, args=(doc_key,))
+        return
+    with st.spinner("Rendering DOCX..."):
+        data = get_docx_bytes(document, "EV Report 2025", metadata)
+    st.download_button(
+        label,
+        data,
+        file_name=f"EV_Report_{generated_at.strftime('%Y%m%d_%H%M')}.docx",
+        mime=DOCX_MIME,
+        key=key
+    )
+
 # Show previously generated document if exists
 if st.session_state.generated_document:
     st.info(f"📄 **Previous document available** - Generated at {st.session_state.generation_timestamp.strftime('%B %d, %Y at %H:%M')} ({len(st.session_state.generated_document):,} characters)")
     
-    # Create DOCX for previous document
-    doc_prev = Document()
-    title_prev = doc_prev.add_heading('EV Report 2025', 0)
-    title_prev.alignment = 1
-    doc_prev.add_paragraph(f"Generated: {st.session_state.generation_timestamp.strftime('%B %d, %Y at %H:%M')}")
-    doc_prev.add_paragraph("_" * 50)
-    
-    paragraphs_prev = st.session_state.generated_document.split('\n\n')
-    for para in paragraphs_prev:
-        if para.strip():
-            if para.strip().startswith('#'):
-                heading_text = para.strip().lstrip('#').strip()
-                heading_level = min(len(para.strip()) - len(para.strip().lstrip('#')), 3)
-                doc_prev.add_heading(heading_text, level=heading_level)
-            else:
-                doc_prev.add_paragraph(para.strip())
-    
-    bio_prev = io.BytesIO()
-    doc_prev.save(bio_prev)
-    bio_prev.seek(0)
-    
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.download_button(
-            "📥 Download Previous DOCX", 
-            bio_prev.getvalue(), 
-            file_name=f"EV_Report_{st.session_state.generation_timestamp.strftime('%Y%m%d_%H%M')}.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            key="prev_docx"
-        )
+        last_topic = (st.session_state.last_report or {}).get("topic")
+        docx_download_button(st.session_state.generated_document, st.session_state.generation_timestamp,
+                             last_topic, "📥 Download Previous DOCX", key="prev_docx")
     with col2:
         st.download_button(
             "📄 Download Previous MD", 
@@ -123,8 +160,22 @@ if st.session_state.generated_document:
         if st.button("🗑️ Clear Previous Document"):
             st.session_state.generated_document = None
             st.session_state.generation_timestamp = None
+            st.session_state.last_report = None
             st.rerun()
 
+# Incremental update: edit the outline or pick chapters to refresh; everything else is reused
+incremental_state = None
+if st.session_state.generated_document and st.session_state.last_report:
+    last_report = st.session_state.last_report
+    with st.expander("🔁 Update chapters of the previous document"):
+        edited_outline = st.text_area("Outline (one chapter per line)", "\n".join(last_report["outline"]), height=200)
+        new_outline = [line.strip() for line in edited_outline.split("\n") if line.strip()]
+        refresh_titles = st.multiselect("Also regenerate", new_outline,
+                                        help="Chapters to rewrite even though their title did not change.")
+        if st.button("Regenerate changed chapters", disabled=not new_outline):
+            incremental_state = build_incremental_state(last_report, st.session_state.generated_document,
+                                                        last_report["outline"], new_outline, refresh=refresh_titles)
+
 # Sidebar for Config
 with st.sidebar:
     st.header("Settings")
@@ -132,166 +183,199 @@ with st.sidebar:
     
     model_choice = st.selectbox("Primary Writer Model", ["gpt-5-mini", "claude-sonnet", "grok-4"])
     st.info("The system automatically cross-verifies using a different model than the writer.")
+    # Deployments the router currently avoids (modules/routing.py)
+    unhealthy = [h for h in get_router().stats() if h["state"] != "closed"]
+    if unhealthy:
+        st.caption("🚦 Failing over from: " + ", ".join(f"{h['deployment']} ({h['state'].replace('_', '-')})" for h in unhealthy))
+    
+    parallel_mode = st.checkbox("Parallel chapter generation", value=True,
+                                help="Research, write and review all chapters concurrently instead of one after another.")
+    chapter_concurrency = st.number_input("Max chapters in parallel", min_value=1, max_value=20,
+                                          value=CHAPTER_CONCURRENCY, disabled=not parallel_mode)
+
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        cache_stats = llm_cache.stats()
+        st.caption(f"🗄️ LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses this session, "
+                   f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+        if st.button("Clear LLM cache"):
+            llm_cache.clear()
+            st.rerun()
+
+    chapter_store = get_chapter_store()
+    if chapter_store is not None:
+        store_stats = chapter_store.stats()
+        st.caption(f"📚 Chapter store: {store_stats['entries']} chapters from earlier reports, "
+                   f"{store_stats['reused']} reused / {store_stats['refreshed']} refreshed this session")
+        if st.button("Clear chapter store"):
+            chapter_store.clear()
+            st.rerun()
+
+    # Runs are checkpointed after every step; unfinished ones can pick up where they stopped
+    resume_run = None
+    active_job_ids = {job["job_id"] for job in job_queue.list_jobs(status="active", limit=100)}
+    unfinished_runs = [run for run in list_runs(status="unfinished", limit=10) if run["run_id"] not in active_job_ids]
+    if unfinished_runs:
+        st.subheader("Resume a run")
+        resume_choice = st.selectbox(
+            "Unfinished runs", unfinished_runs,
+            format_func=lambda run: f"{datetime.fromtimestamp(run['updated_at']).strftime('%b %d %H:%M')} · "
+                                    f"{run['status']} · {run['topic'][:40]}"
+        )
+        if resume_choice.get("error"):
+            st.caption(f"Stopped with: {resume_choice['error'][:200]}")
+        if st.button("Resume run"):
+            resume_run = resume_choice
+
+    # Jobs keep running when the tab is closed; reopen one to follow it or get its document
+    recent_jobs = job_queue.list_jobs(limit=10)
+    if recent_jobs:
+        st.subheader("Background jobs")
+        job_choice = st.selectbox(
+            "Recent jobs", recent_jobs,
+            format_func=lambda job: f"{datetime.fromtimestamp(job['created_at']).strftime('%b %d %H:%M')} · "
+                                    f"{job['status']} · {job['topic'][:40]}"
+        )
+        if st.button("Open job", disabled=job_choice["job_id"] == st.session_state.active_job):
+            st.session_state.active_job = job_choice["job_id"]
+            st.rerun()
+
+def show_run_metrics(summary):
+    """Renders a RunMetrics summary: totals plus where the time and the tokens went."""
+    totals = summary["totals"]
+    with st.expander(f"📊 Run metrics: {totals['wall_seconds']:.1f}s, {int(totals.get('llm_calls', 0))} LLM calls, "
+                     f"~${totals.get('cost_usd', 0.0):.4f}"):
+        cols = st.columns(4)
+        cols[0].metric("Prompt tokens", f"{int(totals.get('prompt_tokens', 0)):,}")
+        cols[1].metric("Completion tokens", f"{int(totals.get('completion_tokens', 0)):,}")
+        cols[2].metric("Cache hits", int(totals.get("cache_hits", 0)))
+        cols[3].metric("Retries", int(totals.get("retries", 0)))
+        st.caption(f"Slowest node: {summary['slowest_node']} · Costliest agent: {summary['costliest_agent']}")
+        for label, key in (("Per node", "by_node"), ("Per agent", "by_agent"), ("Per model", "by_model"), ("Per chapter", "by_chapter")):
+            rows = [{"name": (int(name) + 1 if key == "by_chapter" else name),
+                     **{stat: round(value, 4) for stat, value in stats.items()}} for name, stats in summary[key].items()]
+            if rows:
+                st.markdown(f"**{label}**")
+                st.dataframe(rows, use_container_width=True)
 
 # Main Input
 user_prompt = st.text_area("Enter Topic & Requirements", "Generate a comprehensive report on the Global EV Passenger Car Market, Trends, and Policies up to Dec 2025.", height=100)
 
-if st.button("Start Agent Swarm"):
+start_clicked = st.button("Start Agent Swarm")
+
+if start_clicked or resume_run or incremental_state:
     try:
-        with st.spinner("Initializing Agents... Reading Uploaded Docs..."):
-            # 1. Process Manual Uploads
+        with st.spinner("Reading Uploaded Docs..."):
+            # 1. Process Manual Uploads (resumed and incremental runs already carry their context)
             context_text = ""
-            if uploaded_files:
+            if uploaded_files and resume_run is None and incremental_state is None:
                 try:
-                    context_text = process_uploaded_files(uploaded_files)
-                    st.success(f"Processed {len(uploaded_files)} manual documents.")
+                    extractions = extract_uploaded_files(uploaded_files)
+                    context_text = join_extracted_pages(extractions)
+                    # Build the retrieval index once; agents query it per chapter
+                    context_index = get_context_index(context_text)
+                    st.success(f"Processed {len(uploaded_files)} manual documents ({len(context_index.chunks)} searchable chunks).")
+                    st.caption(" · ".join(f"{r['name']}: {len(r['pages'])} pages "
+                                          f"{'from cache' if r['cached'] else 'in %.1fs' % r['seconds']}" for r in extractions))
                 except Exception as e:
                     st.error(f"Error processing files: {str(e)}")
                     raise
             
-            # 2. Initialize State
-            initial_state = {
-                "topic": user_prompt,
-                "uploaded_context": context_text,
-                "outline": [],
-                "current_chapter_index": 0,
-                "current_chapter_content": "",
-                "research_notes": "",
-                "reviews": "",
-                "final_document": ""
-            }
-
-            # 3. Run Graph
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            final_output = st.empty()
-            error_display = st.empty()
-            
-            # We stream the events to show progress
-            current_step = 0
-            final_state = initial_state.copy()  # Track the final state
+            # Note: Depending on langgraph version, use .stream or .invoke
+            # Increase recursion limit to handle multiple chapter iterations
+            # 200 iterations = ~200 chapters which should be more than enough
+            config = {"recursion_limit": 200}
             
-            try:
-                # Note: Depending on langgraph version, use .stream or .invoke
-                # Increase recursion limit to handle multiple chapter iterations
-                # 200 iterations = ~200 chapters which should be more than enough
-                config = {"recursion_limit": 200}
-                for output in app_graph.stream(initial_state, config=config):
-                    for key, value in output.items():
-                        # Update final_state with the latest output
-                        final_state = value
-                        
-                        # Get chapter progress info
-                        current_idx = value.get('current_chapter_index', 0)
-                        total_chapters = len(value.get('outline', []))
-                        
-                        if key == "planner":
-                            status_text.write(f"✅ Outline Generated: {len(value['outline'])} Chapters")
-                            st.info(f"📋 Chapters planned: {', '.join(value['outline'][:5])}{'...' if len(value['outline']) > 5 else ''}")
-                        elif key == "research":
-                            status_text.write(f"🔍 Researching chapter {current_idx + 1}/{total_chapters}...")
-                        elif key == "write":
-                            chapter_title = value.get('outline', [''])[current_idx] if current_idx < total_chapters else 'Unknown'
-                            status_text.write(f"✍️ Writing chapter {current_idx + 1}/{total_chapters}: {chapter_title}")
-                        elif key == "review":
-                            status_text.write(f"⚖️ Reviewing chapter {current_idx + 1}/{total_chapters}...")
-                            
-                            # Update Preview (show progress, not full content)
-                            if 'final_document' in value:
-                                doc_length = len(value['final_document'])
-                                final_output.info(f"📝 Document length: {doc_length:,} characters")
-                                
-                    # Simple progress simulation
-                    current_step += 5
-                    if current_step > 100: current_step = 100
-                    progress_bar.progress(current_step)
-
-                # Extract final content from final_state (not initial_state!)
-                final_content = final_state.get('final_document', '')
-                
-                # Store in session state for persistence
-                st.session_state.generated_document = final_content
-                st.session_state.generation_timestamp = datetime.now()
-                
-                # Generate DOCX file
-                st.success(f"✅ Document Generation Complete! ({len(final_content):,} characters)")
-                
-                # Create DOCX document
-                doc = Document()
-                
-                # Add title
-                title = doc.add_heading('EV Report 2025', 0)
-                title.alignment = 1  # Center alignment
-                
-                # Add metadata
-                doc.add_paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y at %H:%M')}")
-                doc.add_paragraph(f"Topic: {user_prompt}")
-                doc.add_paragraph("_" * 50)
-                
-                # Add content (split by paragraphs)
-                # final_content already captured above from final_state
-                
-                # Split content and add to document
-                paragraphs = final_content.split('\n\n')
-                for para in paragraphs:
-                    if para.strip():
-                        # Check if it's a heading (starts with #)
-                        if para.strip().startswith('#'):
-                            heading_text = para.strip().lstrip('#').strip()
-                            heading_level = min(len(para.strip()) - len(para.strip().lstrip('#')), 3)
-                            doc.add_heading(heading_text, level=heading_level)
-                        else:
-                            doc.add_paragraph(para.strip())
-                
-                # Save to BytesIO for download
-                bio = io.BytesIO()
-                doc.save(bio)
-                bio.seek(0)
-                
-                # Download buttons for both formats
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.download_button(
-                        "📥 Download DOCX", 
-                        bio.getvalue(), 
-                        file_name=f"EV_Report_{datetime.now().strftime('%Y%m%d_%H%M')}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
-                with col2:
-                    st.download_button(
-                        "📄 Download Markdown", 
-                        final_content, 
-                        file_name=f"EV_Report_{datetime.now().strftime('%Y%m%d_%H%M')}.md"
-                    )
-                
-                # Show preview option
-                with st.expander("📖 Preview Generated Content"):
-                    st.markdown(final_content)
-            except Exception as graph_error:
-                # Special handling for recursion limit - save what we have
-                if "Recursion limit" in str(graph_error) or "GraphRecursionError" in str(graph_error):
-                    error_display.warning(f"⚠️ Recursion limit reached. Saving document generated so far...")
-                    print(f"[MAIN] Recursion limit hit. Attempting to save partial document.", file=sys.stderr)
-                    
-                    # Try to extract final_state if we have it
-                    if 'final_state' in locals() and final_state.get('final_document'):
-                        final_content = final_state['final_document']
-                        st.session_state.generated_document = final_content
-                        st.session_state.generation_timestamp = datetime.now()
-                        
-                        st.info(f"✅ Partial document saved: {len(final_content):,} characters")
-                        st.warning("The document generation was stopped due to recursion limit. You can still download the content generated so far.")
-                        
-                        # Still show the DOCX generation section
-                        # (the code below will handle it)
-                    else:
-                        st.error("Could not retrieve partial document. Try reducing the number of chapters or increasing recursion limit further.")
-                else:
-                    error_display.error(f"Error during workflow execution: {str(graph_error)}")
-                    st.error("Check the terminal/console for detailed error logs.")
-                raise
+            # 2. Queue the job (a resumed job continues from the checkpoint of its run)
+            if resume_run:
+                run_parallel = resume_run["parallel"]
+                if run_parallel:
+                    config["max_concurrency"] = int(chapter_concurrency)
+                job_id = job_queue.submit(None, resume_run["topic"], run_parallel, config,
+                                          job_id=resume_run["run_id"], resume=True)
+                st.info(f"↩️ Resuming run {job_id[:8]}: {resume_run['topic'][:80]}")
+            elif incremental_state:
+                # Only the parallel graph can start from a fixed outline with chapters pre-seeded
+                config["max_concurrency"] = int(chapter_concurrency)
+                incremental_state["writer_model"] = model_choice
+                job_id = job_queue.submit(incremental_state, incremental_state["topic"], True, config)
+                st.info(f"🔁 Regenerating {len(incremental_state['pending_chapters'])} of "
+                        f"{len(incremental_state['outline'])} chapters, reusing the rest")
+            else:
+                if parallel_mode:
+                    config["max_concurrency"] = int(chapter_concurrency)
+                    print(f"[MAIN] Parallel mode, max {config['max_concurrency']} chapters at once", file=sys.stderr)
+                initial_state = {
+                    "topic": user_prompt,
+                    "uploaded_context": context_text,
+                    "outline": [],
+                    "current_chapter_index": 0,
+                    "current_chapter_content": "",
+                    "research_notes": "",
+                    "research_by_chapter": {},
+                    "chapter_reuse_by_index": {},
+                    "reviews": "",
+                    "final_document": "",
+                    "chapter_sections": [],
+                    "writer_model": model_choice
+                }
+                job_id = job_queue.submit(initial_state, user_prompt, parallel_mode, config)
+            st.session_state.active_job = job_id
+            print(f"[MAIN] Following job {job_id}", file=sys.stderr)
     except Exception as e:
         st.error(f"Critical error: {str(e)}")
         st.error("Please check the terminal output for detailed error information.")
         import traceback
-        st.code(traceback.format_exc())
\ No newline at end of file
+        st.code(traceback.format_exc())
+
+# Result of the job that just finished (its document is offered above)
+if finished_job:
+    document = finished_job["document"] or ""
+    if finished_job["status"] == "completed":
+        st.success(f"✅ Document Generation Complete! ({len(document):,} characters)")
+        if llm_cache is not None:
+            print(f"[MAIN] LLM cache stats: {llm_cache.stats()}", file=sys.stderr)
+    elif finished_job["status"] == "cancelled":
+        st.warning("⏹️ The job was cancelled.")
+    else:
+        error = finished_job["error"] or ""
+        # Special handling for recursion limit - the document generated so far was kept
+        if "Recursion limit" in error or "GraphRecursionError" in error:
+            st.warning("⚠️ Recursion limit reached. The document generation was stopped; you can still download the content generated so far.")
+        else:
+            st.error(f"Error during workflow execution: {error}")
+            st.error("Check the terminal/console for detailed error logs.")
+        if document:
+            st.info(f"✅ Partial document saved: {len(document):,} characters")
+    if finished_job["status"] != "completed":
+        st.info("💾 Completed steps are checkpointed. Use **Resume run** in the sidebar to continue this run without regenerating finished chapters.")
+    if finished_job["metrics"]:
+        show_run_metrics(finished_job["metrics"])
+    if document:
+        with st.expander("📖 Preview Generated Content"):
+            st.markdown(document)
+
+# Progress of the job this session follows; the page polls until it finishes
+JOB_REFRESH_SECONDS = float(os.getenv("JOB_REFRESH_SECONDS", "1"))
+if st.session_state.active_job:
+    job = job_queue.get(st.session_state.active_job)
+    if job is not None:
+        progress = job["progress"]
+        st.subheader(f"{'⏳ Queued' if job['status'] == 'queued' else '⚙️ Running'}: {job['topic'][:80]}")
+        st.caption(f"Job {job['job_id'][:8]} runs in the background; you can close this tab and reopen it "
+                   f"from **Background jobs** in the sidebar.")
+        total = progress.get("total_chapters") or 0
+        st.progress(min(100, int(100 * progress.get("chapters_done", 0) / total)) if total else 0)
+        st.write(progress.get("message", ""))
+        if progress.get("document_chars"):
+            st.info(f"📝 Document length: {progress['document_chars']:,} characters")
+        preview = job.get("preview")
+        if preview:
+            # Token-level preview of the writer/reviewer output
+            verb = "✍️ Writing" if preview["agent"] == "writer" else "⚖️ Reviewing"
+            st.caption(f"{verb} chapter {preview['chapter'] + 1}: {preview['title']} (live)")
+            st.markdown(preview["text"])
+        if st.button("Cancel job"):
+            job_queue.cancel(job["job_id"])
+        time.sleep(JOB_REFRESH_SECONDS)
+        st.rerun()
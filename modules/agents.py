@@ -1,112 +1,229 @@
-from modules.llm_factory import get_llm
-from modules.tools import web_search_tool
+from modules.routing import route_llm
+from modules.tools import research_tool
+from modules.retrieval import retrieve_context
+from modules.sanitizer import sanitize_content
+from modules.content_guard import get_content_guard, sanitize_fields
+from modules.chapter_store import find_reusable_chapter, remember_chapter
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
 import sys
-import re
 
-def sanitize_content(text: str) -> str:
-    """Remove potentially flagged words that might trigger Azure content filters."""
-    if not text:
-        return text
+# Number of chapter searches the prefetch stage runs at once
+RESEARCH_PREFETCH_WORKERS = int(os.getenv("RESEARCH_PREFETCH_WORKERS", "8"))
+
+# Models are constructed lazily on first use and memoized by the LLM registry,
+# so importing this module (and Streamlit reruns) never waits on client setup
+# or network probes. Which model serves a role is decided per call by the
+# router (modules/routing.py), from the role's route and deployment health.
+# Set to 0 to let the reviewer use its route as is, even if that is the writer's model
+CROSS_REVIEW = os.getenv("CROSS_REVIEW", "1").lower() not in ("0", "false", "no")
+
+def get_role_llm(role, state=None):
+    """
+    Returns the routed model for an agent role. The writer model chosen in the
+    UI (state["writer_model"]) is tried first for the writer and last for the
+    reviewer, so drafts are cross-checked by a different model.
+    """
+    writer_model = (state or {}).get("writer_model")
+    if role == "writer":
+        return route_llm(role, prefer=writer_model)
+    if role == "reviewer" and CROSS_REVIEW:
+        return route_llm(role, avoid=writer_model)
+    return route_llm(role)
+
+_LEGACY_MODEL_NAMES = {"llm_writer": "writer", "llm_reviewer": "reviewer", "llm_researcher": "researcher", "llm_local": "planner"}
+
+def __getattr__(name):
+    # Keeps the old module-level names (llm_writer, ...) working, lazily
+    if name in _LEGACY_MODEL_NAMES:
+        return get_role_llm(_LEGACY_MODEL_NAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Prompts are shared by the sync and async agent variants
+PLANNER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert Editor. Create a comprehensive 10-chapter outline for a professional report on: {topic}. Return ONLY the list of chapters separated by newlines. Maximum 15 chapters."),
+    ("user", "Context: {context}")
+])
+
+WRITER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a professional technical writer. Write a detailed, factual chapter (approx 1000 words). Use the provided research notes. Focus on data from 2024-2025."),
+    ("user", "Chapter Title: {chapter}\n\nResearch Notes: {notes}\n\nUploaded Doc Context: {u_context}")
+])
+
+REVIEWER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a strict fact-checker. Review the draft. If it lacks data or has logic errors, correct them and rewrite the section. Ensure professional tone."),
+    ("user", "Draft: {draft}")
+])
+
+# Used instead of the reviewer prompt for a chapter taken from an earlier report (chapter store)
+REFRESH_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a strict fact-checker. This chapter comes from an earlier report. Update it with the new research notes: correct outdated figures, add significant new developments and keep the structure. Ensure professional tone."),
+    ("user", "Chapter: {draft}\n\nNew Research Notes: {notes}")
+])
+
+def is_content_filter_error(error: Exception) -> bool:
+    """True if the exception is an Azure content filter rejection."""
+    return "content_filter" in str(error) or "ResponsibleAIPolicyViolation" in str(error)
+
+def _planner_inputs(state):
+    # Only the parts of the uploads relevant to the topic are sent, not a blind prefix
+    context = retrieve_context(state["uploaded_context"], state["topic"], max_chars=2000)
+    return {"topic": state["topic"], "context": context}
+
+def _planner_update(response):
+    chapters = [line.strip() for line in response.content.split("\n") if line.strip()]
+    
+    # Hard limit: max 20 chapters to prevent infinite loops
+    if len(chapters) > 20:
+        print(f"[PLANNER] WARNING: Generated {len(chapters)} chapters, limiting to 20", file=sys.stderr)
+        chapters = chapters[:20]
+    print(f"[PLANNER] Generated {len(chapters)} chapters", file=sys.stderr)
+    return {"outline": chapters, "current_chapter_index": 0, "final_document": ""}
+
+def _research_query(current_chapter):
+    return f"{current_chapter} statistics facts news"
+
+def pending_chapter_indexes(state):
+    """Outline indexes that still need generating (all of them unless an incremental run narrowed it)."""
+    pending = state.get("pending_chapters")
+    return list(range(len(state["outline"]))) if pending is None else list(pending)
+
+# Prompt inputs that may be sanitized for Azure's content filter (see modules/content_guard.py)
+WRITER_FILTERED_FIELDS = ("notes", "u_context")
+REVIEWER_FILTERED_FIELDS = ("draft",)
+REFRESH_FILTERED_FIELDS = ("draft", "notes")
+
+def _chapter_reuse(state, idx):
+    """Stored chapter from an earlier report that can stand in for this one (None = generate it)."""
+    if idx in (state.get("no_reuse_chapters") or []):
+        return None
+    return find_reusable_chapter(state["outline"][idx], state["topic"], state.get("uploaded_context", ""))
+
+def _lookup_reuse(state, indexes):
+    # One chapter store lookup per chapter and run; the researcher reads the result from state
+    return {i: _chapter_reuse(state, i) for i in indexes}
+
+def _chapters_to_search(reuse_by_index):
+    # Chapters reused verbatim from the chapter store need no research
+    return [i for i, reuse in reuse_by_index.items() if (reuse or {}).get("mode") != "reuse"]
+
+def _reviewer_chain(state):
+    """(chain, inputs, filtered fields) for reviewing the current draft, or refreshing a stored chapter."""
+    draft = state["current_chapter_content"]
+    if state.get("chapter_reuse"):
+        return REFRESH_PROMPT | get_role_llm("reviewer", state), {"draft": draft, "notes": state["research_notes"]}, REFRESH_FILTERED_FIELDS
+    return REVIEWER_PROMPT | get_role_llm("reviewer", state), {"draft": draft}, REVIEWER_FILTERED_FIELDS
+
+def _remember_reviewed(state, response):
+    if _PLACEHOLDER_MARKER in state["current_chapter_content"]:
+        return
+    if not state.get("chapter_reuse") or state["chapter_reuse"]["mode"] != "reuse":
+        remember_chapter(state["outline"][state["current_chapter_index"]], state["topic"], response.content,
+                         state.get("uploaded_context", ""))
+
+def _writer_inputs(state):
+    chapter = state["outline"][state["current_chapter_index"]]
+    notes = state["research_notes"]
+    # Top-k upload chunks for this chapter (see modules/retrieval.py)
+    u_context = retrieve_context(state["uploaded_context"], chapter, max_chars=3000)
+    return {
+        "chapter": chapter,
+        "notes": notes,
+        "u_context": u_context
+    }
+
+def _llm_config(state, agent):
+    # Tags the LLM run so streamed tokens can be attributed to a chapter in the UI
+    idx = state["current_chapter_index"]
+    return {"metadata": {"agent": agent, "chapter_index": idx, "chapter_title": state["outline"][idx]}}
+
+_PLACEHOLDER_MARKER = "[Content generation skipped"
+
+def _placeholder_chapter(current_chapter):
+    return AIMessage(content=f"# {current_chapter}\n\n[Content generation skipped due to content policy restrictions. Please review this chapter manually.]\n\nThis chapter focuses on {current_chapter}. Due to automated content filtering, detailed content could not be generated. Please refer to official sources and documentation for comprehensive information on this topic.")
+
+def _reviewer_update(state, response):
+    print(f"[REVIEWER] Review complete, {len(response.content)} chars", file=sys.stderr)
     
-    # Expanded list of words that might trigger false positives in technical/EV content
-    # Azure's content filter can be overly sensitive with certain words even in technical context
-    sensitive_patterns = [
-        # Common false positives in technical/business content
-        (r'\bsex\b', 'six'),  # Common typo/autocorrect
-        (r'\bsexy\b', 'attractive'),
-        (r'\bpenetration\b', 'market entry'),
-        (r'\bpenetrate\b', 'enter'),
-        (r'\bpenetrating\b', 'entering'),
-        (r'\bmating\b', 'connecting'),
-        (r'\bmate\b', 'connect'),
-        (r'\bintercourse\b', 'interaction'),
-        (r'\berotic\b', 'appealing'),
-        (r'\bseduction\b', 'attraction'),
-        (r'\bseduce\b', 'attract'),
-        (r'\bintimate\b', 'close'),
-        (r'\bintimacy\b', 'closeness'),
-        # Words that might appear in URLs or technical terms
-        (r'\bxxx\b', 'multiple'),
-        (r'\badult\b', 'mature'),
-    ]
+    # Get current chapter info for logging
+    current_idx = state["current_chapter_index"]
+    total_chapters = len(state["outline"])
+    current_chapter_title = state['outline'][current_idx] if current_idx < total_chapters else "UNKNOWN"
     
-    sanitized = text
-    replacements_made = []
+    print(f"[REVIEWER] Completing chapter {current_idx + 1}/{total_chapters}: {current_chapter_title}", file=sys.stderr)
     
-    for pattern, replacement in sensitive_patterns:
-        matches = re.findall(pattern, sanitized, flags=re.IGNORECASE)
-        if matches:
-            replacements_made.extend(matches)
-            sanitized = re.sub(pattern, replacement, sanitized, flags=re.IGNORECASE)
+    # Append to final document
+    updated_doc = state["final_document"] + f"\n\n## {current_chapter_title}\n\n" + response.content
     
-    if replacements_made:
-        print(f"[SANITIZE] Replaced potentially flagged words: {set(replacements_made)}", file=sys.stderr)
+    next_idx = current_idx + 1
+    print(f"[REVIEWER] Moving to next chapter index: {next_idx}/{total_chapters}", file=sys.stderr)
     
-    return sanitized
-
-# Initialize models with error handling
-print("[AGENTS] Initializing LLMs...", file=sys.stderr)
-try:
-    llm_writer = get_llm("gpt-5-mini")
-    print("[AGENTS] ✓ Writer LLM initialized (gpt-5-mini)", file=sys.stderr)
-except Exception as e:
-    print(f"[AGENTS] ✗ Failed to initialize Writer LLM: {e}", file=sys.stderr)
-    raise
-
-# Use GPT-5 Mini for reviewer since Claude is not properly configured
-print("[AGENTS] Using GPT-5 Mini for reviewer (Claude configuration issue)", file=sys.stderr)
-llm_reviewer = llm_writer
-
-try:
-    llm_researcher = get_llm("grok-4") # Use Grok for fast reasoning/search synthesis
-    print("[AGENTS] ✓ Researcher LLM initialized (grok-4)", file=sys.stderr)
-except Exception as e:
-    print(f"[AGENTS] ⚠ Grok failed to initialize, using GPT-5 Mini as fallback: {e}", file=sys.stderr)
-    llm_researcher = llm_writer  # Use GPT-5 Mini as fallback
-
-try:
-    llm_local = get_llm("llama3.2") # For formatting/outlining
-    print("[AGENTS] ✓ Local LLM initialized (llama3.2)", file=sys.stderr)
-except Exception as e:
-    print(f"[AGENTS] ⚠ Local LLM failed, using GPT-5 Mini as fallback: {e}", file=sys.stderr)
-    llm_local = llm_writer  # Use GPT-5 Mini as fallback
+    return {
+        "final_document": updated_doc, 
+        "current_chapter_index": next_idx
+    }
 
 def planner_agent(state):
     """Generates a detailed table of contents."""
     try:
         print("--- PLANNER AGENT ---", file=sys.stderr)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert Editor. Create a comprehensive 10-chapter outline for a professional report on: {topic}. Return ONLY the list of chapters separated by newlines. Maximum 15 chapters."),
-            ("user", "Context: {context}")
-        ])
-        chain = prompt | llm_local
-        response = chain.invoke({"topic": state["topic"], "context": state["uploaded_context"][:2000]})
-        chapters = [line.strip() for line in response.content.split("\n") if line.strip()]
-        
-        # Hard limit: max 20 chapters to prevent infinite loops
-        if len(chapters) > 20:
-            print(f"[PLANNER] WARNING: Generated {len(chapters)} chapters, limiting to 20", file=sys.stderr)
-            chapters = chapters[:20]
-        print(f"[PLANNER] Generated {len(chapters)} chapters", file=sys.stderr)
-        return {"outline": chapters, "current_chapter_index": 0, "final_document": ""}
+        chain = PLANNER_PROMPT | get_role_llm("planner")
+        response = chain.invoke(_planner_inputs(state))
+        return _planner_update(response)
     except Exception as e:
         print(f"[PLANNER ERROR] {str(e)}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
         raise
 
+def prefetch_research(state):
+    """Runs the searches for every chapter concurrently, right after planning."""
+    try:
+        outline = state["outline"]
+        indexes = pending_chapter_indexes(state)
+        print(f"--- RESEARCH PREFETCH: {len(indexes)} chapters ---", file=sys.stderr)
+        reuse_by_index = _lookup_reuse(state, indexes)
+        indexes = _chapters_to_search(reuse_by_index)
+        if not indexes:
+            return {"research_by_chapter": {}, "chapter_reuse_by_index": reuse_by_index}
+        
+        queries = [_research_query(outline[i]) for i in indexes]
+        with ThreadPoolExecutor(max_workers=min(RESEARCH_PREFETCH_WORKERS, len(queries))) as pool:
+            notes = list(pool.map(research_tool, queries))
+        
+        print(f"[RESEARCHER] Prefetched {sum(len(n) for n in notes)} chars for {len(notes)} chapters", file=sys.stderr)
+        return {"research_by_chapter": dict(zip(indexes, notes)), "chapter_reuse_by_index": reuse_by_index}
+    except Exception as e:
+        print(f"[RESEARCHER ERROR] Prefetch failed: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
 def researcher_agent(state):
-    """Search web for specific chapter data."""
+    """Search web for specific chapter data (a lookup when the prefetch stage already ran)."""
     try:
-        current_chapter = state["outline"][state["current_chapter_index"]]
+        current_idx = state["current_chapter_index"]
+        current_chapter = state["outline"][current_idx]
         print(f"--- RESEARCHER AGENT: {current_chapter} ---", file=sys.stderr)
         
-        # Search for latest info
-        search_data = web_search_tool(f"{current_chapter} statistics facts news")
+        reuse_by_index = state.get("chapter_reuse_by_index") or {}
+        if current_idx in reuse_by_index:
+            reuse = reuse_by_index[current_idx]
+        else:
+            reuse = _chapter_reuse(state, current_idx)
+        if reuse and reuse["mode"] == "reuse":
+            return {"research_notes": "", "chapter_reuse": reuse}
+        
+        search_data = (state.get("research_by_chapter") or {}).get(current_idx)
+        if search_data is None:
+            # Search for latest info
+            search_data = research_tool(_research_query(current_chapter))
         print(f"[RESEARCHER] Retrieved {len(search_data)} chars of research data", file=sys.stderr)
         
-        return {"research_notes": search_data}
+        return {"research_notes": search_data, "chapter_reuse": reuse}
     except Exception as e:
         print(f"[RESEARCHER ERROR] {str(e)}", file=sys.stderr)
         import traceback
@@ -119,44 +236,40 @@ def writer_agent(state):
         print("--- WRITER AGENT ---", file=sys.stderr)
         current_chapter = state["outline"][state["current_chapter_index"]]
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a professional technical writer. Write a detailed, factual chapter (approx 1000 words). Use the provided research notes. Focus on data from 2024-2025."),
-            ("user", "Chapter Title: {chapter}\n\nResearch Notes: {notes}\n\nUploaded Doc Context: {u_context}")
-        ])
+        if state.get("chapter_reuse"):
+            # Stored chapter from an earlier report; the reviewer refreshes it if needed
+            print(f"[WRITER] Using stored chapter for: {current_chapter}", file=sys.stderr)
+            return {"current_chapter_content": state["chapter_reuse"]["content"]}
         
         # We use GPT-5 Mini for the core writing
-        chain = prompt | llm_writer
+        chain = WRITER_PROMPT | get_role_llm("writer", state)
         print(f"[WRITER] Generating content for: {current_chapter}", file=sys.stderr)
         
-        # Try with original content first
+        # Send the original content unless the guard expects a rejection
+        guard = get_content_guard()
+        original = _writer_inputs(state)
+        inputs = guard.preflight("writer", original, WRITER_FILTERED_FIELDS)
         try:
-            response = chain.invoke({
-                "chapter": current_chapter, 
-                "notes": state["research_notes"],
-                "u_context": state["uploaded_context"][:3000]
-            })
+            response = chain.invoke(inputs, config=_llm_config(state, "writer"))
+            guard.record_pass("writer", inputs, WRITER_FILTERED_FIELDS)
         except Exception as content_error:
             # Check if it's Azure content filter error
-            if "content_filter" in str(content_error) or "ResponsibleAIPolicyViolation" in str(content_error):
-                print(f"[WRITER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
-                
-                # Sanitize potentially problematic content
-                sanitized_notes = sanitize_content(state["research_notes"])
-                sanitized_context = sanitize_content(state["uploaded_context"][:3000])
+            if is_content_filter_error(content_error):
+                presanitized = inputs is not original
+                guard.record_rejection("writer", original, WRITER_FILTERED_FIELDS, content_error, presanitized)
                 
                 try:
+                    if presanitized:
+                        # Sanitized content was already rejected, resending it would fail again
+                        raise content_error
+                    print(f"[WRITER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
                     # Retry with sanitized content
-                    response = chain.invoke({
-                        "chapter": current_chapter, 
-                        "notes": sanitized_notes,
-                        "u_context": sanitized_context
-                    })
+                    response = chain.invoke(sanitize_fields(original, WRITER_FILTERED_FIELDS), config=_llm_config(state, "writer"))
                     print(f"[WRITER] Retry successful after sanitization", file=sys.stderr)
                 except Exception as retry_error:
                     # If still fails, generate a placeholder chapter
                     print(f"[WRITER] Retry failed, generating placeholder chapter", file=sys.stderr)
-                    from langchain_core.messages import AIMessage
-                    response = AIMessage(content=f"# {current_chapter}\n\n[Content generation skipped due to content policy restrictions. Please review this chapter manually.]\n\nThis chapter focuses on {current_chapter}. Due to automated content filtering, detailed content could not be generated. Please refer to official sources and documentation for comprehensive information on this topic.")
+                    response = _placeholder_chapter(current_chapter)
             else:
                 raise
         
@@ -175,59 +288,200 @@ def reviewer_agent(state):
         print("--- REVIEWER AGENT ---", file=sys.stderr)
         draft = state["current_chapter_content"]
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a strict fact-checker. Review the draft. If it lacks data or has logic errors, correct them and rewrite the section. Ensure professional tone."),
-            ("user", "Draft: {draft}")
-        ])
+        if (state.get("chapter_reuse") or {}).get("mode") == "reuse":
+            print(f"[REVIEWER] Stored chapter {state['current_chapter_index'] + 1} is recent, keeping it as is", file=sys.stderr)
+            return _reviewer_update(state, AIMessage(content=draft))
         
-        # Claude reviews GPT's work
-        chain = prompt | llm_reviewer
+        # Claude reviews GPT's work (or refreshes a stored chapter with new research)
+        chain, original, fields = _reviewer_chain(state)
         print(f"[REVIEWER] Reviewing chapter {state['current_chapter_index'] + 1}", file=sys.stderr)
         
-        # Try with original content first
+        # Send the original content unless the guard expects a rejection
+        guard = get_content_guard()
+        inputs = guard.preflight("reviewer", original, fields)
+        reviewed = True
         try:
-            response = chain.invoke({"draft": draft})
+            response = chain.invoke(inputs, config=_llm_config(state, "reviewer"))
+            guard.record_pass("reviewer", inputs, fields)
         except Exception as content_error:
             # Check if it's Azure content filter error
-            if "content_filter" in str(content_error) or "ResponsibleAIPolicyViolation" in str(content_error):
-                print(f"[REVIEWER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
-                
-                # Sanitize potentially problematic content
-                sanitized_draft = sanitize_content(draft)
+            if is_content_filter_error(content_error):
+                presanitized = inputs is not original
+                guard.record_rejection("reviewer", original, fields, content_error, presanitized)
                 
                 try:
+                    if presanitized:
+                        # Sanitized content was already rejected, resending it would fail again
+                        raise content_error
+                    print(f"[REVIEWER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
                     # Retry with sanitized content
-                    response = chain.invoke({"draft": sanitized_draft})
+                    response = chain.invoke(sanitize_fields(original, fields), config=_llm_config(state, "reviewer"))
                     print(f"[REVIEWER] Retry successful after sanitization", file=sys.stderr)
                 except Exception as retry_error:
                     # If still fails, skip review and use original draft
                     print(f"[REVIEWER] Retry failed, using original draft without review", file=sys.stderr)
-                    from langchain_core.messages import AIMessage
                     response = AIMessage(content=draft)
+                    reviewed = False
             else:
                 raise
         
-        print(f"[REVIEWER] Review complete, {len(response.content)} chars", file=sys.stderr)
+        if reviewed:
+            _remember_reviewed(state, response)
+        return _reviewer_update(state, response)
+    except Exception as e:
+        print(f"[REVIEWER ERROR] {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
+# --- Async variants ---
+# Same behaviour as the agents above, but non-blocking (ainvoke), so one
+# event loop can multiplex many in-flight reports and LLM calls.
+
+async def aplanner_agent(state):
+    """Async variant of planner_agent."""
+    try:
+        print("--- PLANNER AGENT (async) ---", file=sys.stderr)
+        chain = PLANNER_PROMPT | get_role_llm("planner")
+        response = await chain.ainvoke(_planner_inputs(state))
+        return _planner_update(response)
+    except Exception as e:
+        print(f"[PLANNER ERROR] {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
+async def aprefetch_research(state):
+    """Async variant of prefetch_research (the search client is blocking, so searches run in worker threads)."""
+    try:
+        outline = state["outline"]
+        indexes = pending_chapter_indexes(state)
+        print(f"--- RESEARCH PREFETCH (async): {len(indexes)} chapters ---", file=sys.stderr)
+        reuse_by_index = await asyncio.to_thread(_lookup_reuse, state, indexes)
+        indexes = _chapters_to_search(reuse_by_index)
+        semaphore = asyncio.Semaphore(RESEARCH_PREFETCH_WORKERS)
+        
+        async def search(chapter):
+            async with semaphore:
+                return await asyncio.to_thread(research_tool, _research_query(chapter))
         
-        # Get current chapter info for logging
+        notes = await asyncio.gather(*(search(outline[i]) for i in indexes))
+        print(f"[RESEARCHER] Prefetched {sum(len(n) for n in notes)} chars for {len(notes)} chapters", file=sys.stderr)
+        return {"research_by_chapter": dict(zip(indexes, notes)), "chapter_reuse_by_index": reuse_by_index}
+    except Exception as e:
+        print(f"[RESEARCHER ERROR] Prefetch failed: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
+async def aresearcher_agent(state):
+    """Async variant of researcher_agent."""
+    try:
         current_idx = state["current_chapter_index"]
-        total_chapters = len(state["outline"])
-        current_chapter_title = state['outline'][current_idx] if current_idx < total_chapters else "UNKNOWN"
+        current_chapter = state["outline"][current_idx]
+        print(f"--- RESEARCHER AGENT (async): {current_chapter} ---", file=sys.stderr)
         
-        print(f"[REVIEWER] Completing chapter {current_idx + 1}/{total_chapters}: {current_chapter_title}", file=sys.stderr)
+        reuse_by_index = state.get("chapter_reuse_by_index") or {}
+        if current_idx in reuse_by_index:
+            reuse = reuse_by_index[current_idx]
+        else:
+            reuse = await asyncio.to_thread(_chapter_reuse, state, current_idx)
+        if reuse and reuse["mode"] == "reuse":
+            return {"research_notes": "", "chapter_reuse": reuse}
         
-        # Append to final document
-        updated_doc = state["final_document"] + f"\n\n## {current_chapter_title}\n\n" + response.content
+        search_data = (state.get("research_by_chapter") or {}).get(current_idx)
+        if search_data is None:
+            search_data = await asyncio.to_thread(research_tool, _research_query(current_chapter))
+        print(f"[RESEARCHER] Retrieved {len(search_data)} chars of research data", file=sys.stderr)
         
-        next_idx = current_idx + 1
-        print(f"[REVIEWER] Moving to next chapter index: {next_idx}/{total_chapters}", file=sys.stderr)
+        return {"research_notes": search_data, "chapter_reuse": reuse}
+    except Exception as e:
+        print(f"[RESEARCHER ERROR] {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
+async def awriter_agent(state):
+    """Async variant of writer_agent."""
+    try:
+        print("--- WRITER AGENT (async) ---", file=sys.stderr)
+        current_chapter = state["outline"][state["current_chapter_index"]]
+        if state.get("chapter_reuse"):
+            print(f"[WRITER] Using stored chapter for: {current_chapter}", file=sys.stderr)
+            return {"current_chapter_content": state["chapter_reuse"]["content"]}
+        chain = WRITER_PROMPT | get_role_llm("writer", state)
+        print(f"[WRITER] Generating content for: {current_chapter}", file=sys.stderr)
         
-        return {
-            "final_document": updated_doc, 
-            "current_chapter_index": next_idx
-        }
+        guard = get_content_guard()
+        original = _writer_inputs(state)
+        inputs = guard.preflight("writer", original, WRITER_FILTERED_FIELDS)
+        try:
+            response = await chain.ainvoke(inputs, config=_llm_config(state, "writer"))
+            guard.record_pass("writer", inputs, WRITER_FILTERED_FIELDS)
+        except Exception as content_error:
+            if is_content_filter_error(content_error):
+                presanitized = inputs is not original
+                guard.record_rejection("writer", original, WRITER_FILTERED_FIELDS, content_error, presanitized)
+                try:
+                    if presanitized:
+                        raise content_error
+                    print(f"[WRITER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
+                    response = await chain.ainvoke(sanitize_fields(original, WRITER_FILTERED_FIELDS), config=_llm_config(state, "writer"))
+                    print(f"[WRITER] Retry successful after sanitization", file=sys.stderr)
+                except Exception as retry_error:
+                    print(f"[WRITER] Retry failed, generating placeholder chapter", file=sys.stderr)
+                    response = _placeholder_chapter(current_chapter)
+            else:
+                raise
+        
+        print(f"[WRITER] Generated {len(response.content)} chars", file=sys.stderr)
+        
+        return {"current_chapter_content": response.content}
+    except Exception as e:
+        print(f"[WRITER ERROR] {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        raise
+
+async def areviewer_agent(state):
+    """Async variant of reviewer_agent."""
+    try:
+        print("--- REVIEWER AGENT (async) ---", file=sys.stderr)
+        draft = state["current_chapter_content"]
+        if (state.get("chapter_reuse") or {}).get("mode") == "reuse":
+            print(f"[REVIEWER] Stored chapter {state['current_chapter_index'] + 1} is recent, keeping it as is", file=sys.stderr)
+            return _reviewer_update(state, AIMessage(content=draft))
+        chain, original, fields = _reviewer_chain(state)
+        print(f"[REVIEWER] Reviewing chapter {state['current_chapter_index'] + 1}", file=sys.stderr)
+        
+        guard = get_content_guard()
+        inputs = guard.preflight("reviewer", original, fields)
+        reviewed = True
+        try:
+            response = await chain.ainvoke(inputs, config=_llm_config(state, "reviewer"))
+            guard.record_pass("reviewer", inputs, fields)
+        except Exception as content_error:
+            if is_content_filter_error(content_error):
+                presanitized = inputs is not original
+                guard.record_rejection("reviewer", original, fields, content_error, presanitized)
+                try:
+                    if presanitized:
+                        raise content_error
+                    print(f"[REVIEWER] Content filter triggered, sanitizing and retrying...", file=sys.stderr)
+                    response = await chain.ainvoke(sanitize_fields(original, fields), config=_llm_config(state, "reviewer"))
+                    print(f"[REVIEWER] Retry successful after sanitization", file=sys.stderr)
+                except Exception as retry_error:
+                    print(f"[REVIEWER] Retry failed, using original draft without review", file=sys.stderr)
+                    response = AIMessage(content=draft)
+                    reviewed = False
+            else:
+                raise
+        
+        if reviewed:
+            await asyncio.to_thread(_remember_reviewed, state, response)
+        return _reviewer_update(state, response)
     except Exception as e:
         print(f"[REVIEWER ERROR] {str(e)}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,38 @@
+import sys
+import asyncio
+import threading
+
+__all__ = ['get_loop', 'run_sync', 'iterate_sync']
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_loop():
+    """
+    Returns the process-wide event loop, running in a daemon thread.
+    All async report runs share it, so async resources bound to a loop
+    (like the pooled httpx.AsyncClient per Azure endpoint) stay valid.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="report-event-loop", daemon=True).start()
+            print("[AIO] Started shared event loop thread", file=sys.stderr)
+        return _loop
+
+def run_sync(coro):
+    """Runs a coroutine on the shared loop from synchronous code and returns its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+def iterate_sync(agen):
+    """Iterates an async generator from synchronous code; it keeps running on the shared loop."""
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
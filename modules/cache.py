@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+
+__all__ = ['DiskCache', 'hash_key', 'cache_path', 'CACHE_DIR']
+
+# All on-disk caches live under this directory (one SQLite file per cache)
+CACHE_DIR = os.getenv("EV_CACHE_DIR", ".cache")
+
+def cache_path(name: str) -> str:
+    """Returns the path of a cache file inside CACHE_DIR, creating the directory."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+def hash_key(*parts) -> str:
+    """Stable SHA-256 key over any number of string/bytes parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") distinct
+        digest.update(f"{len(part)}:".encode("ascii"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    SQLite-backed key/value store for bytes with a TTL and size-based LRU eviction.
+    Safe to share between threads; WAL mode lets several processes use one file.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = None, max_bytes: int = None, name: str = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds  # None = never expires
+        self.max_bytes = max_bytes  # None = unbounded
+        self.name = name or os.path.basename(path)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+            self._conn.commit()
+        print(f"[CACHE] Opened {self.name} at {path}", file=sys.stderr)
+
+    def get(self, key: str):
+        """Returns the cached bytes, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return bytes(value)
+
+    def set(self, key: str, value: bytes):
+        """Stores bytes under key, then evicts least recently used entries over max_bytes."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now)
+            )
+            self._stats["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+        print(f"[CACHE] Cleared {self.name}", file=sys.stderr)
+
+    def _evict(self):
+        # Caller holds the lock
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._stats["expired"] += cursor.rowcount
+
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._stats["evictions"] += evicted
+        print(f"[CACHE] {self.name}: evicted {evicted} entries to stay under {self.max_bytes:,} bytes", file=sys.stderr)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the current size on disk."""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "entries": entries,
+            "bytes": total,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        })
+        return stats
@@ -0,0 +1,249 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+
+from modules.cache import cache_path, hash_key
+from modules.incremental import normalize_title
+
+__all__ = ['ChapterStore', 'get_chapter_store', 'find_reusable_chapter', 'remember_chapter',
+           'shingles', 'minhash_signature', 'jaccard']
+
+# Reviewed chapters from earlier reports, looked up by chapter title and report
+# topic so overlapping reports ("Global EV market", "European EV market") can
+# reuse a chapter instead of researching and writing it again.
+CHAPTER_STORE_ENABLED = os.getenv("CHAPTER_STORE_ENABLED", "1").lower() not in ("0", "false", "no")
+CHAPTER_STORE_DB = os.getenv("CHAPTER_STORE_DB") or cache_path("chapters.sqlite3")
+# Same chapter title: share of title words in common
+CHAPTER_TITLE_SIMILARITY = float(os.getenv("CHAPTER_TITLE_SIMILARITY", "0.7"))
+# Reused verbatim: topic this similar and chapter at most this old
+CHAPTER_REUSE_SIMILARITY = float(os.getenv("CHAPTER_REUSE_SIMILARITY", "0.8"))
+CHAPTER_REUSE_DAYS = float(os.getenv("CHAPTER_REUSE_DAYS", "7"))
+# Refreshed (one review pass with new research): related topic and chapter at most this old.
+# Older chapters are dropped from the store.
+CHAPTER_REFRESH_SIMILARITY = float(os.getenv("CHAPTER_REFRESH_SIMILARITY", "0.3"))
+CHAPTER_REFRESH_DAYS = float(os.getenv("CHAPTER_REFRESH_DAYS", "30"))
+
+# MinHash signature size and LSH banding (BANDS * ROWS == SIGNATURE_SIZE). Two rows
+# per band makes titles with roughly half their words in common likely candidates.
+SIGNATURE_SIZE = 32
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20251)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(SIGNATURE_SIZE)]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and the of on in for to up by with from at as or vs its their our "
+    "generate create write produce comprehensive detailed report overview analysis".split()
+)
+
+def _tokens(text):
+    words = []
+    for word in _TOKEN_RE.findall((text or "").lower()):
+        if word in _STOPWORDS:
+            continue
+        # Light plural folding so "EVs" matches "EV", "Policies" matches "Policy"
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def shingles(text: str, size: int = 1) -> frozenset:
+    """Word shingles of a title or topic: single words, plus word pairs for size=2."""
+    words = _tokens(text)
+    grams = set(words)
+    if size > 1:
+        grams.update(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return frozenset(grams)
+
+def jaccard(a, b) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def minhash_signature(grams) -> list:
+    """MinHash signature of a shingle set (stable across processes)."""
+    if not grams:
+        return [_PRIME] * SIGNATURE_SIZE
+    hashed = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams]
+    return [min((a * h + b) % _PRIME for h in hashed) for a, b in _PERMUTATIONS]
+
+def _band_keys(signature):
+    return [hash_key(band, *signature[band * ROWS:(band + 1) * ROWS])[:16] for band in range(BANDS)]
+
+class ChapterStore:
+    """
+    SQLite store of reviewed chapters. Titles are indexed with MinHash LSH
+    bands (plus the exact normalized title), candidates are then compared by
+    exact Jaccard similarity of their title and topic shingles.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "reused": 0, "refreshed": 0, "stored": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chapters ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " title TEXT NOT NULL,"
+                " title_key TEXT NOT NULL,"
+                " title_shingles TEXT NOT NULL,"
+                " topic TEXT NOT NULL,"
+                " topic_shingles TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " context_hash TEXT NOT NULL DEFAULT '')"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chapters)")}
+            if "context_hash" not in columns:
+                # Rows from before uploads were tracked: their source is unknown, so never reused verbatim
+                self._conn.execute("ALTER TABLE chapters ADD COLUMN context_hash TEXT NOT NULL DEFAULT 'unknown'")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chapters_title_key ON chapters(title_key)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chapter_bands ("
+                " band_key TEXT NOT NULL,"
+                " chapter_id INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chapter_bands ON chapter_bands(band_key)")
+            self._conn.commit()
+        print(f"[CHAPTER STORE] Opened {path}", file=sys.stderr)
+
+    def add(self, title: str, topic: str, content: str, context_hash: str = "") -> int:
+        """
+        Stores a reviewed chapter body (without its "## title" heading) and prunes
+        expired ones. context_hash identifies the uploaded context it was written
+        from ("" for none).
+        """
+        title_grams = shingles(title)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO chapters (title, title_key, title_shingles, topic, topic_shingles, content, created_at, context_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (title, normalize_title(title), json.dumps(sorted(title_grams)), topic,
+                 json.dumps(sorted(shingles(topic, 2))), content, now, context_hash))
+            chapter_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO chapter_bands (band_key, chapter_id) VALUES (?, ?)",
+                                   [(key, chapter_id) for key in _band_keys(minhash_signature(title_grams))])
+            expired = now - CHAPTER_REFRESH_DAYS * 86400
+            self._conn.execute("DELETE FROM chapter_bands WHERE chapter_id IN (SELECT id FROM chapters WHERE created_at < ?)", (expired,))
+            self._conn.execute("DELETE FROM chapters WHERE created_at < ?", (expired,))
+            self._conn.commit()
+            self._stats["stored"] += 1
+        return chapter_id
+
+    def find(self, title: str, topic: str, context_hash: str = ""):
+        """
+        Best stored chapter for this title and topic, as a dict with "mode":
+        "reuse" (recent, same topic and uploaded context: use as is) or
+        "refresh" (older, related topic or other context: update with new
+        research), or None.
+        """
+        title_grams = shingles(title)
+        topic_grams = shingles(topic, 2)
+        band_keys = _band_keys(minhash_signature(title_grams))
+        placeholders = ",".join("?" * len(band_keys))
+        with self._lock:
+            self._stats["lookups"] += 1
+            rows = self._conn.execute(
+                "SELECT id, title, title_key, title_shingles, topic, topic_shingles, content, created_at, context_hash"
+                " FROM chapters WHERE title_key = ? OR id IN"
+                f" (SELECT chapter_id FROM chapter_bands WHERE band_key IN ({placeholders}))",
+                (normalize_title(title), *band_keys)).fetchall()
+
+        now = time.time()
+        best = None
+        for row in rows:
+            chapter_id, stored_title, title_key, stored_title_grams, stored_topic, stored_topic_grams, content, created_at, stored_context = row
+            title_similarity = 1.0 if title_key == normalize_title(title) else jaccard(title_grams, frozenset(json.loads(stored_title_grams)))
+            if title_similarity < CHAPTER_TITLE_SIMILARITY:
+                continue
+            topic_similarity = jaccard(topic_grams, frozenset(json.loads(stored_topic_grams)))
+            age_days = (now - created_at) / 86400
+            if (topic_similarity >= CHAPTER_REUSE_SIMILARITY and age_days <= CHAPTER_REUSE_DAYS
+                    and stored_context == context_hash):
+                mode = "reuse"
+            elif topic_similarity >= CHAPTER_REFRESH_SIMILARITY and age_days <= CHAPTER_REFRESH_DAYS:
+                mode = "refresh"
+            else:
+                continue
+            # Prefer verbatim reuse, then the closest topic, then the newest
+            rank = (mode == "reuse", round(topic_similarity, 3), round(title_similarity, 3), created_at)
+            if best is None or rank > best[0]:
+                best = (rank, {"id": chapter_id, "mode": mode, "title": stored_title, "topic": stored_topic,
+                               "content": content, "title_similarity": title_similarity,
+                               "topic_similarity": topic_similarity, "age_days": age_days})
+        if best is None:
+            return None
+        with self._lock:
+            self._stats["reused" if best[1]["mode"] == "reuse" else "refreshed"] += 1
+        return best[1]
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM chapters").fetchone()[0]
+            return {**self._stats, "entries": entries}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chapter_bands")
+            self._conn.execute("DELETE FROM chapters")
+            self._conn.commit()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_chapter_store():
+    """Returns the process-wide chapter store, or None when CHAPTER_STORE_ENABLED=0."""
+    global _store
+    if not CHAPTER_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ChapterStore(CHAPTER_STORE_DB)
+        return _store
+
+def _context_hash(uploaded_context):
+    return hash_key(uploaded_context) if uploaded_context else ""
+
+def find_reusable_chapter(title: str, topic: str, uploaded_context: str = ""):
+    """
+    ChapterStore.find on the shared store; None if the store is disabled or
+    fails. Runs with uploaded documents don't use the store: their chapters
+    must reflect (and only they may see) those documents.
+    """
+    store = get_chapter_store()
+    if store is None or uploaded_context:
+        return None
+    try:
+        match = store.find(title, topic, _context_hash(uploaded_context))
+    except Exception as e:
+        print(f"[CHAPTER STORE WARNING] Lookup failed: {e}", file=sys.stderr)
+        return None
+    if match:
+        print(f"[CHAPTER STORE] {match['mode'].capitalize()} stored chapter for '{title}' "
+              f"(from '{match['topic'][:50]}', {match['age_days']:.1f} days old, "
+              f"topic similarity {match['topic_similarity']:.2f})", file=sys.stderr)
+    return match
+
+def remember_chapter(title: str, topic: str, content: str, uploaded_context: str = ""):
+    """Adds a reviewed chapter to the shared store (no-op if disabled or written from uploads)."""
+    store = get_chapter_store()
+    if store is None or not content or uploaded_context:
+        return
+    try:
+        store.add(title, topic, content, _context_hash(uploaded_context))
+    except Exception as e:
+        print(f"[CHAPTER STORE WARNING] Could not store chapter: {e}", file=sys.stderr)
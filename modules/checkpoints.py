@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import threading
+
+from modules.cache import cache_path
+
+__all__ = ['get_async_checkpointer', 'record_run', 'update_run_status', 'get_run', 'list_runs']
+
+# Graph checkpoints (LangGraph state after every node) and the run index live
+# next to the other local caches unless overridden.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB") or cache_path("checkpoints.sqlite3")
+RUNS_DB = os.getenv("RUNS_DB") or cache_path("runs.sqlite3")
+
+_saver = None
+_saver_lock = asyncio.Lock()
+
+async def get_async_checkpointer():
+    """
+    Returns the process-wide AsyncSqliteSaver. Its aiosqlite connection is bound
+    to the event loop that created it, so only call this from the shared loop
+    in modules.aio.
+    """
+    global _saver
+    async with _saver_lock:
+        if _saver is None:
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+            conn = await aiosqlite.connect(CHECKPOINT_DB)
+            saver = AsyncSqliteSaver(conn)
+            await saver.setup()
+            _saver = saver
+            print(f"[CHECKPOINTS] Using checkpoint store {CHECKPOINT_DB}", file=sys.stderr)
+        return _saver
+
+# --- Run index: which runs exist, their mode and whether they finished ---
+
+_runs_conn = None
+_runs_lock = threading.Lock()
+
+def _runs():
+    # Caller holds _runs_lock
+    global _runs_conn
+    if _runs_conn is None:
+        _runs_conn = sqlite3.connect(RUNS_DB, check_same_thread=False, timeout=30)
+        _runs_conn.row_factory = sqlite3.Row
+        _runs_conn.execute("PRAGMA journal_mode=WAL")
+        _runs_conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " topic TEXT NOT NULL,"
+            " parallel INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        _runs_conn.commit()
+    return _runs_conn
+
+def record_run(run_id: str, topic: str, parallel: bool):
+    """Registers a new run as 'running'."""
+    now = time.time()
+    with _runs_lock:
+        conn = _runs()
+        conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, topic, parallel, status, error, created_at, updated_at)"
+            " VALUES (?, ?, ?, 'running', NULL, ?, ?)",
+            (run_id, topic, int(bool(parallel)), now, now)
+        )
+        conn.commit()
+
+def update_run_status(run_id: str, status: str, error: str = None):
+    """Marks a run 'running', 'completed' or 'failed'."""
+    with _runs_lock:
+        conn = _runs()
+        conn.execute("UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE run_id = ?",
+                     (status, error, time.time(), run_id))
+        conn.commit()
+
+def get_run(run_id: str):
+    """Returns the run as a dict, or None."""
+    with _runs_lock:
+        row = _runs().execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return _row_to_run(row) if row else None
+
+def list_runs(status: str = None, limit: int = 20):
+    """Most recent runs first, optionally filtered by status (or 'unfinished')."""
+    query, params = "SELECT * FROM runs", []
+    if status == "unfinished":
+        query += " WHERE status != 'completed'"
+    elif status:
+        query += " WHERE status = ?"
+        params.append(status)
+    query += " ORDER BY updated_at DESC LIMIT ?"
+    params.append(limit)
+    with _runs_lock:
+        rows = _runs().execute(query, params).fetchall()
+    return [_row_to_run(row) for row in rows]
+
+def _row_to_run(row):
+    run = dict(row)
+    run["parallel"] = bool(run["parallel"])
+    return run
@@ -0,0 +1,236 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import tempfile
+import threading
+
+from modules.cache import hash_key, cache_path
+from modules.sanitizer import get_sanitizer, sanitize_content
+
+__all__ = ['ContentGuard', 'get_content_guard', 'sanitize_fields']
+
+CONTENT_GUARD_ENABLED = os.getenv("CONTENT_GUARD_ENABLED", "1").lower() not in ("0", "false", "no")
+CONTENT_GUARD_PATH = os.getenv("CONTENT_GUARD_PATH") or cache_path("content_guard.json")
+# Words that are sanitized before the first call even without any history
+CONTENT_GUARD_PATTERNS = [w.strip().lower() for w in
+                          os.getenv("CONTENT_GUARD_PATTERNS", "sex,sexy,erotic,intercourse,seduction,xxx").split(",")
+                          if w.strip()]
+# A word becomes a learned trigger after this many rejected inputs containing it...
+CONTENT_GUARD_MIN_REJECTIONS = int(os.getenv("CONTENT_GUARD_MIN_REJECTIONS", "2"))
+# ...as long as at least this share of the inputs containing it were rejected
+CONTENT_GUARD_MIN_RATE = float(os.getenv("CONTENT_GUARD_MIN_RATE", "0.2"))
+# Learned triggers and rejected inputs expire this long after their last rejection, so
+# words that stop being rejected are sent as is again (and their counts start over)
+CONTENT_GUARD_TRIGGER_DAYS = float(os.getenv("CONTENT_GUARD_TRIGGER_DAYS", "7"))
+# Rejected input fingerprints kept (oldest dropped first)
+CONTENT_GUARD_MAX_INPUTS = int(os.getenv("CONTENT_GUARD_MAX_INPUTS", "1000"))
+# Pass counts are written back at most this often; rejections are written immediately
+CONTENT_GUARD_SAVE_SECONDS = 30.0
+
+_CATEGORY_RE = re.compile(r"""['"](\w+)['"]\s*:\s*\{\s*['"]filtered['"]\s*:\s*True""", re.IGNORECASE)
+
+def sanitize_fields(inputs: dict, fields) -> dict:
+    """Copy of a prompt input dict with the given fields sanitized."""
+    return {key: sanitize_content(value) if key in fields else value for key, value in inputs.items()}
+
+class ContentGuard:
+    """
+    Local pre-flight check against Azure's content filter, so inputs that are
+    likely to be rejected are sanitized before the first call instead of after
+    a full (up to 120 s) rejected round trip.
+
+    An input is pre-sanitized if it contains a word from CONTENT_GUARD_PATTERNS,
+    a learned trigger (a sanitizer word that keeps showing up in rejected
+    inputs), or if the exact same input was rejected before. Every outcome
+    updates the per-word rejected/passed counts, so the rule set improves with
+    use. Learned triggers expire trigger_ttl seconds after their last
+    rejection: sanitized words never collect passes, so this is how a wrong
+    trigger drops out. The state is kept in a JSON file under the cache directory.
+    """
+
+    def __init__(self, path: str = None, patterns=(), min_rejections: int = 2, min_rate: float = 0.2,
+                 max_inputs: int = 1000, trigger_ttl: float = 7 * 86400):
+        self.path = path
+        self.patterns = set(patterns)
+        self.min_rejections = min_rejections
+        self.min_rate = min_rate
+        self.max_inputs = max_inputs
+        self.trigger_ttl = trigger_ttl
+        self.words = {}  # word -> {"rejected": n, "passed": n, "last_rejected": timestamp}
+        self.inputs = {}  # fingerprint -> {"agent", "rejections", "categories", "words", "last_rejected"}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._stats = {"checked": 0, "presanitized": 0, "rejections": 0, "rejected_after_presanitize": 0}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.words = data.get("words", {})
+            self.inputs = data.get("inputs", {})
+            # Files written before expiry existed: give their rejections a fresh window
+            loaded_at = time.time()
+            for counts in self.words.values():
+                if counts.get("rejected"):
+                    counts.setdefault("last_rejected", loaded_at)
+            print(f"[CONTENT GUARD] Loaded {len(self.words)} word stats and {len(self.inputs)} rejected inputs", file=sys.stderr)
+        except Exception as e:
+            print(f"[CONTENT GUARD WARNING] Could not read {self.path}: {e}", file=sys.stderr)
+
+    def save(self):
+        """Writes the learned state to disk (atomically) if it changed."""
+        if not self.path:
+            return
+        # One writer at a time, so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps({"words": self.words, "inputs": self.inputs}, indent=1)
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            tmp = None
+            try:
+                # Unique temp file next to the target (other processes may be saving too)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                           prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                print(f"[CONTENT GUARD WARNING] Could not write {self.path}: {e}", file=sys.stderr)
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+
+    @staticmethod
+    def _fingerprint(agent, texts):
+        return hash_key(agent, *texts)
+
+    def _expired(self, entry, now):
+        return now - entry.get("last_rejected", 0) > self.trigger_ttl
+
+    def _is_trigger(self, word, now):
+        if word in self.patterns:
+            return True
+        counts = self.words.get(word)
+        if not counts or counts["rejected"] < self.min_rejections or self._expired(counts, now):
+            return False
+        return counts["rejected"] / (counts["rejected"] + counts["passed"]) >= self.min_rate
+
+    def triggers(self, agent: str, *texts) -> list:
+        """Reasons these texts are expected to be rejected (empty = send as is)."""
+        found = set()
+        for text in texts:
+            found |= get_sanitizer().find(text)
+        now = time.time()
+        with self._lock:
+            self._stats["checked"] += 1
+            reasons = sorted(word for word in found if self._is_trigger(word, now))
+            entry = self.inputs.get(self._fingerprint(agent, texts))
+            if entry and not self._expired(entry, now):
+                reasons.append("previously rejected input")
+        return reasons
+
+    def preflight(self, agent: str, inputs: dict, fields) -> dict:
+        """
+        Returns inputs unchanged if they look safe, otherwise a copy with the
+        given fields sanitized (check with `result is not inputs`).
+        """
+        reasons = self.triggers(agent, *(inputs[f] for f in fields))
+        if not reasons:
+            return inputs
+        with self._lock:
+            self._stats["presanitized"] += 1
+        print(f"[CONTENT GUARD] Sanitizing {agent} input before sending ({', '.join(reasons)})", file=sys.stderr)
+        return sanitize_fields(inputs, fields)
+
+    def record_pass(self, agent: str, inputs: dict, fields):
+        """Records inputs that were accepted (their words count against being triggers)."""
+        found = set()
+        for field in fields:
+            found |= get_sanitizer().find(inputs[field])
+        if not found:
+            return
+        with self._lock:
+            for word in found:
+                self.words.setdefault(word, {"rejected": 0, "passed": 0})["passed"] += 1
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= CONTENT_GUARD_SAVE_SECONDS
+        if due:
+            self.save()
+
+    def record_rejection(self, agent: str, inputs: dict, fields, error: Exception = None, presanitized: bool = False):
+        """Records original (unsanitized) inputs that Azure's content filter rejected."""
+        texts = [inputs[f] for f in fields]
+        found = set()
+        for text in texts:
+            found |= get_sanitizer().find(text)
+        categories = sorted(set(_CATEGORY_RE.findall(str(error)))) if error is not None else []
+        key = self._fingerprint(agent, texts)
+        now = time.time()
+        with self._lock:
+            self._stats["rejections"] += 1
+            if presanitized:
+                self._stats["rejected_after_presanitize"] += 1
+            for word in found:
+                counts = self.words.setdefault(word, {"rejected": 0, "passed": 0})
+                if counts["rejected"] and self._expired(counts, now):
+                    # Expired trigger rejected again: judge it on recent outcomes only
+                    counts.update(rejected=0, passed=0)
+                counts["rejected"] += 1
+                counts["last_rejected"] = now
+            entry = self.inputs.pop(key, None) or {"agent": agent, "rejections": 0}
+            entry.update(rejections=entry["rejections"] + 1, categories=categories, words=sorted(found),
+                         chars=sum(len(t or "") for t in texts), last_rejected=now)
+            self.inputs[key] = entry  # re-inserted last, so the oldest entries are dropped first
+            while len(self.inputs) > self.max_inputs:
+                self.inputs.pop(next(iter(self.inputs)))
+            self._dirty = True
+        print(f"[CONTENT GUARD] Recorded {agent} rejection (categories: {', '.join(categories) or 'unknown'}; "
+              f"words: {', '.join(sorted(found)) or 'none known'})", file=sys.stderr)
+        self.save()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            learned = sorted(w for w in self.words if w not in self.patterns and self._is_trigger(w, now))
+            return {**self._stats, "learned_triggers": learned, "rejected_inputs": len(self.inputs)}
+
+class _DisabledGuard(ContentGuard):
+    """Sends everything as is (CONTENT_GUARD_ENABLED=0); still sanitizes on rejection."""
+
+    def __init__(self):
+        super().__init__(path=None)
+
+    def triggers(self, agent, *texts):
+        return []
+
+    def record_pass(self, agent, inputs, fields):
+        pass
+
+_guard = None
+_guard_lock = threading.Lock()
+
+def get_content_guard() -> ContentGuard:
+    """Returns the process-wide content guard, loading its learned state once."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                if CONTENT_GUARD_ENABLED:
+                    _guard = ContentGuard(CONTENT_GUARD_PATH, patterns=CONTENT_GUARD_PATTERNS,
+                                          min_rejections=CONTENT_GUARD_MIN_REJECTIONS,
+                                          min_rate=CONTENT_GUARD_MIN_RATE, max_inputs=CONTENT_GUARD_MAX_INPUTS,
+                                          trigger_ttl=CONTENT_GUARD_TRIGGER_DAYS * 86400)
+                    atexit.register(_guard.save)
+                else:
+                    _guard = _DisabledGuard()
+    return _guard
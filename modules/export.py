@@ -0,0 +1,233 @@
+import io
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+from modules.cache import hash_key
+
+__all__ = ['markdown_to_docx', 'get_docx_bytes', 'document_key', 'DOCX_MIME']
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Rendered documents kept in memory (shared by all sessions), least recently used dropped first
+EXPORT_CACHE_ENTRIES = int(os.getenv("EXPORT_CACHE_ENTRIES", "16"))
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# **bold**, __bold__, *italic*, `code`, [label](url)
+_INLINE_RE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__|(?<![\w*])\*(?![\s*])(.+?)(?<!\s)\*(?![\w*])|`([^`]+)`|\[([^\]]+)\]\(([^)\s]+)\)")
+
+def _add_inline(paragraph, text):
+    """Adds text to a paragraph as runs, turning inline Markdown into formatting."""
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()])
+        bold, bold_alt, italic, code, label, url = match.groups()
+        if bold is not None or bold_alt is not None:
+            paragraph.add_run(bold if bold is not None else bold_alt).bold = True
+        elif italic is not None:
+            paragraph.add_run(italic).italic = True
+        elif code is not None:
+            paragraph.add_run(code).font.name = "Courier New"
+        else:
+            paragraph.add_run(f"{label} ({url})")
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:])
+
+def _table_cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+def _add_table(doc, rows):
+    header, body = rows[0], rows[1:]
+    columns = max(len(row) for row in rows)
+    table = doc.add_table(rows=len(rows), cols=columns)
+    table.style = "Table Grid"
+    for r, row in enumerate([header] + body):
+        for c in range(columns):
+            paragraph = table.cell(r, c).paragraphs[0]
+            _add_inline(paragraph, row[c] if c < len(row) else "")
+            if r == 0:
+                for run in paragraph.runs:
+                    run.bold = True
+
+def _number_list_item(doc, paragraph, lists, depth, number):
+    """
+    Gives a "List Number" paragraph its own numbering instance when it starts
+    a list, so every list counts from its first marker instead of continuing
+    the style's single document-wide count.
+    """
+    current = lists.get(depth)
+    if current is None or (number == 1 and current["last"] > 1):
+        # A fresh w:num on the style's abstract numbering, restarted at the first marker
+        numbering = doc.part.numbering_part.element
+        style_num = numbering.num_having_numId(paragraph.style.element.pPr.numPr.numId.val)
+        num = numbering.add_num(style_num.abstractNumId.val)
+        num.add_lvlOverride(ilvl=0).add_startOverride(number)
+        current = lists[depth] = {"num_id": num.numId, "last": number}
+    current["last"] = number
+    num_pr = paragraph._p.get_or_add_pPr().get_or_add_numPr()
+    num_pr.get_or_add_ilvl().val = 0
+    num_pr.get_or_add_numId().val = current["num_id"]
+
+def markdown_to_docx(markdown: str, title: str = "EV Report 2025", metadata=()) -> bytes:
+    """
+    Renders a Markdown report as a .docx: headings, paragraphs, bullet and
+    numbered lists (nested by indentation), pipe tables, block quotes, code
+    blocks and **bold** / *italic* / `code` inline formatting.
+    metadata lines go under the title, e.g. "Generated: ..." and "Topic: ...".
+    """
+    from docx import Document
+
+    doc = Document()
+    heading = doc.add_heading(title, 0)
+    heading.alignment = 1  # Center alignment
+    for line in metadata:
+        doc.add_paragraph(line)
+    if metadata:
+        doc.add_paragraph("_" * 50)
+
+    lines = (markdown or "").split("\n")
+    paragraph_lines = []
+    current = None  # last list item, for continuation lines
+    lists = {}  # depth -> numbering of the open numbered list
+
+    def flush():
+        if paragraph_lines:
+            _add_inline(doc.add_paragraph(), " ".join(paragraph_lines))
+            paragraph_lines.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        if not stripped:
+            flush()
+            current = None
+            i += 1
+            continue
+
+        if _FENCE_RE.match(line):
+            flush()
+            fence = _FENCE_RE.match(line).group(1)
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            paragraph = doc.add_paragraph()
+            paragraph.add_run("\n".join(code)).font.name = "Courier New"
+            current = None
+            lists.clear()
+            i += 1
+            continue
+
+        match = _HEADING_RE.match(stripped)
+        if match:
+            flush()
+            doc.add_heading(match.group(2), level=len(match.group(1)))
+            current = None
+            lists.clear()
+            i += 1
+            continue
+
+        if stripped.startswith("|") and i + 1 < len(lines) and _TABLE_SEPARATOR_RE.match(lines[i + 1]):
+            flush()
+            rows = [_table_cells(line)]
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(_table_cells(lines[i]))
+                i += 1
+            _add_table(doc, rows)
+            current = None
+            lists.clear()
+            continue
+
+        if _RULE_RE.match(line):
+            flush()
+            doc.add_paragraph("_" * 50)
+            current = None
+            lists.clear()
+            i += 1
+            continue
+
+        match = _LIST_RE.match(line)
+        if match:
+            flush()
+            indent, marker, text = match.groups()
+            depth = min(len(indent.expandtabs(4)) // 2, 2)
+            style = "List Bullet" if marker in "-*+" else "List Number"
+            current = doc.add_paragraph(style=style if depth == 0 else f"{style} {depth + 1}")
+            # A new parent item (or a switch to bullets) ends the lists nested below it
+            for level in [d for d in lists if d > depth or (d == depth and style == "List Bullet")]:
+                del lists[level]
+            if style == "List Number":
+                _number_list_item(doc, current, lists, depth, int(marker[:-1]))
+            _add_inline(current, text)
+            i += 1
+            continue
+
+        if stripped.startswith(">"):
+            flush()
+            quote = []
+            while i < len(lines) and lines[i].strip().startswith(">"):
+                quote.append(lines[i].strip()[1:].strip())
+                i += 1
+            _add_inline(doc.add_paragraph(style="Quote"), " ".join(q for q in quote if q))
+            current = None
+            lists.clear()
+            continue
+
+        if current is not None and line[:1].isspace():
+            # Wrapped text of the previous list item
+            _add_inline(current, " " + stripped)
+        else:
+            current = None
+            lists.clear()
+            paragraph_lines.append(stripped)
+        i += 1
+    flush()
+
+    bio = io.BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+_rendered = OrderedDict()  # document key -> docx bytes
+_rendered_lock = threading.Lock()
+
+def document_key(markdown: str, title: str = "EV Report 2025", metadata=()) -> str:
+    """Cache key of a rendered document (changes whenever its content does)."""
+    return hash_key(markdown or "", title, *metadata)
+
+def get_docx_bytes(markdown: str, title: str = "EV Report 2025", metadata=()) -> bytes:
+    """markdown_to_docx, rendered once per distinct document and served from memory afterwards."""
+    key = document_key(markdown, title, metadata)
+    with _rendered_lock:
+        data = _rendered.get(key)
+        if data is not None:
+            _rendered.move_to_end(key)
+            return data
+
+    started = time.perf_counter()
+    data = markdown_to_docx(markdown, title, metadata)
+    print(f"[EXPORT] Rendered DOCX ({len(markdown or ''):,} chars → {len(data):,} bytes) "
+          f"in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    with _rendered_lock:
+        _rendered[key] = data
+        while len(_rendered) > EXPORT_CACHE_ENTRIES:
+            _rendered.popitem(last=False)
+    return data
@@ -0,0 +1,99 @@
+import re
+import sys
+
+__all__ = ['normalize_title', 'split_document_chapters', 'plan_incremental', 'build_incremental_state']
+
+_NUMBERING_RE = re.compile(r"^\s*(?:[#*\->]+\s*)?(?:chapter\s+)?(?:\d{1,2}(?:\.\d+)*[.):\-]?|[ivxlc]+[.):\-])\s+", re.IGNORECASE)
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+def normalize_title(title: str) -> str:
+    """Comparison key for outline entries: numbering, markup, case and punctuation are ignored."""
+    title = _NUMBERING_RE.sub("", title.strip(), count=1)
+    return _NON_WORD_RE.sub(" ", title.lower()).strip()
+
+def _section_heading(title):
+    # Same framing the reviewer uses when it appends a chapter
+    return f"\n\n## {title}\n\n"
+
+def split_document_chapters(document: str, outline):
+    """
+    Splits a generated report back into its chapters. The reviewer frames every
+    chapter as "\\n\\n## {title}\\n\\n{content}", and chapter bodies may contain
+    their own "##" headings, so the outline is used to find the boundaries.
+    Returns [{"index", "title", "content"}] for the chapters found, in order.
+    """
+    starts = []
+    position = 0
+    for idx, title in enumerate(outline):
+        found = document.find(_section_heading(title), position)
+        if found < 0:
+            print(f"[INCREMENTAL] Chapter {idx + 1} not found in previous document: {title}", file=sys.stderr)
+            continue
+        starts.append((found, idx, title))
+        position = found + len(_section_heading(title))
+
+    sections = []
+    for n, (start, idx, title) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(document)
+        sections.append({"index": idx, "title": title, "content": document[start:end]})
+    return sections
+
+def plan_incremental(previous_sections, new_outline, refresh=()):
+    """
+    Diffs a new outline against the chapters of a previous run.
+    Chapters whose (normalized) title already exists are reused verbatim, moved
+    to their new position; new or renamed chapters, and those listed in refresh
+    (titles or new indexes), are marked for regeneration.
+    Returns (reused sections, indexes to regenerate).
+    """
+    previous = {}
+    for section in previous_sections:
+        previous.setdefault(normalize_title(section["title"]), section)
+    refresh_keys = {normalize_title(r) for r in refresh if isinstance(r, str)}
+    refresh_indexes = {r for r in refresh if isinstance(r, int)}
+
+    reused, pending = [], []
+    for idx, title in enumerate(new_outline):
+        key = normalize_title(title)
+        section = previous.pop(key, None)
+        if section is None or key in refresh_keys or idx in refresh_indexes:
+            pending.append(idx)
+            continue
+        # Re-frame under the new title so cosmetic edits (numbering, case) show up
+        body = section["content"]
+        old_heading = _section_heading(section["title"])
+        if body.startswith(old_heading):
+            body = body[len(old_heading):]
+        reused.append({"index": idx, "title": title, "content": _section_heading(title) + body})
+    return reused, pending
+
+def build_incremental_state(base_state, previous_document, previous_outline, new_outline, refresh=()):
+    """
+    Builds the input state for an incremental run of the parallel graph: the
+    outline is fixed, reused chapters are pre-seeded into chapter_sections and
+    only the pending chapters are researched, written and reviewed.
+    base_state supplies topic and uploaded_context.
+    """
+    sections = split_document_chapters(previous_document or "", previous_outline or [])
+    reused, pending = plan_incremental(sections, new_outline, refresh)
+    # Chapters the user asked to rewrite must not come back from the chapter store
+    refresh_keys = {normalize_title(r) for r in refresh if isinstance(r, str)}
+    forced = [idx for idx, title in enumerate(new_outline)
+              if idx in refresh or normalize_title(title) in refresh_keys]
+    print(f"[INCREMENTAL] Reusing {len(reused)} chapters, regenerating {len(pending)} of {len(new_outline)}", file=sys.stderr)
+    return {
+        "topic": base_state.get("topic", ""),
+        "uploaded_context": base_state.get("uploaded_context", ""),
+        "outline": list(new_outline),
+        "current_chapter_index": 0,
+        "current_chapter_content": "",
+        "research_notes": "",
+        "research_by_chapter": {},
+        "chapter_reuse_by_index": {},
+        "reviews": "",
+        "final_document": "",
+        "chapter_sections": reused,
+        "pending_chapters": pending,
+        "no_reuse_chapters": forced,
+        "writer_model": base_state.get("writer_model"),
+    }
@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+__all__ = [
+    'iter_pdf_pages', 'iter_text_pages', 'iter_upload_pages', 'upload_kind', 'PDF_AVAILABLE',
+    'extract_pdf_range', 'extract_uploads', 'INGEST_WORKERS', 'PDF_PAGES_PER_TASK',
+]
+
+# Worker processes used for PDF extraction (1 = extract on the calling thread)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Big PDFs are split into page ranges of this size so one file can use several cores
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    print("[INGEST WARNING] pypdf not available, PDF uploads will be skipped", file=sys.stderr)
+    PdfReader = None
+    PDF_AVAILABLE = False
+
+def upload_kind(name: str, mime_type: str = None):
+    """Returns "pdf", "txt" or None (unsupported) for an uploaded file."""
+    name = (name or "").lower()
+    if mime_type == "application/pdf" or name.endswith(".pdf"):
+        return "pdf"
+    if mime_type == "text/plain" or name.endswith(".txt"):
+        return "txt"
+    return None
+
+def iter_pdf_pages(data: bytes):
+    """Yields the text of each page of an in-memory PDF, one page at a time."""
+    reader = PdfReader(io.BytesIO(data))
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+def iter_text_pages(data: bytes):
+    """Yields a plain-text upload as a single page (UTF-8, undecodable bytes replaced)."""
+    yield data.decode("utf-8-sig", errors="replace")
+
+def iter_upload_pages(name: str, data: bytes, mime_type: str = None):
+    """Yields the pages of one uploaded file; nothing for unsupported types."""
+    kind = upload_kind(name, mime_type)
+    if kind == "pdf":
+        if not PDF_AVAILABLE:
+            print(f"[INGEST] Skipping {name}: pypdf not installed", file=sys.stderr)
+            return
+        yield from iter_pdf_pages(data)
+    elif kind == "txt":
+        yield from iter_text_pages(data)
+    else:
+        print(f"[INGEST] Skipping unsupported file type: {name} ({mime_type})", file=sys.stderr)
+
+def extract_pdf_range(data: bytes, start: int, stop: int):
+    """
+    Extracts pages [start, stop) of a PDF. Runs in a worker process, so it only
+    takes and returns picklable values: (page texts, CPU seconds spent).
+    """
+    started = time.process_time()
+    reader = PdfReader(io.BytesIO(data))
+    pages = [(reader.pages[i].extract_text() or "") for i in range(start, min(stop, len(reader.pages)))]
+    return pages, time.process_time() - started
+
+def _pdf_page_count(data: bytes) -> int:
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool(max_workers):
+    # One pool per process, reused across uploads (and Streamlit reruns)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            print(f"[INGEST] Started process pool with {max_workers} workers", file=sys.stderr)
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _extract_serially(name, data, mime_type):
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    error = None
+    try:
+        pages = list(iter_upload_pages(name, data, mime_type))
+        if upload_kind(name, mime_type) == "pdf" and not PDF_AVAILABLE:
+            error = "pypdf not installed"
+    except Exception as e:
+        # One unreadable file must not fail the whole upload
+        print(f"[INGEST] Error processing file {name}: {e}", file=sys.stderr)
+        pages, error = [], str(e)
+    record = {"name": name, "pages": pages, "seconds": time.perf_counter() - started,
+              "cpu_seconds": time.process_time() - cpu_started}
+    if error:
+        record["error"] = error
+    return record
+
+def extract_uploads(files, max_workers: int = None, pages_per_task: int = None):
+    """
+    Extracts text from uploads given as (name, bytes, mime_type) tuples.
+    PDFs are split into page ranges and dispatched to a process pool; text
+    files are decoded inline. Returns one record per file, in input order:
+    {"name", "pages", "seconds", "cpu_seconds"}, with pages in document order.
+    Files that could not be (fully) extracted also have an "error" message;
+    their pages are empty or partial.
+    """
+    max_workers = INGEST_WORKERS if max_workers is None else max_workers
+    pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+    files = list(files)
+    
+    pdf_indexes = [i for i, (name, _, mime_type) in enumerate(files)
+                   if upload_kind(name, mime_type) == "pdf" and PDF_AVAILABLE]
+    if max_workers <= 1 or not pdf_indexes:
+        return [_extract_serially(*f) for f in files]
+    
+    records = [None] * len(files)
+    pool = _get_pool(max_workers)
+    try:
+        # Submit every range of every PDF first so all files overlap
+        jobs = {}
+        for i in pdf_indexes:
+            name, data, _ = files[i]
+            try:
+                page_count = _pdf_page_count(data)
+            except Exception as e:
+                print(f"[INGEST] Error reading {name}: {e}", file=sys.stderr)
+                records[i] = {"name": name, "pages": [], "seconds": 0.0, "cpu_seconds": 0.0, "error": str(e)}
+                continue
+            futures = [pool.submit(extract_pdf_range, data, start, start + pages_per_task)
+                       for start in range(0, page_count, pages_per_task)]
+            jobs[i] = (time.perf_counter(), futures)
+        
+        # Text files are cheap, decode them while the PDFs are being processed
+        for i, (name, data, mime_type) in enumerate(files):
+            if records[i] is None and i not in jobs:
+                records[i] = _extract_serially(name, data, mime_type)
+        
+        for i, (submitted, futures) in jobs.items():
+            name = files[i][0]
+            pages, cpu_seconds, error = [], 0.0, None
+            try:
+                for future in futures:
+                    range_pages, range_cpu = future.result()
+                    pages.extend(range_pages)
+                    cpu_seconds += range_cpu
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                print(f"[INGEST] Error processing file {name}: {e}", file=sys.stderr)
+                error = str(e)
+            records[i] = {"name": name, "pages": pages, "seconds": time.perf_counter() - submitted,
+                          "cpu_seconds": cpu_seconds}
+            if error:
+                records[i]["error"] = error
+    except BrokenProcessPool as e:
+        # e.g. a worker was killed; fall back to the calling thread for this upload
+        print(f"[INGEST WARNING] Process pool failed ({e}), extracting serially", file=sys.stderr)
+        _reset_pool()
+        return [_extract_serially(*f) for f in files]
+    
+    for record in records:
+        print(f"[INGEST] {record['name']}: {len(record['pages'])} pages in {record['seconds']:.2f}s "
+              f"(cpu {record['cpu_seconds']:.2f}s)", file=sys.stderr)
+    return records
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+
+from modules.cache import CACHE_DIR
+
+__all__ = ['RunMetrics', 'MetricsCallbackHandler', 'estimate_cost', 'record_http_response', 'record_rate_limit_wait', 'record_llm_failover', 'METRICS_DIR']
+
+# One JSONL file per run: an event per graph node and per LLM call, then a summary line
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+
+# USD per 1M (prompt, completion) tokens, matched against the deployment/model name.
+# Rough list prices; override with LLM_PRICES='{"gpt-5-mini": [0.25, 2.0], ...}'.
+DEFAULT_PRICES = {
+    "gpt-5-mini": (0.25, 2.00),
+    "grok-4-fast": (0.20, 0.50),
+    "claude-sonnet": (3.00, 15.00),
+    "llama": (0.0, 0.0),
+    "deepseek": (0.0, 0.0),
+}
+
+def _load_prices():
+    prices = dict(DEFAULT_PRICES)
+    raw = os.getenv("LLM_PRICES")
+    if raw:
+        try:
+            prices.update({name: tuple(rate) for name, rate in json.loads(raw).items()})
+        except Exception as e:
+            print(f"[METRICS WARNING] Ignoring invalid LLM_PRICES: {e}", file=sys.stderr)
+    return prices
+
+PRICES = _load_prices()
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call; 0.0 for unknown models."""
+    model = (model or "").lower()
+    for name, (prompt_rate, completion_rate) in PRICES.items():
+        if name in model:
+            return (prompt_tokens * prompt_rate + completion_tokens * completion_rate) / 1_000_000
+    return 0.0
+
+def _model_name(metadata, invocation_params):
+    params = invocation_params or {}
+    return (params.get("deployment_name") or params.get("azure_deployment") or params.get("model")
+            or params.get("model_name") or (metadata or {}).get("ls_model_name") or "unknown")
+
+def _token_usage(response):
+    prompt_tokens = completion_tokens = 0
+    cache_hit = False
+    for generations in response.generations:
+        for gen in generations:
+            message = getattr(gen, "message", None)
+            if message is None:
+                continue
+            cache_hit = cache_hit or bool(message.response_metadata.get("cache_hit"))
+            usage = getattr(message, "usage_metadata", None) or {}
+            prompt_tokens += usage.get("input_tokens", 0)
+            completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens, cache_hit
+
+class RunMetrics:
+    """
+    Collects the events of one report run and appends them to
+    METRICS_DIR/<run_id>.jsonl as they happen. Attach it to a graph run with
+    config = metrics.attach(config); call finish() for the end-of-run summary.
+    """
+
+    def __init__(self, run_id: str, path: str = None):
+        self.run_id = run_id
+        self.path = path or os.path.join(METRICS_DIR, f"{run_id}.jsonl")
+        self.started = time.perf_counter()
+        self.events = []
+        self.handler = MetricsCallbackHandler(self)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    def attach(self, config=None):
+        """Returns a copy of config with this run's callback handler added."""
+        config = dict(config or {})
+        config["callbacks"] = list(config.get("callbacks") or []) + [self.handler]
+        return config
+
+    def record(self, event: dict):
+        event = {"run_id": self.run_id, "t": round(time.perf_counter() - self.started, 4), **event}
+        with self._lock:
+            self.events.append(event)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event, default=str) + "\n")
+
+    def summary(self):
+        """Aggregates the events per graph node, per agent, per chapter and per model."""
+        totals = defaultdict(float)
+        by_node = defaultdict(lambda: defaultdict(float))
+        by_agent = defaultdict(lambda: defaultdict(float))
+        by_chapter = defaultdict(lambda: defaultdict(float))
+        by_model = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            events = list(self.events)
+
+        for event in events:
+            kind = event["event"]
+            chapter = event.get("chapter")
+            if kind == "node":
+                node = by_node[event["node"]]
+                node["runs"] += 1
+                node["seconds"] += event["seconds"]
+                node["wait_seconds"] += event["wait_seconds"]
+                node["errors"] += 0 if event["ok"] else 1
+                totals["node_errors"] += 0 if event["ok"] else 1
+                if chapter is not None:
+                    by_chapter[chapter]["seconds"] += event["seconds"]
+                    by_chapter[chapter]["wait_seconds"] += event["wait_seconds"]
+            elif kind == "llm":
+                groups = [totals, by_node[event.get("node") or "unknown"],
+                          by_agent[event.get("agent") or event.get("node") or "unknown"], by_model[event["model"]]]
+                if chapter is not None:
+                    groups.append(by_chapter[chapter])
+                for group in groups:
+                    group["llm_calls"] += 1
+                    group["llm_seconds"] += event["seconds"]
+                    group["prompt_tokens"] += event["prompt_tokens"]
+                    group["completion_tokens"] += event["completion_tokens"]
+                    group["cost_usd"] += event["cost_usd"]
+                    group["cache_hits"] += 1 if event["cache_hit"] else 0
+                    group["llm_errors"] += 0 if event["ok"] else 1
+            elif kind == "http_retry":
+                for group in (totals, by_model[event.get("model") or "unknown"],
+                              by_agent[event.get("agent") or event.get("node") or "unknown"]):
+                    group["retries"] += 1
+            elif kind == "rate_limit_wait":
+                for group in (totals, by_model[event.get("model") or "unknown"],
+                              by_agent[event.get("agent") or event.get("node") or "unknown"]):
+                    group["rate_limit_wait_seconds"] += event["seconds"]
+            elif kind == "llm_failover":
+                for group in (totals, by_model[event.get("model") or "unknown"],
+                              by_agent[event.get("agent") or event.get("node") or "unknown"]):
+                    group["failovers"] += 1
+
+        totals["wall_seconds"] = time.perf_counter() - self.started
+        return {
+            "run_id": self.run_id,
+            "totals": dict(totals),
+            "slowest_node": max(by_node, key=lambda n: by_node[n]["seconds"]) if by_node else None,
+            "costliest_agent": max(by_agent, key=lambda a: by_agent[a]["cost_usd"]) if totals["cost_usd"] else None,
+            "by_node": {name: dict(stats) for name, stats in by_node.items()},
+            "by_agent": {name: dict(stats) for name, stats in by_agent.items()},
+            "by_chapter": {chapter: dict(stats) for chapter, stats in sorted(by_chapter.items())},
+            "by_model": {name: dict(stats) for name, stats in by_model.items()},
+        }
+
+    def finish(self):
+        """Writes and returns the summary."""
+        summary = self.summary()
+        self.record({"event": "summary", **summary})
+        totals = summary["totals"]
+        print(f"[METRICS] Run {self.run_id}: {totals['wall_seconds']:.1f}s, {int(totals.get('llm_calls', 0))} LLM calls, "
+              f"{int(totals.get('prompt_tokens', 0))}+{int(totals.get('completion_tokens', 0))} tokens, "
+              f"~${totals.get('cost_usd', 0.0):.4f}, slowest node: {summary['slowest_node']} ({self.path})", file=sys.stderr)
+        return summary
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler feeding a RunMetrics. Graph nodes are recognized by
+    LangGraph's "langgraph_node"/"langgraph_step" metadata; a node's wait time is
+    how long it sat ready (previous step finished) before it started, which in
+    parallel mode is the time a chapter queued for a max_concurrency slot.
+    """
+
+    run_inline = True  # timestamps are taken when the event happens, not in an executor
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        self._nodes = {}  # run_id -> (node, step, chapter, started)
+        self._llm_calls = {}  # run_id -> (model, node, agent, chapter, started)
+        self._step_done = defaultdict(float)  # step -> when its last node finished
+        self._lock = threading.Lock()
+
+    # --- graph nodes ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if node is None or kwargs.get("name") != node or node.startswith("__"):
+            return  # not a node (or LangGraph's own __start__), or a runnable nested inside one
+        chapter = None
+        if node in ("research", "write", "review", "chapter") and isinstance(inputs, dict):
+            chapter = inputs.get("current_chapter_index")
+        with self._lock:
+            self._nodes[run_id] = (node, metadata.get("langgraph_step", 0), chapter, time.perf_counter())
+
+    def _end_node(self, run_id, ok, error=None):
+        with self._lock:
+            entry = self._nodes.pop(run_id, None)
+            if entry is None:
+                return
+            node, step, chapter, started = entry
+            ended = time.perf_counter()
+            ready = self._step_done.get(step - 1) or self.metrics.started
+            self._step_done[step] = max(self._step_done[step], ended)
+        event = {"event": "node", "node": node, "step": step, "chapter": chapter, "ok": ok,
+                 "seconds": round(ended - started, 4), "wait_seconds": round(max(0.0, started - ready), 4)}
+        if error is not None:
+            event["error"] = f"{type(error).__name__}: {error}"[:500]
+        self.metrics.record(event)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_node(run_id, True)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_node(run_id, False, error)
+
+    # --- LLM calls ---
+
+    def _start_llm(self, run_id, metadata, kwargs):
+        metadata = metadata or {}
+        model = _model_name(metadata, kwargs.get("invocation_params"))
+        with self._lock:
+            self._llm_calls[run_id] = (model, metadata.get("langgraph_node"), metadata.get("agent"),
+                                       metadata.get("chapter_index"), time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, metadata, kwargs)
+
+    def _end_llm(self, run_id, response=None, error=None):
+        with self._lock:
+            entry = self._llm_calls.pop(run_id, None)
+        if entry is None:
+            return
+        model, node, agent, chapter, started = entry
+        prompt_tokens, completion_tokens, cache_hit = _token_usage(response) if response is not None else (0, 0, False)
+        event = {"event": "llm", "model": model, "node": node, "agent": agent, "chapter": chapter,
+                 "ok": error is None, "seconds": round(time.perf_counter() - started, 4),
+                 "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "cache_hit": cache_hit,
+                 # Cached responses cost nothing, even though they replay the original usage
+                 "cost_usd": 0.0 if cache_hit else estimate_cost(model, prompt_tokens, completion_tokens)}
+        if error is not None:
+            event["error"] = f"{type(error).__name__}: {error}"[:500]
+        self.metrics.record(event)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end_llm(run_id, response=response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end_llm(run_id, error=error)
+
+def _current_handler():
+    config = var_child_runnable_config.get() or {}
+    callbacks = config.get("callbacks")
+    handlers = getattr(callbacks, "handlers", callbacks) or []
+    for handler in handlers:
+        if isinstance(handler, MetricsCallbackHandler):
+            return handler, config.get("metadata") or {}
+    return None, {}
+
+def record_http_response(status_code: int, model: str = None):
+    """
+    Called for every Azure HTTP response (see the httpx hooks in llm_factory).
+    Throttling and server errors are what the OpenAI client retries on, so they
+    are recorded as retries against the LLM call in progress, if it is instrumented.
+    """
+    if status_code != 429 and status_code < 500:
+        return
+    handler, metadata = _current_handler()
+    if handler is None:
+        return
+    handler.metrics.record({"event": "http_retry", "status": status_code, "model": model or metadata.get("ls_model_name"),
+                            "node": metadata.get("langgraph_node"), "agent": metadata.get("agent"),
+                            "chapter": metadata.get("chapter_index")})
+
+def record_rate_limit_wait(deployment: str, seconds: float):
+    """Called by the rate limiter (modules.rate_limit) after a request waited for its deployment's budget."""
+    if seconds < 0.01:
+        return
+    handler, metadata = _current_handler()
+    if handler is None:
+        return
+    handler.metrics.record({"event": "rate_limit_wait", "model": deployment, "seconds": round(seconds, 4),
+                            "node": metadata.get("langgraph_node"), "agent": metadata.get("agent"),
+                            "chapter": metadata.get("chapter_index")})
+
+def record_llm_failover(deployment: str, fallback: str, error: Exception):
+    """Called by the model router (modules.routing) when a call moves from one deployment to the next."""
+    handler, metadata = _current_handler()
+    if handler is None:
+        return
+    handler.metrics.record({"event": "llm_failover", "model": deployment, "fallback": fallback,
+                            "error": f"{type(error).__name__}: {error}"[:500],
+                            "node": metadata.get("langgraph_node"), "agent": metadata.get("agent"),
+                            "chapter": metadata.get("chapter_index")})
@@ -0,0 +1,391 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from modules.cache import cache_path
+
+__all__ = ['JobQueue', 'get_job_queue', 'JOB_WORKERS']
+
+# Report jobs run on background worker threads, outside any Streamlit script
+# run, so reruns, closed tabs and concurrent users don't affect them. Queue,
+# progress and results live in SQLite; the graph state itself is checkpointed
+# under the job ID (modules/checkpoints.py), so an interrupted job resumes.
+JOBS_DB = os.getenv("JOBS_DB") or cache_path("jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# How often idle workers look for jobs queued by other processes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Each process refreshes its running jobs this often (and picks up cancel requests
+# made from other processes)
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+# A 'running' job without a heartbeat for this long is assumed dead (e.g. the
+# server restarted) and is queued again to resume from its checkpoint
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+def _progress(stage="queued", message="Waiting for a worker...", chapters_done=0, total_chapters=0):
+    return {"stage": stage, "message": message, "chapters_done": chapters_done,
+            "total_chapters": total_chapters, "steps": 0, "document_chars": 0}
+
+def _update_progress(progress, key, value, parallel):
+    """Applies one graph node update to a job's progress record (same messages the UI used to print)."""
+    current_idx = value.get("current_chapter_index", 0)
+    total = len(value.get("outline", []) or []) or progress["total_chapters"]
+    progress["stage"] = key
+    progress["steps"] += 1
+    if key == "planner":
+        progress["total_chapters"] = len(value["outline"])
+        shown = ", ".join(value["outline"][:5]) + ("..." if len(value["outline"]) > 5 else "")
+        progress["message"] = f"✅ Outline Generated: {len(value['outline'])} Chapters ({shown})"
+    elif key == "prefetch":
+        progress["message"] = f"🔍 Research gathered for {len(value.get('research_by_chapter', {}))} chapters"
+    elif key == "research":
+        progress["message"] = f"🔍 Researching chapter {current_idx + 1}/{total}..."
+    elif key == "write":
+        title = value.get("outline", [""])[current_idx] if current_idx < total else "Unknown"
+        progress["message"] = f"✍️ Writing chapter {current_idx + 1}/{total}: {title}"
+    elif key == "review":
+        progress["message"] = f"⚖️ Reviewing chapter {current_idx + 1}/{total}..."
+        if not parallel:
+            progress["chapters_done"] = value.get("current_chapter_index", progress["chapters_done"])
+        if "final_document" in value:
+            progress["document_chars"] = len(value["final_document"])
+    elif key == "chapter":
+        for section in value.get("chapter_sections", []):
+            progress["chapters_done"] += 1
+            progress["message"] = (f"✅ Chapter {section['index'] + 1} done "
+                                   f"({progress['chapters_done']}/{progress['total_chapters']}): {section['title']}")
+    elif key == "assemble":
+        progress["message"] = f"📚 Assembling {progress['total_chapters']} chapters..."
+        progress["document_chars"] = len(value.get("final_document", ""))
+
+class JobQueue:
+    """
+    SQLite-backed queue of report jobs plus a pool of worker threads that run
+    them through workflow.stream_report. Throughput is set by the number of
+    workers, not by how many browser sessions submit jobs; within a job the
+    graph's own max_concurrency still applies.
+    """
+
+    def __init__(self, path: str, workers: int = 2):
+        self.path = path
+        self.workers = max(1, workers)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = set()  # jobs running in this process
+        self._cancelled = set()
+        self._live = {}  # job_id -> latest token preview (in memory only)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " topic TEXT NOT NULL,"
+                " parallel INTEGER NOT NULL,"
+                " resume INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL,"
+                " config TEXT NOT NULL,"
+                " initial_state TEXT,"
+                " progress TEXT NOT NULL,"
+                " document TEXT,"
+                " metrics TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " updated_at REAL NOT NULL,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "cancel_requested" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    # --- Submitting and reading jobs ---
+
+    def submit(self, initial_state, topic: str, parallel: bool, config: dict = None, job_id: str = None,
+               resume: bool = False) -> str:
+        """
+        Queues a report. initial_state is the graph input; with resume=True the
+        job continues the checkpointed run job_id instead (initial_state unused).
+        Returns the job ID, which is also the run ID of its checkpoints.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, topic, parallel, resume, status, config, initial_state,"
+                " progress, document, metrics, error, created_at, started_at, finished_at, updated_at, cancel_requested)"
+                " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, NULL, NULL, NULL, ?, NULL, NULL, ?, 0)",
+                (job_id, topic, int(bool(parallel)), int(bool(resume)), json.dumps(config or {}),
+                 None if resume else json.dumps(initial_state), json.dumps(_progress()), now, now)
+            )
+        print(f"[JOBS] Queued job {job_id} ({'resume' if resume else 'new'}, "
+              f"{'parallel' if parallel else 'serial'}): {topic[:60]}", file=sys.stderr)
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str):
+        """Returns the job as a dict (with a live 'preview' while running), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job["preview"] = self._live.get(job_id)
+        return job
+
+    def list_jobs(self, status: str = None, limit: int = 20):
+        """Most recent jobs first (without their documents), optionally filtered by status or 'active'."""
+        query = ("SELECT job_id, topic, parallel, resume, status, progress, error, created_at, started_at,"
+                 " finished_at, updated_at FROM jobs")
+        params = []
+        if status == "active":
+            query += " WHERE status IN ('queued', 'running')"
+        elif status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def cancel(self, job_id: str):
+        """
+        Cancels a queued job, or stops a running one after its current step (it
+        stays resumable). The request is stored in the job's row, so it reaches
+        the worker even when the job runs in another process.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                (now, now, job_id))
+            if cursor.rowcount == 0:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+                if job_id in self._running:
+                    self._cancelled.add(job_id)
+        print(f"[JOBS] Cancel requested for job {job_id}", file=sys.stderr)
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job["parallel"] = bool(job["parallel"])
+        job["resume"] = bool(job["resume"])
+        for key in ("config", "initial_state", "progress", "metrics"):
+            if job.get(key):
+                job[key] = json.loads(job[key])
+        return job
+
+    # --- Workers ---
+
+    def start(self):
+        """Starts the worker threads and the heartbeat thread (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"report-job-worker-{n + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="report-job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[JOBS] Started {self.workers} job workers ({self.path})", file=sys.stderr)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _requeue_stale(self):
+        # Called inside _claim's transaction. Jobs left 'running' by a dead process
+        # resume from their checkpoints, unless a cancel was requested for them.
+        now = time.time()
+        stale = now - JOB_STALE_SECONDS
+        self._conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ?"
+            " WHERE status = 'running' AND updated_at < ? AND cancel_requested = 1", (now, now, stale))
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = 'queued', resume = 1, updated_at = ? WHERE status = 'running' AND updated_at < ?",
+            (now, stale))
+        if cursor.rowcount:
+            print(f"[JOBS] Re-queued {cursor.rowcount} interrupted job(s) to resume from their checkpoints", file=sys.stderr)
+
+    def _claim(self):
+        """
+        Atomically re-queues stale jobs, then moves the oldest queued job to
+        'running' and returns it (None if the queue is empty).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_stale()
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), updated_at = ?"
+                        " WHERE job_id = ?", (now, now, row["job_id"]))
+                    self._running.add(row["job_id"])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_job(row) if row is not None else None
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        for key in ("progress", "metrics"):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key])
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def _heartbeat(self):
+        # Keeps this process's running jobs from looking stale and picks up
+        # cancel requests stored by other processes
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                    if not running:
+                        continue
+                    placeholders = ",".join("?" * len(running))
+                    self._conn.execute(f"UPDATE jobs SET updated_at = ? WHERE job_id IN ({placeholders}) AND status = 'running'",
+                                       (time.time(), *running))
+                    rows = self._conn.execute(f"SELECT job_id FROM jobs WHERE job_id IN ({placeholders}) AND cancel_requested = 1",
+                                              running).fetchall()
+                    self._cancelled.update(row["job_id"] for row in rows)
+            except Exception as e:
+                print(f"[JOBS ERROR] Heartbeat failed: {e}", file=sys.stderr)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[JOBS ERROR] Could not claim a job: {e}", file=sys.stderr)
+                job = None
+            if job is None:
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # _run records its own failures; never lose the worker thread
+                print(f"[JOBS ERROR] Worker error on job {job['job_id']}: {e}", file=sys.stderr)
+
+    def _run(self, job):
+        # Imported here so the queue can be created without building the graphs
+        from workflow import stream_report, get_report_state
+        from modules.instrumentation import RunMetrics
+
+        job_id = job["job_id"]
+        progress = job["progress"] or _progress()
+        progress.update(stage="starting", message="🚀 Starting agents...")
+        metrics = None
+        cancelled = False
+        try:
+            initial_state = None if job["resume"] else job["initial_state"]
+            if initial_state is None:
+                # Resumed: count what the checkpoint already has
+                state = get_report_state(job_id, parallel=job["parallel"])
+                if not state and job["initial_state"]:
+                    # Interrupted before its first checkpoint: start over
+                    initial_state = state = job["initial_state"]
+                progress["total_chapters"] = len(state.get("outline", []) or [])
+                progress["chapters_done"] = len(state.get("chapter_sections", []) or []) if job["parallel"] \
+                    else state.get("current_chapter_index", 0)
+            elif initial_state.get("outline"):
+                progress["total_chapters"] = len(initial_state["outline"])
+                progress["chapters_done"] = len(initial_state.get("chapter_sections", []))
+            self._update(job_id, progress=progress)
+            print(f"[JOBS] Job {job_id} started on {threading.current_thread().name}", file=sys.stderr)
+
+            metrics = RunMetrics(job_id)
+            config = metrics.attach(dict(job["config"]))
+            for mode, output in stream_report(initial_state, config=config, parallel=job["parallel"],
+                                              stream_tokens=True, run_id=job_id):
+                if job_id in self._cancelled:
+                    cancelled = True
+                    break
+                if mode == "messages":
+                    self._record_preview(job_id, *output)
+                    continue
+                for key, value in output.items():
+                    if isinstance(value, dict):
+                        _update_progress(progress, key, value, job["parallel"])
+                self._update(job_id, progress=progress)
+
+            final_state = get_report_state(job_id, parallel=job["parallel"])
+            document = final_state.get("final_document", "")
+            if cancelled:
+                progress["message"] = "⏹️ Cancelled"
+                self._update(job_id, status="cancelled", progress=progress, document=document or None,
+                             metrics=metrics.finish(), finished_at=time.time())
+                print(f"[JOBS] Job {job_id} cancelled", file=sys.stderr)
+            else:
+                progress.update(stage="done", message="✅ Document Generation Complete!",
+                                chapters_done=progress["total_chapters"], document_chars=len(document))
+                self._update(job_id, status="completed", progress=progress, document=document,
+                             metrics=metrics.finish(), finished_at=time.time())
+                print(f"[JOBS] Job {job_id} completed ({len(document):,} chars)", file=sys.stderr)
+        except Exception as e:
+            print(f"[JOBS ERROR] Job {job_id} failed: {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            # Keep whatever the checkpoint has, e.g. after a recursion limit
+            partial = None
+            try:
+                partial = get_report_state(job_id, parallel=job["parallel"]).get("final_document") or None
+            except Exception:
+                pass
+            progress["message"] = f"❌ {type(e).__name__}"
+            try:
+                self._update(job_id, status="failed", progress=progress, document=partial,
+                             error=f"{type(e).__name__}: {e}", metrics=metrics.finish() if metrics else None,
+                             finished_at=time.time())
+            except Exception as update_error:
+                # Left "running" without a heartbeat, so the stale sweep picks it up
+                print(f"[JOBS ERROR] Could not mark job {job_id} failed: {update_error}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._cancelled.discard(job_id)
+            self._live.pop(job_id, None)
+
+    def _record_preview(self, job_id, chunk, metadata):
+        agent = metadata.get("agent")
+        if agent not in ("writer", "reviewer") or not isinstance(chunk.content, str):
+            return
+        preview = self._live.get(job_id)
+        if preview is None or preview["run"] != chunk.id:
+            preview = {"run": chunk.id, "agent": agent, "chapter": metadata.get("chapter_index", 0),
+                       "title": metadata.get("chapter_title", ""), "text": ""}
+            self._live[job_id] = preview
+        # Only the tail is ever shown
+        preview["text"] = (preview["text"] + chunk.content)[-4000:]
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JOBS_DB, workers=JOB_WORKERS)
+            _queue.start()
+        return _queue
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import threading
+from langchain_core.caches import BaseCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from modules.cache import DiskCache, hash_key, cache_path
+
+__all__ = ['LLMResponseCache', 'get_llm_cache', 'LLM_CACHE_ENABLED']
+
+# Set LLM_CACHE_ENABLED=0 to always call the models (e.g. for production runs)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))
+
+def _encode(generations) -> bytes:
+    records = []
+    for gen in generations:
+        if isinstance(gen, ChatGeneration):
+            msg = gen.message
+            records.append({
+                "content": msg.content,
+                "additional_kwargs": msg.additional_kwargs,
+                "response_metadata": msg.response_metadata,
+                "usage_metadata": getattr(msg, "usage_metadata", None),
+                "generation_info": gen.generation_info,
+            })
+        else:
+            records.append({"text": gen.text, "generation_info": gen.generation_info})
+    return json.dumps(records, default=str).encode("utf-8")
+
+def _decode(blob: bytes):
+    generations = []
+    for record in json.loads(blob.decode("utf-8")):
+        if "content" in record:
+            message = AIMessage(
+                content=record["content"],
+                additional_kwargs=record.get("additional_kwargs") or {},
+                # Flagged so instrumentation can tell replayed responses from billed ones
+                response_metadata={**(record.get("response_metadata") or {}), "cache_hit": True},
+                usage_metadata=record.get("usage_metadata"),
+            )
+            generations.append(ChatGeneration(message=message, generation_info=record.get("generation_info")))
+        else:
+            generations.append(Generation(text=record["text"], generation_info=record.get("generation_info")))
+    return generations
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache backed by DiskCache. LangChain passes the rendered prompt
+    (serialized messages) and the model's invocation params (deployment,
+    temperature, ...) as llm_string, so both are part of the key.
+    """
+
+    def __init__(self, store: DiskCache):
+        self.store = store
+
+    def lookup(self, prompt: str, llm_string: str):
+        blob = self.store.get(hash_key(llm_string, prompt))
+        if blob is None:
+            return None
+        try:
+            return _decode(blob)
+        except Exception as e:
+            print(f"[LLM CACHE WARNING] Dropping unreadable entry: {e}", file=sys.stderr)
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        self.store.set(hash_key(llm_string, prompt), _encode(return_val))
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+    # SQLite lookups take well under a millisecond, so the async variants
+    # call straight through instead of hopping to an executor thread.
+    async def alookup(self, prompt: str, llm_string: str):
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val):
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs):
+        self.clear(**kwargs)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Returns the process-wide LLM response cache, or None when disabled."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            store = DiskCache(
+                cache_path("llm_responses.sqlite3"),
+                ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+                max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                name="llm_responses",
+            )
+            _llm_cache = LLMResponseCache(store)
+            print(f"[LLM CACHE] Enabled (TTL {LLM_CACHE_TTL_HOURS:g}h, max {LLM_CACHE_MAX_MB:g} MB)", file=sys.stderr)
+        return _llm_cache
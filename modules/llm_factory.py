@@ -1,172 +1,307 @@
 import os
 import sys
-from langchain_openai import AzureChatOpenAI
+import time
+import hashlib
+import threading
+import importlib.util
 from langchain_core.messages import HumanMessage, SystemMessage
+from modules.llm_cache import get_llm_cache
+from modules.instrumentation import record_http_response
 
-# Optional imports with fallbacks
-try:
-    from langchain_anthropic import ChatAnthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
+# Provider SDKs (openai, anthropic, ollama) take seconds to import, so only
+# their presence is checked here; they are imported when a model is first built.
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("langchain_anthropic") is not None
+if not ANTHROPIC_AVAILABLE:
     print("[LLM FACTORY WARNING] langchain-anthropic not available", file=sys.stderr)
-    ANTHROPIC_AVAILABLE = False
 
 # Ollama is optional (only for local development)
-OLLAMA_AVAILABLE = False
-ChatOllama = None
-try:
-    from langchain_ollama import ChatOllama
-    OLLAMA_AVAILABLE = True
-except ImportError:
+OLLAMA_AVAILABLE = importlib.util.find_spec("langchain_ollama") is not None
+if not OLLAMA_AVAILABLE:
     print("[LLM FACTORY INFO] langchain-ollama not available (OK for cloud deployment)", file=sys.stderr)
 
-# Since Azure "Claude" and "Grok" might not have standard LangChain classes yet, 
-# we treat them as OpenAI-compatible or use custom wrappers. 
-# For this code, we assume they follow Azure OpenAI standards or we use generic requests if needed.
-# Below is a simplified unifying factory.
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", "2"))
+OLLAMA_PROBE_TTL = float(os.getenv("OLLAMA_PROBE_TTL", "300"))
+
+class _OllamaProbe:
+    """
+    Checks whether the local Ollama server answers, in a background thread.
+    The result is cached for OLLAMA_PROBE_TTL seconds so callers never pay
+    the network round trip on the hot path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None  # (available, error, checked_at)
+        self._running = False
+
+    def start(self):
+        """Starts a probe unless one is running or a fresh result is cached."""
+        with self._lock:
+            fresh = self._result is not None and time.time() - self._result[2] < OLLAMA_PROBE_TTL
+            if self._running or fresh:
+                return
+            self._running = True
+            self._done.clear()
+        threading.Thread(target=self._run, name="ollama-probe", daemon=True).start()
+
+    def _run(self):
+        try:
+            import requests
+            requests.get(OLLAMA_URL, timeout=OLLAMA_PROBE_TIMEOUT)
+            result = (True, None, time.time())
+        except Exception as e:
+            result = (False, e, time.time())
+        with self._lock:
+            self._result = result
+            self._running = False
+        self._done.set()
+        print(f"[LLM FACTORY] Ollama probe: {'available' if result[0] else f'not available ({result[1]})'}", file=sys.stderr)
+
+    def check(self):
+        """Returns (available, error), waiting for an in-flight probe if needed."""
+        self.start()
+        self._done.wait(OLLAMA_PROBE_TIMEOUT + 1)
+        with self._lock:
+            if self._result is None:
+                return False, TimeoutError("Ollama probe did not finish")
+            return self._result[0], self._result[1]
+
+ollama_probe = _OllamaProbe()
+if OLLAMA_AVAILABLE:
+    # Kick the probe off at import; it runs while the rest of the app starts up
+    ollama_probe.start()
+
+# Replaces _create_llm, e.g. with local stand-ins for the offline benchmarks
+_llm_factory_override = None
+
+def set_llm_factory(factory=None):
+    """
+    Routes model construction through factory(model_type) instead of the Azure
+    and Ollama clients (None restores them). Memoized clients are dropped.
+    """
+    global _llm_factory_override
+    _llm_factory_override = factory
+    reset_llm_registry()
 
 def get_llm(model_type="gpt-5-mini"):
     """
     Factory to return the requested LLM object.
+    Responses are served from the on-disk LLM cache when it is enabled.
+    """
+    llm = (_llm_factory_override or _create_llm)(model_type)
+    cache = get_llm_cache()
+    if cache is not None:
+        llm.cache = cache
+        print(f"[LLM FACTORY] Response cache attached to {model_type}", file=sys.stderr)
+    return llm
+
+_registry = {}  # (model_type, config fingerprint) -> model
+_registry_errors = {}  # same key -> (exception from the failed construction, failed at)
+# Seconds a construction failure is remembered before the model is tried again
+# (e.g. Ollama started after the app); defaults to the Ollama probe's TTL
+LLM_REGISTRY_ERROR_TTL = float(os.getenv("LLM_REGISTRY_ERROR_TTL", str(OLLAMA_PROBE_TTL)))
+_registry_lock = threading.Lock()
+_registry_key_locks = {}
+
+def _config_fingerprint():
+    # Clients are rebuilt if endpoints or keys change (keys are hashed, never stored)
+    values = [os.getenv(name, "") for name in (
+        "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_KEY", "AZURE_ANTHROPIC_ENDPOINT",
+        "AZURE_ANTHROPIC_KEY", "CLAUDE_SONNET_ENDPOINT",
+    )]
+    return hashlib.sha256("\0".join(values).encode("utf-8")).hexdigest()[:16]
+
+def get_llm_cached(model_type="gpt-5-mini"):
+    """
+    Memoized get_llm: each (model_type, config) is constructed once per process,
+    on first use. Construction failures are memoized too (and re-raised) for
+    LLM_REGISTRY_ERROR_TTL seconds, so a missing local model isn't re-probed on
+    every call but is picked up once it becomes available.
+    """
+    key = (model_type, _config_fingerprint())
+    with _registry_lock:
+        if key in _registry:
+            return _registry[key]
+        key_lock = _registry_key_locks.setdefault(key, threading.Lock())
+    
+    # Per-key lock: concurrent first callers build the client once, other models aren't blocked
+    with key_lock:
+        with _registry_lock:
+            if key in _registry:
+                return _registry[key]
+            if key in _registry_errors:
+                error, failed_at = _registry_errors[key]
+                if time.time() - failed_at < LLM_REGISTRY_ERROR_TTL:
+                    raise error
+                del _registry_errors[key]
+        started = time.perf_counter()
+        try:
+            llm = get_llm(model_type)
+        except Exception as e:
+            with _registry_lock:
+                _registry_errors[key] = (e, time.time())
+            raise
+        with _registry_lock:
+            _registry[key] = llm
+        print(f"[LLM FACTORY] {model_type} constructed in {time.perf_counter() - started:.3f}s (memoized)", file=sys.stderr)
+        return llm
+
+def reset_llm_registry():
+    """Drops all memoized clients and failures (e.g. after changing configuration)."""
+    with _registry_lock:
+        _registry.clear()
+        _registry_errors.clear()
+        _registry_key_locks.clear()
+
+# Shared HTTP connection pools, one per Azure endpoint, injected into every client
+AZURE_HTTP_MAX_CONNECTIONS = int(os.getenv("AZURE_HTTP_MAX_CONNECTIONS", "50"))
+AZURE_HTTP_MAX_KEEPALIVE = int(os.getenv("AZURE_HTTP_MAX_KEEPALIVE", "20"))
+AZURE_HTTP_KEEPALIVE_SECONDS = float(os.getenv("AZURE_HTTP_KEEPALIVE_SECONDS", "120"))
+
+_http_clients = {}  # endpoint -> (httpx.Client, httpx.AsyncClient)
+_http_clients_lock = threading.Lock()
+
+# Throttled/failed responses are what the OpenAI client retries; count them per run
+def _report_response(response):
+    record_http_response(response.status_code)
+
+async def _areport_response(response):
+    record_http_response(response.status_code)
+
+def get_http_clients(endpoint):
+    """
+    Returns the (sync, async) httpx clients for an endpoint, creating them once.
+    Every model talking to the same endpoint reuses their keep-alive connections
+    instead of paying a new TLS handshake per client. Requests go through the
+    per-deployment rate limiter (modules.rate_limit), which paces the OpenAI
+    client's own retries too. The async client must only be used from the
+    shared event loop in modules.aio.
+    """
+    import httpx
+    from modules.rate_limit import RateLimitedTransport, AsyncRateLimitedTransport
+    
+    key = endpoint.rstrip("/").lower()
+    with _http_clients_lock:
+        if key not in _http_clients:
+            limits = httpx.Limits(
+                max_connections=AZURE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=AZURE_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=AZURE_HTTP_KEEPALIVE_SECONDS,
+            )
+            # Per-request timeouts come from the model's timeout setting
+            _http_clients[key] = (
+                httpx.Client(transport=RateLimitedTransport(httpx.HTTPTransport(limits=limits)),
+                             event_hooks={"response": [_report_response]}),
+                httpx.AsyncClient(transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=limits)),
+                                  event_hooks={"response": [_areport_response]}),
+            )
+            print(f"[LLM FACTORY] Created shared HTTP pool for {key} "
+                  f"(max {AZURE_HTTP_MAX_CONNECTIONS} connections, {AZURE_HTTP_MAX_KEEPALIVE} keep-alive)", file=sys.stderr)
+        return _http_clients[key]
+
+def _azure_chat(deployment, azure_endpoint, azure_key):
+    from langchain_openai import AzureChatOpenAI
+    
+    http_client, http_async_client = get_http_clients(azure_endpoint)
+    return AzureChatOpenAI(
+        azure_deployment=deployment,
+        api_version="2024-05-01-preview",
+        azure_endpoint=azure_endpoint,
+        api_key=azure_key,
+        temperature=1.0,  # GPT-5 mini only supports temperature=1.0
+        timeout=120,
+        max_retries=2,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
+
+# Model types the factory builds; agent roles pick among them in modules/routing.py.
+# Azure OpenAI-compatible deployments: model type -> deployment name
+AZURE_DEPLOYMENTS = {
+    "gpt-5-mini": "gpt-5-mini",
+    "grok-4": "grok-4-fast-reasoning",  # Grok (Azure - OpenAI compatible endpoint)
+}
+# Local Ollama models (best for summarization & cost saving): model type -> (model, temperature)
+OLLAMA_MODELS = {
+    "deepseek-r1": ("deepseek-r1:8b", 0.6),
+    "llama3.2": ("llama3.2:latest", 0.5),
+}
+MODEL_TYPES = (*AZURE_DEPLOYMENTS, "claude-sonnet", *OLLAMA_MODELS)
+
+def _claude_endpoint():
+    claude_endpoint = os.getenv("AZURE_ANTHROPIC_ENDPOINT", "https://rbinbdo-vismai-mbr-resource.services.ai.azure.com")
+    # If using the new env format
+    if not claude_endpoint or "anthropic/v1/messages" in claude_endpoint:
+        claude_base = os.getenv("CLAUDE_SONNET_ENDPOINT", "https://rbinbdo-vismai-mbr-resource.services.ai.azure.com/anthropic/v1/messages")
+        # Extract base URL without the path
+        claude_endpoint = claude_base.replace("/anthropic/v1/messages", "")
+    return claude_endpoint
+
+def _claude_chat(claude_endpoint, claude_key):
+    # Claude Sonnet 4.5 (Azure Anthropic - Uses Anthropic API format, NOT OpenAI)
+    if not ANTHROPIC_AVAILABLE:
+        raise ImportError("langchain-anthropic not installed")
+    from langchain_anthropic import ChatAnthropic
+    from modules.rate_limit import LangChainRateLimiter
+    
+    # The base_url should be the base endpoint, ChatAnthropic will add the path
+    return ChatAnthropic(
+        model="claude-sonnet-4-5",
+        api_key=claude_key,
+        base_url=f"{claude_endpoint}/anthropic/v1",
+        temperature=1.0,
+        timeout=120,
+        max_retries=1,
+        rate_limiter=LangChainRateLimiter("claude-sonnet-4-5"),
+        default_headers={"anthropic-version": "2023-06-01"}
+    )
+
+def _ollama_chat(model_type):
+    if not OLLAMA_AVAILABLE:
+        raise ImportError("langchain-ollama not installed")
+    model, temperature = OLLAMA_MODELS[model_type]
+    print(f"[LLM FACTORY] Using local Ollama model: {model}", file=sys.stderr)
+    # Check if Ollama is available before initializing (cached background probe)
+    available, probe_error = ollama_probe.check()
+    if not available:
+        print(f"[LLM FACTORY WARNING] Ollama not available: {probe_error}", file=sys.stderr)
+        raise ConnectionError("Ollama service not available")
+    from langchain_ollama import ChatOllama
+    return ChatOllama(model=model, temperature=temperature)
+
+def _create_llm(model_type):
+    """
+    Builds one model client. Failures are raised, not papered over with another
+    model: falling back is the router's job (modules/routing.py), which also
+    tracks which deployments are healthy.
     """
     try:
-        azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        azure_key = os.getenv("AZURE_OPENAI_KEY")
-        claude_endpoint = os.getenv("AZURE_ANTHROPIC_ENDPOINT", "https://rbinbdo-vismai-mbr-resource.services.ai.azure.com")
-        claude_key = os.getenv("AZURE_ANTHROPIC_KEY", azure_key)
-        
-        # If using the new env format
-        if not claude_endpoint or "anthropic/v1/messages" in claude_endpoint:
-            claude_base = os.getenv("CLAUDE_SONNET_ENDPOINT", "https://rbinbdo-vismai-mbr-resource.services.ai.azure.com/anthropic/v1/messages")
-            # Extract base URL without the path
-            if "/anthropic/v1/messages" in claude_base:
-                claude_endpoint = claude_base.replace("/anthropic/v1/messages", "")
-            else:
-                claude_endpoint = claude_base
-        
         print(f"\n[LLM FACTORY] Initializing model: {model_type}", file=sys.stderr)
+        if model_type in OLLAMA_MODELS:
+            return _ollama_chat(model_type)
+        if model_type not in MODEL_TYPES:
+            raise ValueError(f"Unknown model type '{model_type}' (known: {', '.join(MODEL_TYPES)})")
         
         # Validate environment variables
+        azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+        azure_key = os.getenv("AZURE_OPENAI_KEY")
         if not azure_key:
             raise ValueError("AZURE_OPENAI_KEY not found in environment variables")
         if not azure_endpoint:
             raise ValueError("AZURE_OPENAI_ENDPOINT not found in environment variables")
         
-        # 1. GPT-5 Mini (Azure)
-        if model_type == "gpt-5-mini":
-            print(f"[LLM FACTORY] Using endpoint: {azure_endpoint}", file=sys.stderr)
-            return AzureChatOpenAI(
-                azure_deployment="gpt-5-mini",
-                api_version="2024-05-01-preview",
-                azure_endpoint=azure_endpoint,
-                api_key=azure_key,
-                temperature=1.0,  # GPT-5 mini only supports temperature=1.0
-                timeout=120,
-                max_retries=2
-            )
-
-        # 2. Grok (Azure - Assuming OpenAI Compatible Endpoint)
-        elif model_type == "grok-4":
-            print(f"[LLM FACTORY] Using endpoint: {azure_endpoint}", file=sys.stderr)
-            return AzureChatOpenAI(
-                azure_deployment="grok-4-fast-reasoning",
-                api_version="2024-05-01-preview",
-                azure_endpoint=azure_endpoint,
-                api_key=azure_key,
-                temperature=1.0,
-                timeout=120,
-                max_retries=2
-            )
-
-        # 3. Claude Sonnet 4.5 (Azure Anthropic - Uses Anthropic API format, NOT OpenAI)
-        elif model_type == "claude-sonnet":
+        if model_type == "claude-sonnet":
+            claude_endpoint = _claude_endpoint()
             print(f"[LLM FACTORY] Using Claude base endpoint: {claude_endpoint}", file=sys.stderr)
-            
-            if not ANTHROPIC_AVAILABLE:
-                print(f"[LLM FACTORY WARNING] Anthropic library not available, using GPT-5 Mini", file=sys.stderr)
-                return AzureChatOpenAI(
-                    azure_deployment="gpt-5-mini",
-                    api_version="2024-05-01-preview",
-                    azure_endpoint=azure_endpoint,
-                    api_key=azure_key,
-                    temperature=1.0,
-                    timeout=120,
-                    max_retries=2
-                )
-            
-            try:
-                # Claude uses Anthropic's native API
-                # The base_url should be the base endpoint, ChatAnthropic will add the path
-                return ChatAnthropic(
-                    model="claude-sonnet-4-5",
-                    api_key=claude_key,
-                    base_url=f"{claude_endpoint}/anthropic/v1",
-                    temperature=1.0,
-                    timeout=120,
-                    max_retries=1,
-                    default_headers={"anthropic-version": "2023-06-01"}
-                )
-            except Exception as claude_error:
-                print(f"[LLM FACTORY WARNING] Claude initialization failed: {claude_error}", file=sys.stderr)
-                print(f"[LLM FACTORY] Falling back to GPT-5 Mini for review tasks", file=sys.stderr)
-                import traceback
-                traceback.print_exc(file=sys.stderr)
-                return AzureChatOpenAI(
-                    azure_deployment="gpt-5-mini",
-                    api_version="2024-05-01-preview",
-                    azure_endpoint=azure_endpoint,
-                    api_key=azure_key,
-                    temperature=1.0,
-                    timeout=120,
-                    max_retries=2
-                )
-
-        # 4. Local Ollama Models (Best for summarization & cost saving)
-        elif model_type == "deepseek-r1":
-            if not OLLAMA_AVAILABLE:
-                print(f"[LLM FACTORY WARNING] Ollama not available, using GPT-5 Mini fallback", file=sys.stderr)
-                raise ImportError("langchain-ollama not installed")
-            
-            print(f"[LLM FACTORY] Using local Ollama model: deepseek-r1:8b", file=sys.stderr)
-            try:
-                # Check if Ollama is available before initializing
-                import requests
-                requests.get("http://localhost:11434", timeout=2)
-                return ChatOllama(model="deepseek-r1:8b", temperature=0.6)
-            except Exception as ollama_err:
-                print(f"[LLM FACTORY WARNING] Ollama not available: {ollama_err}", file=sys.stderr)
-                raise ConnectionError("Ollama service not available")
+            return _claude_chat(claude_endpoint, os.getenv("AZURE_ANTHROPIC_KEY", azure_key))
         
-        elif model_type == "llama3.2":
-            if not OLLAMA_AVAILABLE:
-                print(f"[LLM FACTORY WARNING] Ollama not available, using GPT-5 Mini fallback", file=sys.stderr)
-                raise ImportError("langchain-ollama not installed")
-            
-            print(f"[LLM FACTORY] Using local Ollama model: llama3.2", file=sys.stderr)
-            try:
-                # Check if Ollama is available before initializing
-                import requests
-                requests.get("http://localhost:11434", timeout=2)
-                return ChatOllama(model="llama3.2:latest", temperature=0.5)
-            except Exception as ollama_err:
-                print(f"[LLM FACTORY WARNING] Ollama not available: {ollama_err}", file=sys.stderr)
-                raise ConnectionError("Ollama service not available")
-
-        else:
-            # Fallback
-            print(f"[LLM FACTORY] Unknown model type '{model_type}', falling back to GPT-5 Mini", file=sys.stderr)
-            return AzureChatOpenAI(
-                azure_deployment="gpt-5-mini",
-                api_version="2024-05-01-preview",
-                azure_endpoint=azure_endpoint,
-                api_key=azure_key,
-                temperature=1.0,
-                timeout=120,
-                max_retries=2
-            )
+        print(f"[LLM FACTORY] Using endpoint: {azure_endpoint}", file=sys.stderr)
+        return _azure_chat(AZURE_DEPLOYMENTS[model_type], azure_endpoint, azure_key)
             
     except Exception as e:
         print(f"\n[LLM FACTORY ERROR] Failed to initialize {model_type}: {str(e)}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,422 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+import httpx
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from modules.instrumentation import record_rate_limit_wait
+
+__all__ = [
+    'DeploymentLimiter', 'get_limiter', 'limiter_stats', 'RateLimitedTransport',
+    'AsyncRateLimitedTransport', 'LangChainRateLimiter', 'parse_retry_after',
+]
+
+# Per-deployment budgets, e.g.
+# AZURE_RATE_LIMITS='{"gpt-5-mini": {"rpm": 300, "tpm": 300000, "concurrency": 16}}'
+# Deployments without an entry get the defaults below (0 = no fixed budget; the
+# limiter then only reacts to 429s and retry-after).
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "16"))
+RATE_LIMIT_MIN_CONCURRENCY = int(os.getenv("RATE_LIMIT_MIN_CONCURRENCY", "1"))
+# Assumed completion size when estimating a request's tokens up front
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "1500"))
+# Backoff when a 429 carries no retry-after header
+RATE_LIMIT_DEFAULT_BACKOFF = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "2"))
+
+# Streamed responses report their usage in the last event; only the end of the stream is kept
+_USAGE_TAIL_BYTES = 4096
+_USAGE_RE = re.compile(rb'"total_tokens"\s*:\s*(\d+)')
+
+def _load_budgets():
+    raw = os.getenv("AZURE_RATE_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return {name.lower(): budget for name, budget in json.loads(raw).items()}
+    except Exception as e:
+        print(f"[RATE LIMIT WARNING] Ignoring invalid AZURE_RATE_LIMITS: {e}", file=sys.stderr)
+        return {}
+
+_BUDGETS = _load_budgets()
+
+class _TokenBucket:
+    """Refills at capacity per minute; the level may go negative (debt) when usage exceeds the estimate."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until amount is available (0 = available now)."""
+        self._refill(now)
+        # A request bigger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def refund(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+    def cap(self, remaining):
+        # Azure reports what is actually left; never assume more than that
+        self.level = min(self.level, remaining)
+
+class DeploymentLimiter:
+    """
+    Shared admission control for one deployment: request and token buckets
+    (RPM/TPM), a pause after 429s honoring retry-after, and an AIMD concurrency
+    limit (+1 per window of successful calls, halved on throttling, at most once
+    per backoff) so all agents in the process back off together and ramp back
+    up toward the quota instead of retrying in lockstep.
+    """
+
+    def __init__(self, name, rpm=0.0, tpm=0.0, max_concurrency=RATE_LIMIT_MAX_CONCURRENCY,
+                 min_concurrency=RATE_LIMIT_MIN_CONCURRENCY):
+        self.name = name
+        self.requests = _TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = _TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "wait_seconds": 0.0}
+
+    def _try_acquire(self, tokens):
+        """Takes a slot and returns 0, or returns how long to wait before trying again."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return 0.05  # a slot frees when a call finishes
+            delay = max(self.requests.delay(1, now) if self.requests else 0.0,
+                        self.tokens.delay(tokens, now) if self.tokens else 0.0)
+            if delay > 0:
+                return delay
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self.stats["requests"] += 1
+            return 0.0
+
+    def acquire(self, tokens=0):
+        """Blocks until the request may be sent; returns the seconds waited."""
+        started = time.monotonic()
+        while True:
+            delay = self._try_acquire(tokens)
+            if delay <= 0:
+                break
+            time.sleep(min(delay, 1.0))
+        return self._waited(started)
+
+    async def aacquire(self, tokens=0):
+        """Async acquire: waits without blocking the event loop."""
+        started = time.monotonic()
+        while True:
+            delay = self._try_acquire(tokens)
+            if delay <= 0:
+                break
+            await asyncio.sleep(min(delay, 1.0))
+        return self._waited(started)
+
+    def _waited(self, started):
+        waited = time.monotonic() - started
+        if waited > 0:
+            with self._lock:
+                self.stats["wait_seconds"] += waited
+        return waited
+
+    def release(self, status_code=200, estimated_tokens=0, used_tokens=None, retry_after=None,
+                remaining_requests=None, remaining_tokens=None):
+        """Records the outcome of a request taken with acquire()."""
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.tokens and used_tokens is not None:
+                self.tokens.take(used_tokens - estimated_tokens)
+            elif self.tokens and (status_code == 429 or status_code >= 500):
+                # Rejected or failed before generating anything: the estimate was never spent
+                self.tokens.refund(estimated_tokens)
+            if self.requests and remaining_requests is not None:
+                self.requests.cap(remaining_requests)
+            if self.tokens and remaining_tokens is not None:
+                self.tokens.cap(remaining_tokens)
+
+            if status_code == 429 or status_code == 503:
+                self.stats["throttled"] += 1
+                backoff = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF * (1 + random.random())
+                self.paused_until = max(self.paused_until, now + backoff)
+                # One decrease per congestion event, not one per concurrent 429
+                if now - self._last_decrease >= max(1.0, backoff):
+                    self._last_decrease = now
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    print(f"[RATE LIMIT] {self.name} throttled, pausing {backoff:.1f}s, "
+                          f"concurrency limit → {int(self.limit)}", file=sys.stderr)
+            elif status_code < 400:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def snapshot(self):
+        with self._lock:
+            return {"deployment": self.name, "limit": int(self.limit), "in_flight": self.in_flight,
+                    "paused_for": max(0.0, self.paused_until - time.monotonic()), **self.stats}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(deployment: str) -> DeploymentLimiter:
+    """Returns the process-wide limiter for a deployment (configured from AZURE_RATE_LIMITS)."""
+    key = (deployment or "default").lower()
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            budget = _BUDGETS.get(key, {})
+            limiter = DeploymentLimiter(
+                key,
+                rpm=float(budget.get("rpm", RATE_LIMIT_RPM)),
+                tpm=float(budget.get("tpm", RATE_LIMIT_TPM)),
+                max_concurrency=int(budget.get("concurrency", RATE_LIMIT_MAX_CONCURRENCY)),
+            )
+            _limiters[key] = limiter
+        return limiter
+
+def limiter_stats():
+    """Snapshot of every limiter created so far."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.snapshot() for limiter in limiters]
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait according to retry-after-ms / retry-after (seconds or HTTP date), or None."""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+def _int_header(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+_DEPLOYMENT_RE = re.compile(r"/deployments/([^/]+)/")
+
+def _deployment(request: httpx.Request):
+    match = _DEPLOYMENT_RE.search(request.url.path)
+    return match.group(1) if match else request.url.host
+
+def _estimate_tokens(request: httpx.Request):
+    """(estimated tokens, streaming?) for a chat completion request: ~4 characters per prompt token plus the completion budget."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except Exception:
+        return RATE_LIMIT_COMPLETION_TOKENS, False
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []) if isinstance(m, dict))
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or RATE_LIMIT_COMPLETION_TOKENS
+    return prompt_chars // 4 + int(completion), bool(body.get("stream"))
+
+def _stream_usage(tail):
+    """total_tokens reported at the end of a streamed response, or None."""
+    matches = _USAGE_RE.findall(tail or b"")
+    return int(matches[-1]) if matches else None
+
+def _response_usage(response):
+    """total_tokens of a successful non-streamed response, or None."""
+    if response.status_code >= 400:
+        return None
+    try:
+        return json.loads(response.content).get("usage", {}).get("total_tokens")
+    except Exception:
+        return None
+
+def _release(limiter, response, estimated, used_tokens=None):
+    limiter.release(
+        status_code=response.status_code,
+        estimated_tokens=estimated,
+        used_tokens=used_tokens,
+        retry_after=parse_retry_after(response.headers) if response.status_code in (429, 503) else None,
+        remaining_requests=_int_header(response.headers, "x-ratelimit-remaining-requests"),
+        remaining_tokens=_int_header(response.headers, "x-ratelimit-remaining-tokens"),
+    )
+
+class _UsageTail:
+    # Keeps the end of a streamed body and releases the limiter slot once, when the stream closes
+    def __init__(self, release):
+        self._release = release
+        self._tail = b""
+        self._released = False
+
+    def feed(self, chunk):
+        self._tail = (self._tail + chunk)[-_USAGE_TAIL_BYTES:]
+
+    def done(self):
+        if not self._released:
+            self._released = True
+            self._release(_stream_usage(self._tail))
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Streamed response body that holds its concurrency slot until the stream is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._usage = _UsageTail(release)
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._usage.feed(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._usage.done()
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Async variant of _ReleasingStream."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._usage = _UsageTail(release)
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._usage.feed(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._usage.done()
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Wraps an httpx transport so every request waits for its deployment's limiter.
+    A streamed (SSE) response keeps its slot until its body is closed, and its
+    token estimate is reconciled with the usage reported at the end of the
+    stream, when there is one.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        limiter = get_limiter(_deployment(request))
+        estimated, streaming = _estimate_tokens(request)
+        record_rate_limit_wait(limiter.name, limiter.acquire(estimated))
+        try:
+            response = self.transport.handle_request(request)
+            if streaming and response.status_code < 400:
+                response.stream = _ReleasingStream(response.stream, lambda used: _release(limiter, response, estimated, used))
+                return response
+            if response.status_code < 400:
+                response.read()  # small JSON body, read here to account the actual token usage
+        except BaseException:
+            limiter.release(status_code=599, estimated_tokens=estimated)
+            raise
+        _release(limiter, response, estimated, _response_usage(response))
+        return response
+
+    def close(self):
+        self.transport.close()
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async variant of RateLimitedTransport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        limiter = get_limiter(_deployment(request))
+        estimated, streaming = _estimate_tokens(request)
+        record_rate_limit_wait(limiter.name, await limiter.aacquire(estimated))
+        try:
+            response = await self.transport.handle_async_request(request)
+            if streaming and response.status_code < 400:
+                response.stream = _AsyncReleasingStream(response.stream, lambda used: _release(limiter, response, estimated, used))
+                return response
+            if response.status_code < 400:
+                await response.aread()
+        except BaseException:
+            limiter.release(status_code=599, estimated_tokens=estimated)
+            raise
+        _release(limiter, response, estimated, _response_usage(response))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class LangChainRateLimiter(BaseRateLimiter):
+    """
+    Adapter for clients we can't give an httpx transport (ChatAnthropic):
+    waits on the deployment's request bucket and retry-after pause before each
+    call. There is no completion hook, so it takes no concurrency slot.
+    """
+
+    def __init__(self, deployment: str):
+        self.limiter = get_limiter(deployment)
+
+    def _ready(self):
+        now = time.monotonic()
+        with self.limiter._lock:
+            if now < self.limiter.paused_until:
+                return self.limiter.paused_until - now
+            if self.limiter.requests:
+                delay = self.limiter.requests.delay(1, now)
+                if delay > 0:
+                    return delay
+                self.limiter.requests.take(1)
+            self.limiter.stats["requests"] += 1
+            return 0.0
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            delay = self._ready()
+            if delay <= 0:
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(delay, 1.0))
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            delay = self._ready()
+            if delay <= 0:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(min(delay, 1.0))
@@ -0,0 +1,119 @@
+import os
+import re
+import sys
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+__all__ = ['BM25Index', 'chunk_text', 'get_context_index', 'retrieve_context']
+
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "800"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+def tokenize(text: str):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+def chunk_text(text: str, chunk_chars: int = RETRIEVAL_CHUNK_CHARS):
+    """Splits text into chunks of about chunk_chars, breaking on line boundaries."""
+    chunks, current, size = [], [], 0
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        # Very long lines (e.g. PDF pages without line breaks) are hard-split
+        while len(line) > chunk_chars:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        if size + len(line) > chunk_chars and current:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+class BM25Index:
+    """Okapi BM25 over a list of text chunks. Pure Python, built once, queried many times."""
+
+    def __init__(self, chunks, k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K):
+        """Returns [(score, chunk_index)] for the k best matching chunks, best first."""
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        if not terms:
+            return []
+        scores = []
+        for i, tf in enumerate(self.term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return scores[:k]
+
+_indexes = OrderedDict()  # sha256(text) -> BM25Index, most recently used last
+_indexes_lock = threading.Lock()
+_MAX_INDEXES = 8
+
+def get_context_index(text: str) -> BM25Index:
+    """Returns the index for text, building it on first use (memoized by content hash)."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = BM25Index(chunk_text(text))
+            _indexes[key] = index
+            print(f"[RETRIEVAL] Indexed {len(index.chunks)} chunks ({len(text):,} chars)", file=sys.stderr)
+            while len(_indexes) > _MAX_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+        return index
+
+def retrieve_context(text: str, query: str, max_chars: int, k: int = RETRIEVAL_TOP_K) -> str:
+    """
+    Returns up to max_chars of the uploaded context most relevant to query.
+    Short contexts are returned whole; otherwise the top-k BM25 chunks are
+    returned in document order (falling back to the opening of the text when
+    nothing matches).
+    """
+    if not text or len(text) <= max_chars:
+        return text
+    index = get_context_index(text)
+    hits = index.search(query, k)
+    if not hits:
+        return text[:max_chars]
+
+    selected, total = [], 0
+    for _, i in hits:
+        chunk = index.chunks[i]
+        if total + len(chunk) > max_chars and selected:
+            break
+        selected.append(i)
+        total += len(chunk)
+    return "\n...\n".join(index.chunks[i] for i in sorted(selected))[:max_chars]
@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import threading
+
+from langchain_core.runnables import Runnable
+
+from modules.llm_factory import get_llm_cached
+from modules.instrumentation import record_llm_failover
+
+__all__ = ['ROUTES', 'DeploymentHealth', 'ModelRouter', 'RoutedChatModel', 'get_router', 'route_llm']
+
+# Agent role -> model types to try, in order of preference. The first healthy
+# one serves the call; the others take over if it fails.
+DEFAULT_ROUTES = {
+    "writer": ["gpt-5-mini", "grok-4", "claude-sonnet"],
+    "reviewer": ["gpt-5-mini", "grok-4", "claude-sonnet"],
+    "researcher": ["grok-4", "gpt-5-mini"],  # Grok for fast reasoning/search synthesis
+    "planner": ["llama3.2", "gpt-5-mini"],  # Local model for formatting/outlining
+}
+
+# Overriding routes: inline JSON or a path to a JSON file, e.g.
+# MODEL_ROUTES='{"reviewer": ["claude-sonnet", "gpt-5-mini"]}'
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+
+# Health tracking: weight of the newest sample in the latency/error averages
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.3"))
+# Circuit breaker: consecutive failures that open it, and seconds before a trial call
+ROUTING_BREAKER_FAILURES = int(os.getenv("ROUTING_BREAKER_FAILURES", "3"))
+ROUTING_BREAKER_COOLDOWN = float(os.getenv("ROUTING_BREAKER_COOLDOWN", "30"))
+# A deployment is demoted behind the others for a role when its average latency is
+# this many times the fastest alternative's (after a few samples), or when its
+# recent error rate is above ROUTING_MAX_ERROR_RATE. Demotions expire after
+# ROUTING_SLOW_TTL seconds without new samples or failures so it gets measured again.
+ROUTING_SLOW_FACTOR = float(os.getenv("ROUTING_SLOW_FACTOR", "2.0"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "3"))
+ROUTING_SLOW_TTL = float(os.getenv("ROUTING_SLOW_TTL", "120"))
+ROUTING_MAX_ERROR_RATE = float(os.getenv("ROUTING_MAX_ERROR_RATE", "0.5"))
+
+
+def _load_routes():
+    routes = {role: list(models) for role, models in DEFAULT_ROUTES.items()}
+    if not MODEL_ROUTES:
+        return routes
+    try:
+        if MODEL_ROUTES.lstrip().startswith("{"):
+            extra = json.loads(MODEL_ROUTES)
+        else:
+            with open(MODEL_ROUTES, encoding="utf-8") as f:
+                extra = json.load(f)
+        for role, models in extra.items():
+            models = [models] if isinstance(models, str) else [str(m) for m in models]
+            if models:
+                routes[role] = models
+    except Exception as e:
+        print(f"[ROUTING WARNING] Ignoring invalid MODEL_ROUTES: {e}", file=sys.stderr)
+    return routes
+
+ROUTES = _load_routes()
+
+_transient = None
+
+def _transient_errors():
+    """
+    Exception types that say the deployment, not the request, is the problem:
+    connection failures, timeouts, throttling and server errors. Anything else
+    (bad request, Azure content filter, which langchain_openai raises as a
+    plain ValueError) is the caller's to handle, since another deployment would
+    reject the same input.
+    """
+    global _transient
+    if _transient is None:
+        import httpx
+        errors = [httpx.TransportError, ConnectionError, TimeoutError]
+        for module_name in ("openai", "anthropic"):
+            try:
+                module = __import__(module_name)
+            except ImportError:
+                continue
+            errors += [module.APIConnectionError, module.APITimeoutError, module.RateLimitError, module.InternalServerError]
+        _transient = tuple(errors)
+    return _transient
+
+def _should_fail_over(error):
+    return isinstance(error, _transient_errors())
+
+class DeploymentHealth:
+    """
+    Latency and error averages of one deployment plus its circuit breaker:
+    "closed" (in use), "open" (skipped until the cooldown ends) and
+    "half_open" (one trial call decides whether it closes again).
+    Latency is tracked per role, since prompts and answers differ a lot by role.
+    """
+
+    def __init__(self, deployment):
+        self.deployment = deployment
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.error_rate = 0.0
+        self.latency = {}  # role -> (EWMA seconds, samples, last sample time)
+        self.calls = 0
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_failure_at = 0.0
+        self.trial_in_flight = False
+
+    def available(self, now):
+        """False while the breaker is open (or its trial call is still running)."""
+        if self.state == "closed":
+            return True
+        if self.trial_in_flight:
+            return False
+        return now - self.opened_at >= ROUTING_BREAKER_COOLDOWN
+
+    def begin(self, now):
+        # An open breaker past its cooldown lets this call through as the trial
+        if self.state != "closed" and not self.trial_in_flight and now - self.opened_at >= ROUTING_BREAKER_COOLDOWN:
+            self.state = "half_open"
+            self.trial_in_flight = True
+
+    def abandon(self):
+        # The call ended without saying anything about the deployment's health
+        # (cancelled, or rejected for its input): let the next call be the trial
+        self.trial_in_flight = False
+
+    def success(self, role, seconds, now):
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.error_rate *= 1 - ROUTING_EWMA_ALPHA
+        if seconds is not None:
+            average, samples, _ = self.latency.get(role, (seconds, 0, now))
+            self.latency[role] = (average + ROUTING_EWMA_ALPHA * (seconds - average), samples + 1, now)
+        if self.state != "closed":
+            print(f"[ROUTING] ✓ {self.deployment} recovered, circuit closed", file=sys.stderr)
+        self.state = "closed"
+        self.trial_in_flight = False
+
+    def failure(self, now):
+        self.calls += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate += ROUTING_EWMA_ALPHA * (1 - self.error_rate)
+        self.last_failure_at = now
+        if self.state == "half_open" or self.consecutive_failures >= ROUTING_BREAKER_FAILURES:
+            if self.state != "open":
+                print(f"[ROUTING] ⚠ Circuit open for {self.deployment} after {self.consecutive_failures} failures, "
+                      f"skipping it for {ROUTING_BREAKER_COOLDOWN:.0f}s", file=sys.stderr)
+            self.state = "open"
+            self.opened_at = now
+        self.trial_in_flight = False
+
+    def error_prone(self, now):
+        return self.error_rate > ROUTING_MAX_ERROR_RATE and now - self.last_failure_at <= ROUTING_SLOW_TTL
+
+    def recent_latency(self, role, now):
+        """EWMA latency for a role if it has enough recent samples, else None."""
+        average, samples, last = self.latency.get(role, (None, 0, 0.0))
+        if samples < ROUTING_MIN_SAMPLES or now - last > ROUTING_SLOW_TTL:
+            return None
+        return average
+
+    def snapshot(self):
+        return {"deployment": self.deployment, "state": self.state, "calls": self.calls, "failures": self.failures,
+                "error_rate": round(self.error_rate, 3),
+                "latency": {role: round(average, 3) for role, (average, _, _) in self.latency.items()}}
+
+class ModelRouter:
+    """Orders each role's deployments by health and records the outcome of every call."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self._lock = threading.Lock()
+        self._health = {}  # deployment -> DeploymentHealth
+
+    def _get(self, deployment):
+        if deployment not in self._health:
+            self._health[deployment] = DeploymentHealth(deployment)
+        return self._health[deployment]
+
+    def candidates(self, role, prefer=None, avoid=None):
+        """
+        The role's deployments in the order to try them: healthy ones in route
+        order (prefer first, avoid last), then slow or error-prone ones, then
+        those with an open circuit as a last resort.
+        """
+        route = list(self.routes[role])
+        if prefer:
+            route = [prefer] + [d for d in route if d != prefer]
+        if avoid and len(route) > 1 and avoid in route:
+            route = [d for d in route if d != avoid] + [avoid]
+
+        now = time.time()
+        with self._lock:
+            health = [self._get(d) for d in route]
+            latencies = [h.recent_latency(role, now) for h in health]
+
+            def tier(i):
+                h = health[i]
+                if not h.available(now):
+                    return 2
+                if h.state != "closed":
+                    return 0  # cooldown over: its trial call decides
+                others = [l for j, l in enumerate(latencies) if j != i and l is not None and health[j].available(now)]
+                slow = latencies[i] is not None and others and latencies[i] > ROUTING_SLOW_FACTOR * min(others)
+                return 1 if slow or h.error_prone(now) else 0
+
+            return [route[i] for i in sorted(range(len(route)), key=lambda i: (tier(i), i))]
+
+    def begin(self, deployment):
+        with self._lock:
+            self._get(deployment).begin(time.time())
+
+    def success(self, deployment, role, seconds):
+        with self._lock:
+            self._get(deployment).success(role, seconds, time.time())
+
+    def failure(self, deployment):
+        with self._lock:
+            self._get(deployment).failure(time.time())
+
+    def abandon(self, deployment):
+        with self._lock:
+            self._get(deployment).abandon()
+
+    def stats(self):
+        with self._lock:
+            return [health.snapshot() for health in self._health.values()]
+
+    def reset(self):
+        with self._lock:
+            self._health.clear()
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """Returns the process-wide router (health is shared by all runs and sessions)."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(ROUTES)
+        return _router
+
+class RoutedChatModel(Runnable):
+    """
+    Chat model for an agent role that sends each call to the healthiest
+    deployment on its route and fails over to the next one, within the same
+    call, on connection errors, timeouts, throttling or server errors (or
+    when the model can't be constructed). Other errors are raised unchanged.
+    Used like any chat model (prompt | model, invoke/ainvoke). If a deployment
+    fails after streaming part of an answer, the tokens already streamed are
+    not withdrawn.
+    """
+
+    def __init__(self, role, prefer=None, avoid=None, router=None):
+        self.role = role
+        self.prefer = prefer
+        self.avoid = avoid
+        self.router = router or get_router()
+
+    def _failed(self, deployment, error, remaining):
+        self.router.failure(deployment)
+        fallback = remaining[0] if remaining else None
+        print(f"[ROUTING] ✗ {self.role} call failed on {deployment}: {type(error).__name__}: {str(error)[:200]}"
+              + (f", failing over to {fallback}" if fallback else ""), file=sys.stderr)
+        if fallback:
+            record_llm_failover(deployment, fallback, error)
+
+    def _succeeded(self, deployment, response, started):
+        # Cached responses say nothing about the deployment's latency
+        cache_hit = bool((getattr(response, "response_metadata", None) or {}).get("cache_hit"))
+        self.router.success(deployment, self.role, None if cache_hit else time.perf_counter() - started)
+
+    def invoke(self, input, config=None, **kwargs):
+        candidates = self.router.candidates(self.role, self.prefer, self.avoid)
+        error = None
+        for n, deployment in enumerate(candidates):
+            try:
+                llm = get_llm_cached(deployment)
+            except Exception as e:
+                error = e
+                self._failed(deployment, e, candidates[n + 1:])
+                continue
+            self.router.begin(deployment)
+            started = time.perf_counter()
+            try:
+                response = llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not _should_fail_over(e):
+                    self.router.abandon(deployment)
+                    raise
+                error = e
+                self._failed(deployment, e, candidates[n + 1:])
+                continue
+            except BaseException:
+                # e.g. asyncio.CancelledError when a job is cancelled mid-call
+                self.router.abandon(deployment)
+                raise
+            self._succeeded(deployment, response, started)
+            return response
+        raise error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        candidates = self.router.candidates(self.role, self.prefer, self.avoid)
+        error = None
+        for n, deployment in enumerate(candidates):
+            try:
+                llm = get_llm_cached(deployment)
+            except Exception as e:
+                error = e
+                self._failed(deployment, e, candidates[n + 1:])
+                continue
+            self.router.begin(deployment)
+            started = time.perf_counter()
+            try:
+                response = await llm.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                if not _should_fail_over(e):
+                    self.router.abandon(deployment)
+                    raise
+                error = e
+                self._failed(deployment, e, candidates[n + 1:])
+                continue
+            except BaseException:
+                # e.g. asyncio.CancelledError when a job is cancelled mid-call
+                self.router.abandon(deployment)
+                raise
+            self._succeeded(deployment, response, started)
+            return response
+        raise error
+
+_routed = {}
+_routed_lock = threading.Lock()
+
+def route_llm(role, prefer=None, avoid=None):
+    """
+    The routed model for an agent role. prefer moves a model type to the front
+    of the route (e.g. the writer model picked in the UI), avoid moves it to the
+    back (e.g. so the reviewer cross-checks with a different model).
+    """
+    if role not in ROUTES:
+        raise KeyError(f"No model route for role '{role}'")
+    key = (role, prefer, avoid)
+    with _routed_lock:
+        if key not in _routed:
+            _routed[key] = RoutedChatModel(role, prefer=prefer, avoid=avoid)
+        return _routed[key]
@@ -0,0 +1,108 @@
+import os
+import re
+import sys
+import json
+import threading
+from collections import Counter
+
+__all__ = ['Sanitizer', 'DEFAULT_REPLACEMENTS', 'get_sanitizer', 'sanitize_content', 'sanitize_with_report']
+
+# Words that might trigger false positives in technical/EV content.
+# Azure's content filter can be overly sensitive with certain words even in technical context.
+DEFAULT_REPLACEMENTS = {
+    # Common false positives in technical/business content
+    "sex": "six",  # Common typo/autocorrect
+    "sexy": "attractive",
+    "penetration": "market entry",
+    "penetrate": "enter",
+    "penetrating": "entering",
+    "mating": "connecting",
+    "mate": "connect",
+    "intercourse": "interaction",
+    "erotic": "appealing",
+    "seduction": "attraction",
+    "seduce": "attract",
+    "intimate": "close",
+    "intimacy": "closeness",
+    # Words that might appear in URLs or technical terms
+    "xxx": "multiple",
+    "adult": "mature",
+}
+
+# Extra or overriding words: inline JSON or a path to a JSON file, e.g.
+# SANITIZE_WORDS='{"explosive": "rapid", "adult": null}' (null removes a default)
+SANITIZE_WORDS = os.getenv("SANITIZE_WORDS", "")
+
+def _load_replacements():
+    replacements = dict(DEFAULT_REPLACEMENTS)
+    if not SANITIZE_WORDS:
+        return replacements
+    try:
+        if SANITIZE_WORDS.lstrip().startswith("{"):
+            extra = json.loads(SANITIZE_WORDS)
+        else:
+            with open(SANITIZE_WORDS, encoding="utf-8") as f:
+                extra = json.load(f)
+        for word, replacement in extra.items():
+            if replacement is None:
+                replacements.pop(word.lower(), None)
+            else:
+                replacements[word.lower()] = str(replacement)
+    except Exception as e:
+        print(f"[SANITIZE WARNING] Ignoring invalid SANITIZE_WORDS: {e}", file=sys.stderr)
+    return replacements
+
+class Sanitizer:
+    """
+    Replaces whole words (case-insensitive) in one pass: the words are compiled
+    once into a single alternation and each match is looked up in the
+    replacement map, which also tallies what was replaced.
+    """
+
+    def __init__(self, replacements: dict):
+        self.replacements = {word.lower(): replacement for word, replacement in replacements.items()}
+        # Longest first so a word is never shadowed by one of its prefixes
+        words = sorted(self.replacements, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE) if words else None
+
+    def sanitize(self, text: str):
+        """Returns (sanitized text, Counter of the matched words as written)."""
+        found = Counter()
+        if not text or self.pattern is None:
+            return text, found
+
+        def replace(match):
+            word = match.group(0)
+            found[word] += 1
+            return self.replacements[word.lower()]
+
+        return self.pattern.sub(replace, text), found
+
+    def find(self, text: str) -> set:
+        """The (lowercase) words of the list that occur in text."""
+        if not text or self.pattern is None:
+            return set()
+        return {match.lower() for match in self.pattern.findall(text)}
+
+_sanitizer = None
+_sanitizer_lock = threading.Lock()
+
+def get_sanitizer() -> Sanitizer:
+    """Returns the process-wide sanitizer (word list loaded once)."""
+    global _sanitizer
+    if _sanitizer is None:
+        with _sanitizer_lock:
+            if _sanitizer is None:
+                _sanitizer = Sanitizer(_load_replacements())
+    return _sanitizer
+
+def sanitize_with_report(text: str):
+    """Sanitizes text and returns (text, Counter of replaced words)."""
+    return get_sanitizer().sanitize(text)
+
+def sanitize_content(text: str) -> str:
+    """Remove potentially flagged words that might trigger Azure content filters."""
+    sanitized, found = sanitize_with_report(text)
+    if found:
+        print(f"[SANITIZE] Replaced potentially flagged words: {set(found)}", file=sys.stderr)
+    return sanitized
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+__all__ = ['Scraper', 'get_scraper', 'extract_paragraphs']
+
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "8"))
+SCRAPE_PER_HOST_LIMIT = int(os.getenv("SCRAPE_PER_HOST_LIMIT", "2"))
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "8"))
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+USER_AGENT = "Mozilla/5.0 (compatible; EVReportBot/1.0)"
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    print("[SCRAPER WARNING] lxml not available, using html.parser", file=sys.stderr)
+    HTML_PARSER = "html.parser"
+
+def extract_paragraphs(html, max_paragraphs=10):
+    """Returns the first non-empty <p> texts of an HTML document."""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    paragraphs = []
+    for p in soup.find_all('p'):
+        text = p.get_text(" ", strip=True)
+        if text:
+            paragraphs.append(text)
+            if len(paragraphs) >= max_paragraphs:
+                break
+    return paragraphs
+
+class Scraper:
+    """
+    Concurrent page fetcher: one pooled requests.Session shared by a thread
+    pool, at most per_host_limit requests per host at a time, a total deadline
+    per request and a cap on how many bytes of each response are read.
+    """
+
+    def __init__(self, max_workers=SCRAPE_WORKERS, per_host_limit=SCRAPE_PER_HOST_LIMIT,
+                 timeout=SCRAPE_TIMEOUT, max_bytes=SCRAPE_MAX_BYTES, session=None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.per_host_limit = per_host_limit
+        self.session = session or self._build_session(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scraper")
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host_limit))
+        self._host_lock = threading.Lock()
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"User-Agent": USER_AGENT})
+        return session
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            return self._host_slots[host]
+
+    @staticmethod
+    def _chunks(response, size=64 * 1024):
+        # read1 returns whatever one socket read delivers, so a slow-drip server
+        # can't keep a read (and the deadline check) waiting for a full chunk
+        read1 = getattr(response.raw, "read1", None)
+        if read1 is None:
+            yield from response.iter_content(chunk_size=size)
+            return
+        while True:
+            chunk = read1(size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+
+    def fetch(self, url):
+        """
+        Downloads at most max_bytes of url and returns them (bytes). The
+        timeout bounds the whole download, not just each socket read.
+        Raises TimeoutError when it runs out.
+        """
+        with self._slot(url):
+            deadline = time.monotonic() + self.timeout
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                body = bytearray()
+                for chunk in self._chunks(response):
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"{url} took longer than {self.timeout:g}s")
+                    body.extend(chunk)
+                    if len(body) >= self.max_bytes:
+                        print(f"[SCRAPER] Truncated {url} at {self.max_bytes:,} bytes", file=sys.stderr)
+                        break
+                return bytes(body[:self.max_bytes])
+
+    def scrape(self, url, max_paragraphs=10):
+        """Returns the first paragraphs of url as text. Raises on network/HTTP errors."""
+        return "\n".join(extract_paragraphs(self.fetch(url), max_paragraphs))
+
+    def scrape_many(self, urls, max_paragraphs=10):
+        """
+        Scrapes urls concurrently. Returns {url: text} in input order; failed
+        pages are left out (and logged) so one bad site never sinks a chapter.
+        """
+        urls = list(dict.fromkeys(u for u in urls if u))  # de-duplicate, keep order
+        futures = {url: self._executor.submit(self.scrape, url, max_paragraphs) for url in urls}
+        pages = {}
+        for url, future in futures.items():
+            try:
+                pages[url] = future.result()
+            except Exception as e:
+                print(f"[SCRAPER] Skipping {url}: {e}", file=sys.stderr)
+        return pages
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+_scraper = None
+_scraper_lock = threading.Lock()
+
+def get_scraper():
+    """Returns the process-wide scraper (shared connection pool)."""
+    global _scraper
+    with _scraper_lock:
+        if _scraper is None:
+            _scraper = Scraper()
+        return _scraper
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from modules.cache import DiskCache, hash_key, cache_path
+
+__all__ = ['SearchCache', 'normalize_query', 'get_search_cache']
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "6"))
+SEARCH_CACHE_MEMORY_MB = float(os.getenv("SEARCH_CACHE_MEMORY_MB", "16"))
+SEARCH_CACHE_MAX_MB = float(os.getenv("SEARCH_CACHE_MAX_MB", "64"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form used as the cache key: lowercase tokens without punctuation,
+    in their original order, so "EV Charging: facts, news" and
+    "ev charging facts news" share one entry. Word order is kept because it
+    carries meaning ("China exports to US" vs "US exports to China").
+    """
+    return " ".join(_TOKEN_RE.findall(query.lower()))
+
+class SearchCache:
+    """
+    Two-level cache for search results (JSON-serializable lists): an in-memory
+    LRU bounded by bytes in front of a DiskCache, plus in-flight de-duplication
+    so concurrent identical queries share a single backend request.
+    """
+
+    def __init__(self, disk: DiskCache = None, ttl_seconds: float = 6 * 3600, max_memory_bytes: int = 16 * 1024 * 1024):
+        self.disk = disk
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = OrderedDict()  # key -> (stored_at, size, results)
+        self._memory_bytes = 0
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "shared_inflight": 0}
+
+    def get_or_fetch(self, query: str, fetch, variant: str = ""):
+        """
+        Returns cached results for query, or calls fetch() once and caches its result.
+        variant distinguishes otherwise identical queries (e.g. a different max_results).
+        """
+        key = hash_key(normalize_query(query), variant)
+
+        with self._lock:
+            results = self._memory_get(key)
+            if results is not None:
+                self._stats["memory_hits"] += 1
+                return results
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["shared_inflight"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                leader = True
+
+        if not leader:
+            print(f"[SEARCH CACHE] Waiting on in-flight search: {query}", file=sys.stderr)
+            return future.result()
+
+        try:
+            results = self._disk_get(key)
+            if results is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+            else:
+                with self._lock:
+                    self._stats["misses"] += 1
+                results = fetch()
+                self._disk_set(key, results)
+
+            with self._lock:
+                self._memory_set(key, results)
+            future.set_result(results)
+            return results
+        except BaseException as e:
+            # Errors are shared with waiters but never cached
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _memory_get(self, key):
+        # Caller holds the lock
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, size, results = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._memory[key]
+            self._memory_bytes -= size
+            return None
+        self._memory.move_to_end(key)
+        return results
+
+    def _memory_set(self, key, results):
+        # Caller holds the lock
+        size = len(json.dumps(results))
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (time.time(), size, results)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _disk_get(self, key):
+        if self.disk is None:
+            return None
+        blob = self.disk.get(key)
+        return json.loads(blob.decode("utf-8")) if blob is not None else None
+
+    def _disk_set(self, key, results):
+        if self.disk is not None:
+            self.disk.set(key, json.dumps(results).encode("utf-8"))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"memory_entries": len(self._memory), "memory_bytes": self._memory_bytes})
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """Returns the process-wide search cache, or None when disabled."""
+    global _search_cache
+    if not SEARCH_CACHE_ENABLED:
+        return None
+    with _search_cache_lock:
+        if _search_cache is None:
+            ttl_seconds = SEARCH_CACHE_TTL_HOURS * 3600
+            disk = DiskCache(
+                cache_path("search_results.sqlite3"),
+                ttl_seconds=ttl_seconds,
+                max_bytes=int(SEARCH_CACHE_MAX_MB * 1024 * 1024),
+                name="search_results",
+            )
+            _search_cache = SearchCache(disk, ttl_seconds=ttl_seconds,
+                                        max_memory_bytes=int(SEARCH_CACHE_MEMORY_MB * 1024 * 1024))
+            print(f"[SEARCH CACHE] Enabled (TTL {SEARCH_CACHE_TTL_HOURS:g}h)", file=sys.stderr)
+        return _search_cache
@@ -1,6 +1,12 @@
-from typing import List, TypedDict
+import operator
+from typing import Annotated, Dict, List, Optional, TypedDict
 
-__all__ = ['AgentState']
+__all__ = ['AgentState', 'ChapterRecord']
+
+class ChapterRecord(TypedDict):
+    index: int  # Position of the chapter in the outline
+    title: str
+    content: str  # Reviewed Markdown section, including its "## title" heading
 
 class AgentState(TypedDict):
     topic: str
@@ -9,5 +15,12 @@ class AgentState(TypedDict):
     current_chapter_index: int
     current_chapter_content: str
     research_notes: str
+    research_by_chapter: Dict[int, str]  # Prefetched search notes, keyed by chapter index
     reviews: str
-    final_document: str
\ No newline at end of file
+    final_document: str
+    chapter_sections: Annotated[List[ChapterRecord], operator.add]  # Parallel mode: completed chapters, any order
+    pending_chapters: Optional[List[int]]  # Incremental runs: outline indexes still to generate (None = all)
+    no_reuse_chapters: Optional[List[int]]  # Outline indexes never taken from the chapter store
+    chapter_reuse: Optional[dict]  # Stored chapter matched for the current chapter (modules/chapter_store.py)
+    chapter_reuse_by_index: Dict[int, Optional[dict]]  # Prefetch's chapter store matches, keyed by chapter index
+    writer_model: Optional[str]  # Model type tried first for the writer (see modules/routing.py)
@@ -1,7 +1,20 @@
-import requests
 import os
 import sys
-from bs4 import BeautifulSoup
+import json
+import time
+import hashlib
+import threading
+from modules.search_cache import get_search_cache
+from modules.scraper import get_scraper
+from modules.ingest import extract_uploads
+from modules.cache import DiskCache, cache_path
+
+# How many of the top search hits research_tool also scrapes (0 disables scraping)
+RESEARCH_SCRAPE_PAGES = int(os.getenv("RESEARCH_SCRAPE_PAGES", "2"))
+# Characters kept from each scraped page
+RESEARCH_SCRAPE_CHARS = int(os.getenv("RESEARCH_SCRAPE_CHARS", "1500"))
+# Extracted upload text is cached by content hash (set to 0 to disable)
+UPLOAD_CACHE_MAX_MB = float(os.getenv("UPLOAD_CACHE_MAX_MB", "500"))
 
 try:
     import streamlit as st
@@ -18,12 +31,29 @@ except ImportError as e:
     print(f"[TOOLS WARNING] Could not initialize DuckDuckGo search: {e}", file=sys.stderr)
     print(f"[TOOLS WARNING] Web search functionality will be limited", file=sys.stderr)
 
-# Import PDF loader separately
-try:
-    from langchain_community.document_loaders import PyPDFLoader
-except ImportError:
-    print(f"[TOOLS WARNING] Could not import PyPDFLoader", file=sys.stderr)
-    PyPDFLoader = None
+def search_results(query: str, max_results: int = 5):
+    """
+    Returns raw DuckDuckGo results (list of dicts with title/body/href).
+    Served from the search cache when possible; concurrent identical
+    queries share one request.
+    """
+    # Force '2025' into query to ensure freshness
+    enhanced_query = f"{query} data December 2025"
+    
+    def fetch():
+        # Use DDGS directly
+        return list(search_tool.text(enhanced_query, max_results=max_results) or [])
+    
+    cache = get_search_cache()
+    if cache is None:
+        return fetch()
+    return cache.get_or_fetch(enhanced_query, fetch, variant=f"max_results={max_results}")
+
+def _format_results(results):
+    formatted_results = []
+    for r in results:
+        formatted_results.append(f"{r.get('title', '')}\n{r.get('body', '')}\n{r.get('href', '')}\n")
+    return "\n".join(formatted_results) if formatted_results else "No results found"
 
 def web_search_tool(query: str):
     """
@@ -34,21 +64,38 @@ def web_search_tool(query: str):
             print(f"[TOOLS] Search tool not available, returning empty results", file=sys.stderr)
             return "Web search is currently unavailable. Please ensure 'duckduckgo-search' package is installed."
         
-        # Force '2025' into query to ensure freshness
-        enhanced_query = f"{query} data December 2025"
+        return _format_results(search_results(query))
         
-        # Use DDGS directly
-        results = search_tool.text(enhanced_query, max_results=5)
+    except Exception as e:
+        print(f"[TOOLS ERROR] web_search_tool failed: {e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        return f"Search error: {str(e)}"
+
+def research_tool(query: str, scrape_pages: int = None):
+    """
+    Web search plus excerpts from the top result pages, fetched concurrently.
+    """
+    if scrape_pages is None:
+        scrape_pages = RESEARCH_SCRAPE_PAGES
+    try:
+        if search_tool is None:
+            return web_search_tool(query)
         
-        # Format results
-        formatted_results = []
-        for r in results:
-            formatted_results.append(f"{r.get('title', '')}\n{r.get('body', '')}\n{r.get('href', '')}\n")
+        results = search_results(query)
+        notes = _format_results(results)
         
-        return "\n".join(formatted_results) if formatted_results else "No results found"
+        urls = [r.get('href') for r in results if r.get('href')][:scrape_pages]
+        if urls:
+            pages = get_scraper().scrape_many(urls)
+            excerpts = [f"Source: {url}\n{text[:RESEARCH_SCRAPE_CHARS]}" for url, text in pages.items() if text.strip()]
+            if excerpts:
+                notes += "\n\nPage excerpts:\n\n" + "\n\n".join(excerpts)
+            print(f"[TOOLS] Scraped {len(excerpts)}/{len(urls)} pages for: {query}", file=sys.stderr)
+        return notes
         
     except Exception as e:
-        print(f"[TOOLS ERROR] web_search_tool failed: {e}", file=sys.stderr)
+        print(f"[TOOLS ERROR] research_tool failed: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
         return f"Search error: {str(e)}"
@@ -58,50 +105,78 @@ def scrape_url(url: str):
     Simple scraper for specific news sites found in search.
     """
     try:
-        response = requests.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # Extract text from paragraphs
-        paragraphs = [p.get_text() for p in soup.find_all('p')]
-        return "\n".join(paragraphs[:10]) # Return first 10 paragraphs to save context
+        # Return first 10 paragraphs to save context
+        return get_scraper().scrape(url, max_paragraphs=10)
     except Exception as e:
         return f"Error scraping: {e}"
 
+_upload_cache = None
+_upload_cache_lock = threading.Lock()
+
+def get_upload_cache():
+    """Returns the on-disk cache of extracted upload text, or None when disabled."""
+    global _upload_cache
+    if UPLOAD_CACHE_MAX_MB <= 0:
+        return None
+    with _upload_cache_lock:
+        if _upload_cache is None:
+            # Keys are content hashes, so entries never go stale - only size-bounded
+            _upload_cache = DiskCache(cache_path("upload_text.sqlite3"),
+                                      max_bytes=int(UPLOAD_CACHE_MAX_MB * 1024 * 1024),
+                                      name="upload_text")
+        return _upload_cache
+
+def extract_uploaded_files(uploaded_files):
+    """
+    Extracts text from Streamlit uploads (PDF pages in parallel worker processes).
+    Files seen before are served from a cache keyed by the SHA-256 of their bytes;
+    files that failed to extract are not cached, so a re-upload tries again.
+    Returns one record per file: {"name", "pages", "seconds", "cpu_seconds", "cached"}
+    (plus "error" for failed files).
+    """
+    if not uploaded_files:
+        return []
+    # Read the uploads in memory - no temp files, no name clashes between users
+    files = [(file.name, file.getvalue(), getattr(file, "type", None)) for file in uploaded_files]
+    
+    cache = get_upload_cache()
+    if cache is None:
+        return [dict(record, cached=False) for record in extract_uploads(files)]
+    
+    records = [None] * len(files)
+    digests = [hashlib.sha256(data).hexdigest() for _, data, _ in files]
+    misses = []
+    for i, (name, _, _) in enumerate(files):
+        started = time.perf_counter()
+        blob = cache.get(digests[i])
+        if blob is not None:
+            records[i] = {"name": name, "pages": json.loads(blob.decode("utf-8"))["pages"],
+                          "seconds": time.perf_counter() - started, "cpu_seconds": 0.0, "cached": True}
+        else:
+            misses.append(i)
+    
+    if misses:
+        for i, record in zip(misses, extract_uploads([files[i] for i in misses])):
+            records[i] = dict(record, cached=False)
+            if "error" not in record:
+                cache.set(digests[i], json.dumps({"pages": record["pages"]}).encode("utf-8"))
+    
+    stats = cache.stats()
+    print(f"[TOOLS] Upload cache: {len(files) - len(misses)}/{len(files)} files cached this upload; "
+          f"{stats['hits']} hits / {stats['misses']} misses total, {stats['entries']} entries "
+          f"({stats['bytes'] / 1024 / 1024:.1f} MB)", file=sys.stderr)
+    return records
+
+def join_extracted_pages(records):
+    """Joins extracted pages into one context string (single join, document order)."""
+    return "".join(page + "\n" for record in records for page in record["pages"])
+
 def process_uploaded_files(uploaded_files):
     """
-    Reads PDFs uploaded via Streamlit.
+    Reads PDFs and text files uploaded via Streamlit.
     """
     try:
-        text_content = ""
-        if not uploaded_files:
-            return text_content
-        
-        if PyPDFLoader is None:
-            print("[TOOLS ERROR] PyPDFLoader not available", file=sys.stderr)
-            return "PDF loading not available"
-            
-        for file in uploaded_files:
-            try:
-                if file.type == "application/pdf":
-                    # Save temp to read
-                    temp_path = f"temp_{file.name}"
-                    with open(temp_path, "wb") as f:
-                        f.write(file.getbuffer())
-                    
-                    loader = PyPDFLoader(temp_path)
-                    pages = loader.load()
-                    for page in pages:
-                        text_content += page.page_content + "\n"
-                    
-                    # Clean up temp file
-                    try:
-                        os.remove(temp_path)
-                    except:
-                        pass
-                        
-            except Exception as e:
-                print(f"[TOOLS] Error processing file {file.name}: {e}", file=sys.stderr)
-                
-        return text_content
+        return join_extracted_pages(extract_uploaded_files(uploaded_files))
         
     except Exception as e:
         print(f"[TOOLS ERROR] process_uploaded_files failed: {e}", file=sys.stderr)
@@ -0,0 +1,97 @@
+"""
+Scraper limits against a local HTTP server: byte cap, total deadline on a
+slow-drip response and the per-host concurrency limit.
+
+    python -m pytest -q test_scraper.py
+"""
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from modules.scraper import Scraper
+
+class _Handler(BaseHTTPRequestHandler):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/big":
+            body = b"<p>" + b"x" * (1024 * 1024) + b"</p>"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/drip":
+            # One byte every 0.1s for ~5s: every read is well inside the socket timeout
+            self.send_response(200)
+            self.send_header("Content-Length", "50")
+            self.end_headers()
+            try:
+                for _ in range(50):
+                    self.wfile.write(b"x")
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                pass
+        else:
+            cls = type(self)
+            with cls.lock:
+                cls.active += 1
+                cls.peak = max(cls.peak, cls.active)
+            time.sleep(0.2)
+            with cls.lock:
+                cls.active -= 1
+            body = f"<p>page {self.path}</p>".encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+class ScraperTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_byte_cap(self):
+        scraper = Scraper(max_workers=2, timeout=5, max_bytes=64 * 1024)
+        try:
+            self.assertEqual(len(scraper.fetch(self.base + "/big")), 64 * 1024)
+        finally:
+            scraper.close()
+
+    def test_total_deadline(self):
+        scraper = Scraper(max_workers=2, timeout=0.5)
+        try:
+            started = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                scraper.fetch(self.base + "/drip")
+            self.assertLess(time.monotonic() - started, 1.5)
+        finally:
+            scraper.close()
+
+    def test_per_host_limit(self):
+        _Handler.peak = 0
+        scraper = Scraper(max_workers=8, per_host_limit=2, timeout=5)
+        try:
+            pages = scraper.scrape_many([f"{self.base}/page{i}" for i in range(6)])
+            self.assertEqual(len(pages), 6)
+            self.assertEqual(pages[f"{self.base}/page3"], "page /page3")
+            self.assertLessEqual(_Handler.peak, 2)
+        finally:
+            scraper.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import sys
 import os
+from contextlib import aclosing
 
 # Load environment variables BEFORE importing modules that need them
 # This will be handled by main.py for both local and Streamlit Cloud
@@ -11,13 +12,29 @@ except:
 
 print(f"[WORKFLOW] Environment loaded. AZURE_OPENAI_KEY present: {bool(os.getenv('AZURE_OPENAI_KEY'))}", file=sys.stderr)
 
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 from modules.state import AgentState
-from modules.agents import planner_agent, researcher_agent, writer_agent, reviewer_agent
+from modules.aio import iterate_sync, run_sync
+from modules.checkpoints import get_async_checkpointer, record_run, update_run_status
+from modules.agents import planner_agent, prefetch_research, researcher_agent, writer_agent, reviewer_agent
+from modules.agents import aplanner_agent, aprefetch_research, aresearcher_agent, awriter_agent, areviewer_agent
+from modules.agents import pending_chapter_indexes
 
 print("[WORKFLOW] Initializing workflow graph...", file=sys.stderr)
 
-__all__ = ['app_graph', 'workflow', 'should_continue']
+__all__ = [
+    'app_graph', 'workflow', 'should_continue',
+    'parallel_app_graph', 'parallel_workflow', 'fan_out_chapters', 'route_start',
+    'chapter_pipeline', 'assemble_chapters', 'CHAPTER_CONCURRENCY',
+    'async_app_graph', 'async_parallel_app_graph', 'achapter_pipeline',
+    'astream_report', 'arun_report', 'stream_report',
+    'get_checkpointed_graph', 'aget_report_state', 'get_report_state',
+]
+
+# Default number of chapters processed at once in parallel mode.
+# Passed to LangGraph as the "max_concurrency" config value.
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY", "4"))
 
 def should_continue(state):
     current = state["current_chapter_index"]
@@ -31,32 +48,217 @@ def should_continue(state):
     print(f"[WORKFLOW] Continuing to next chapter: {state['outline'][current]}", file=sys.stderr)
     return "research"
 
-try:
-    workflow = StateGraph(AgentState)
+def route_start(state):
+    """Parallel mode entry: an incremental run arrives with its outline already set
+    (see modules/incremental.py) and skips the planner."""
+    if state.get("outline") and state.get("pending_chapters") is not None:
+        print(f"[WORKFLOW] Incremental run: {len(state['pending_chapters'])}/{len(state['outline'])} chapters to generate", file=sys.stderr)
+        return "prefetch"
+    return "planner"
+
+def fan_out_chapters(state):
+    """Dispatches one 'chapter' task per outline entry still to generate (parallel mode)."""
+    indexes = pending_chapter_indexes(state)
+    if not indexes:
+        print("[WORKFLOW] No chapters to generate, nothing to fan out", file=sys.stderr)
+        return "assemble"
+    
+    print(f"[WORKFLOW] Fanning out {len(indexes)} chapters in parallel", file=sys.stderr)
+    return [
+        Send("chapter", {**state, "current_chapter_index": idx, "chapter_sections": []})
+        for idx in indexes
+    ]
+
+def _chapter_record(chapter_state):
+    idx = chapter_state["current_chapter_index"] - 1  # the reviewer has already advanced the index
+    title = chapter_state["outline"][idx]
+    print(f"[WORKFLOW] Chapter pipeline finished: {idx + 1}/{len(chapter_state['outline'])} {title}", file=sys.stderr)
+    return {"chapter_sections": [{"index": idx, "title": title, "content": chapter_state["final_document"]}]}
+
+def chapter_pipeline(state):
+    """Runs research → write → review for a single chapter and returns its section."""
+    idx = state["current_chapter_index"]
+    print(f"[WORKFLOW] Chapter pipeline started: {idx + 1}/{len(state['outline'])} {state['outline'][idx]}", file=sys.stderr)
+    
+    # Each chapter works on its own copy of the state, so the reviewer's
+    # "final_document" output is exactly this chapter's section.
+    chapter_state = {**state, "final_document": ""}
+    chapter_state.update(researcher_agent(chapter_state))
+    chapter_state.update(writer_agent(chapter_state))
+    chapter_state.update(reviewer_agent(chapter_state))
+    return _chapter_record(chapter_state)
+
+async def achapter_pipeline(state):
+    """Async variant of chapter_pipeline."""
+    idx = state["current_chapter_index"]
+    print(f"[WORKFLOW] Chapter pipeline started: {idx + 1}/{len(state['outline'])} {state['outline'][idx]}", file=sys.stderr)
+    
+    chapter_state = {**state, "final_document": ""}
+    chapter_state.update(await aresearcher_agent(chapter_state))
+    chapter_state.update(await awriter_agent(chapter_state))
+    chapter_state.update(await areviewer_agent(chapter_state))
+    return _chapter_record(chapter_state)
+
+def assemble_chapters(state):
+    """Merges the parallel chapter sections back into outline order."""
+    sections = sorted(state.get("chapter_sections", []), key=lambda section: section["index"])
+    final_document = "".join(section["content"] for section in sections)
+    print(f"[WORKFLOW] Assembled {len(sections)} chapters, {len(final_document)} chars", file=sys.stderr)
+    return {"final_document": final_document, "current_chapter_index": len(state["outline"])}
+
+def build_workflow(planner, prefetch, researcher, writer, reviewer):
+    """Serial mode: planner → prefetch → research → write → review, looping per chapter."""
+    graph = StateGraph(AgentState)
 
     # Add Nodes
-    workflow.add_node("planner", planner_agent)
-    workflow.add_node("research", researcher_agent)
-    workflow.add_node("write", writer_agent)
-    workflow.add_node("review", reviewer_agent)
+    graph.add_node("planner", planner)
+    graph.add_node("prefetch", prefetch)
+    graph.add_node("research", researcher)
+    graph.add_node("write", writer)
+    graph.add_node("review", reviewer)
 
     # Add Edges
-    workflow.set_entry_point("planner")
-    workflow.add_edge("planner", "research")
-    workflow.add_edge("research", "write")
-    workflow.add_edge("write", "review")
+    graph.set_entry_point("planner")
+    graph.add_edge("planner", "prefetch")
+    graph.add_edge("prefetch", "research")
+    graph.add_edge("research", "write")
+    graph.add_edge("write", "review")
 
     # Conditional Edge: If chapters remain, go back to research, else End
-    workflow.add_conditional_edges("review", should_continue, {
+    graph.add_conditional_edges("review", should_continue, {
         "research": "research",
         END: END
     })
+    return graph
+
+def build_parallel_workflow(planner, prefetch, chapter):
+    """Parallel mode: planner → prefetch → N concurrent chapter pipelines → assemble.
+    Concurrency is bounded by config["max_concurrency"] at run time. Incremental
+    runs enter at prefetch and only fan out their pending chapters."""
+    graph = StateGraph(AgentState)
 
+    graph.add_node("planner", planner)
+    graph.add_node("prefetch", prefetch)
+    graph.add_node("chapter", chapter)
+    graph.add_node("assemble", assemble_chapters)
+
+    graph.add_conditional_edges(START, route_start, ["planner", "prefetch"])
+    graph.add_edge("planner", "prefetch")
+    graph.add_conditional_edges("prefetch", fan_out_chapters, ["chapter", "assemble"])
+    graph.add_edge("chapter", "assemble")
+    graph.add_edge("assemble", END)
+    return graph
+
+try:
+    workflow = build_workflow(planner_agent, prefetch_research, researcher_agent, writer_agent, reviewer_agent)
     app_graph = workflow.compile()
     print("[WORKFLOW] ✓ Workflow graph compiled successfully", file=sys.stderr)
+
+    parallel_workflow = build_parallel_workflow(planner_agent, prefetch_research, chapter_pipeline)
+    parallel_app_graph = parallel_workflow.compile()
+    print("[WORKFLOW] ✓ Parallel workflow graph compiled successfully", file=sys.stderr)
+
+    # Async graphs: same topology, non-blocking agents (use astream/ainvoke)
+    async_workflow = build_workflow(aplanner_agent, aprefetch_research, aresearcher_agent, awriter_agent, areviewer_agent)
+    async_parallel_workflow = build_parallel_workflow(aplanner_agent, aprefetch_research, achapter_pipeline)
+    async_app_graph = async_workflow.compile()
+    async_parallel_app_graph = async_parallel_workflow.compile()
+    print("[WORKFLOW] ✓ Async workflow graphs compiled successfully", file=sys.stderr)
     
 except Exception as e:
     print(f"[WORKFLOW ERROR] Failed to compile graph: {e}", file=sys.stderr)
     import traceback
     traceback.print_exc(file=sys.stderr)
-    raise
\ No newline at end of file
+    raise
+
+_checkpointed_graphs = {}
+
+async def get_checkpointed_graph(parallel=False):
+    """Returns the async graph compiled with the SQLite checkpointer (compiled once per mode).
+    Every node's output is saved under the run's thread_id, so a failed run can
+    resume from its last completed step; in parallel mode each finished chapter
+    task is saved as it completes and is not re-run on resume."""
+    graph = _checkpointed_graphs.get(parallel)
+    if graph is None:
+        checkpointer = await get_async_checkpointer()
+        builder = async_parallel_workflow if parallel else async_workflow
+        graph = builder.compile(checkpointer=checkpointer)
+        _checkpointed_graphs[parallel] = graph
+    return graph
+
+def _run_config(config, run_id):
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "thread_id": run_id}
+    return config
+
+async def _astream_graph(graph, initial_state, config, stream_tokens, **kwargs):
+    # "messages" mode attaches a streaming callback, so the models stream their
+    # completions token by token even though the agents call ainvoke (which,
+    # unlike astream, still goes through the LLM response cache)
+    stream_mode = ["updates", "messages"] if stream_tokens else "updates"
+    # Close the graph stream explicitly when the caller stops early, so the
+    # checkpoint writes of steps that already finished are flushed first
+    async with aclosing(graph.astream(initial_state, config=config, stream_mode=stream_mode, **kwargs)) as stream:
+        async for item in stream:
+            yield item
+
+async def astream_report(initial_state, config=None, parallel=False, stream_tokens=False, run_id=None):
+    """Async entry point: yields graph updates ({node: update}) for one report.
+    Many reports can be driven concurrently from one event loop.
+    
+    With stream_tokens=True it yields (mode, payload) tuples instead:
+    ("updates", {node: update}) as above, or ("messages", (chunk, metadata))
+    for every LLM token, where metadata carries "agent", "chapter_index" and
+    "chapter_title". Node outputs (and so the final document) are unchanged.
+    
+    With a run_id the run is checkpointed (modules.checkpoints). Passing
+    initial_state=None with the run_id of an unfinished run resumes it from
+    its last checkpoint; parallel must match the original run."""
+    if run_id is None:
+        graph = async_parallel_app_graph if parallel else async_app_graph
+        async for item in _astream_graph(graph, initial_state, config, stream_tokens):
+            yield item
+        return
+    
+    graph = await get_checkpointed_graph(parallel)
+    config = _run_config(config, run_id)
+    if initial_state is None:
+        print(f"[WORKFLOW] Resuming run {run_id}", file=sys.stderr)
+        update_run_status(run_id, "running")
+    else:
+        record_run(run_id, initial_state.get("topic", ""), parallel)
+    try:
+        async for item in _astream_graph(graph, initial_state, config, stream_tokens, durability="sync"):
+            yield item
+    except BaseException as e:
+        # Includes GeneratorExit/CancelledError when the caller stops early;
+        # whatever was checkpointed so far is kept for a resume
+        update_run_status(run_id, "failed", f"{type(e).__name__}: {e}")
+        raise
+    update_run_status(run_id, "completed")
+
+async def arun_report(initial_state, config=None, parallel=False, run_id=None):
+    """Async entry point: runs one report and returns the final state."""
+    if run_id is None:
+        graph = async_parallel_app_graph if parallel else async_app_graph
+        return await graph.ainvoke(initial_state, config=config)
+    async for _ in astream_report(initial_state, config=config, parallel=parallel, run_id=run_id):
+        pass
+    return await aget_report_state(run_id, parallel=parallel)
+
+async def aget_report_state(run_id, parallel=False):
+    """Returns the last checkpointed state of a run (an empty dict if it has none)."""
+    graph = await get_checkpointed_graph(parallel)
+    snapshot = await graph.aget_state(_run_config(None, run_id))
+    return dict(snapshot.values or {})
+
+def get_report_state(run_id, parallel=False):
+    """Synchronous wrapper over aget_report_state."""
+    return run_sync(aget_report_state(run_id, parallel=parallel))
+
+def stream_report(initial_state, config=None, parallel=False, stream_tokens=False, run_id=None):
+    """Synchronous bridge over astream_report for callers without an event loop
+    (e.g. the Streamlit script thread). The run itself executes on the shared
+    event loop (modules.aio), so LLM calls still run concurrently there."""
+    return iterate_sync(astream_report(initial_state, config=config, parallel=parallel,
+                                       stream_tokens=stream_tokens, run_id=run_id))